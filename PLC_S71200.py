@@ -1,17 +1,8 @@
-from  pythonnet import load
-load()
-import clr
 from PyQt6.QtWidgets import QApplication, QMainWindow
 from PyQt6.QtCore import  QThread, pyqtSignal
 from  PyQt6.uic import loadUi
 import sys
-from  pathlib import  Path
-dll_path = Path(r"D:\Work\Course\C#\ALL PLC\Project")
-sys.path.append(str(dll_path))
-clr.AddReference("HslCommunication")
-from  HslCommunication.Profinet.Siemens import SiemensS7Net, SiemensPLCS
-from System import Array, UInt16, UInt32, Boolean, Byte, Int16
-import ast
+from s7_client import ISO_TCP_PORT, S7Client
 
 class Mainwindown(QMainWindow):
     def __init__(self):
@@ -29,15 +20,18 @@ class Mainwindown(QMainWindow):
     def connect_plc(self):
         ip = self.txt_Ip.toPlainText()
         port = self.txt_port.toPlainText()
-        self.plc = SiemensS7Net(SiemensPLCS.S1200,str(ip))
+        self.plc = S7Client(str(ip).strip(), int(port.strip() or ISO_TCP_PORT))
+        result = self.plc.ConnectServer()
+        if not result.IsSuccess:
+            print(result.Message)
+            return
         self.btn_connect.setStyleSheet("background-color: lightgreen; color: black;")
 
     def Write_Int(self):
         address = self.txt_Add_Wint.toPlainText()
         value = self.txt_Value_Wint.toPlainText()
         vl1  = self.str_to_uint16(value)
-        vl2  = Array[UInt16]([vl1])
-        self.plc.Write(str(address),vl2)
+        self.plc.Write(str(address),vl1)
         print(vl1)
 
     def Read_Int(self):
@@ -48,7 +42,7 @@ class Mainwindown(QMainWindow):
     def Write_bit(self):
         address = self.txt_Add_Wbit.toPlainText()
         value = self.cb_Value_Wbit.currentText()
-        vl1 = self.str_to_boolean_dotnet(value)
+        vl1 = self.str_to_boolean(value)
         print(address)
         print(vl1)
         self.plc.Write(address, vl1)
@@ -69,16 +63,19 @@ class Mainwindown(QMainWindow):
         self.txt_Value_RFloat.setText(str(round(value, 3)))
 
     @staticmethod
-    def str_to_boolean_dotnet(text: str) -> Boolean:
+    def str_to_boolean(text: str) -> bool:
         text = text.strip().lower()
-        return Boolean(text == "true")
+        return text == "true"
 
     @staticmethod
-    def str_to_uint16(input_str: str) -> UInt16:
+    def str_to_uint16(input_str: str) -> int:
         try:
-            return UInt16.Parse(input_str)
-        except Exception as e:
+            value = int(input_str.strip())
+        except ValueError as e:
             raise ValueError(f"Không thể chuyển '{input_str}' sang UInt16: {e}")
+        if not 0 <= value <= 0xFFFF:
+            raise ValueError(f"Không thể chuyển '{input_str}' sang UInt16: ngoài phạm vi")
+        return value
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -1,23 +1,119 @@
 import sys
 import os
 import logging
+import threading
+import time
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QFormLayout, QLineEdit, QPushButton, QLabel, QMessageBox, QTabWidget, QFileDialog
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QPixmap, QImage, QFont
 import cv2
-from ultralytics import YOLO
-# Load YOLO model
-model = YOLO("weights/best.pt")
+from pipeline import DetectionPipeline
+from auto_crop import AutoCropJob
+from camera_manager import CameraManager
+from crop_dataset import CropJob
+from dedup_index import DEFAULT_DISTANCE, DedupIndex
+from frame_ring import FrameRing, save_burst
+from frame_scheduler import FrameScheduler
+import metrics
+from overlay import OverlayRenderer
+from backends import load_backend
+from tiling import TiledPredictor
+from process_pool import ProcessPoolInference
+from motion_gate import MotionGate
+from plc_trigger import TriggeredInspection, connect_s7
+from replay import ReplayCamera, StubPLC
+from results_store import ResultsStore, detections_to_items
+from snapshot_writer import SnapshotBatch, SnapshotWriter, timestamped_name
+from tile_shards import ShardWriter
+from tracker import BoardInspector
+from inference_engine import parse_roi
+from model_loader import ModelLoader, warmup_backend
+
+# Inference backend: torch (default), onnx or openvino; model path defaults per backend
+INFERENCE_BACKEND = os.environ.get("PCB_BACKEND", "torch")
+MODEL_PATH = os.environ.get("PCB_MODEL_PATH") or None
+# Tiled inference for small defects: tile size in pixels (0 = single pass) and tile overlap
+TILE_SIZE = int(os.environ.get("PCB_TILE_SIZE", "0"))
+TILE_OVERLAP = float(os.environ.get("PCB_TILE_OVERLAP", "0.2"))
+# Motion gate: skip inference while the conveyor ROI ("x,y,w,h") is unchanged
+MOTION_GATE = os.environ.get("PCB_MOTION_GATE", "0") == "1"
+GATE_ROI = parse_roi(os.environ.get("PCB_GATE_ROI", ""))
+GATE_THRESHOLD = float(os.environ.get("PCB_GATE_THRESHOLD", "0.01"))
+# Tracking: one verdict per board; the model runs every DETECT_EVERY frames, the tracker fills the gaps
+TRACKING = os.environ.get("PCB_TRACKING", "1") == "1"
+DETECT_EVERY = int(os.environ.get("PCB_DETECT_EVERY", "1"))
+# Camera index (or video path) shared by the preview and detection tabs
+CAMERA_SOURCE = os.environ.get("PCB_CAMERA", "0")
+CAMERA_SOURCE = int(CAMERA_SOURCE) if CAMERA_SOURCE.isdigit() else CAMERA_SOURCE
+# Inference worker processes over a shared-memory frame ring (0 = infer in this process)
+INFERENCE_WORKERS = int(os.environ.get("PCB_WORKERS", "0"))
+# Display pacing: cap both video views at this FPS (0 = as fast as the measured stages allow)
+TARGET_FPS = float(os.environ.get("PCB_TARGET_FPS", "0"))
+# PLC trigger mode: infer one frame per rising edge (or counter change) and write the verdict code back
+TRIGGER_ADDRESS = os.environ.get("PCB_TRIGGER_ADDR", "M10.0")
+TRIGGER_MODE = os.environ.get("PCB_TRIGGER_MODE", "bit")
+VERDICT_ADDRESS = os.environ.get("PCB_VERDICT_ADDR") or None
+TRIGGER_POLL_MS = float(os.environ.get("PCB_TRIGGER_POLL_MS", "10"))
+TRIGGER_DEBOUNCE_MS = float(os.environ.get("PCB_TRIGGER_DEBOUNCE_MS", "20"))
+# Prometheus-text metrics on http://127.0.0.1:<port>/metrics (0 = off, instrumentation stays idle)
+METRICS_PORT = int(os.environ.get("PCB_METRICS_PORT", "0"))
+# Snapshot writer for captures and crops: format (jpg/png), JPEG quality, encoder threads, max queued images
+SNAPSHOT_FORMAT = os.environ.get("PCB_SNAPSHOT_FORMAT", "jpg")
+JPEG_QUALITY = int(os.environ.get("PCB_JPEG_QUALITY", "95"))
+WRITER_THREADS = int(os.environ.get("PCB_WRITER_THREADS", "2"))
+WRITER_QUEUE = int(os.environ.get("PCB_WRITER_QUEUE", "64"))
+# Crop and auto-crop tiles as loose image files ("files") or packed into <folder>.shards ("shards")
+TILE_OUTPUT = os.environ.get("PCB_TILE_OUTPUT", "files")
+# Continuous auto crop: frames sampled per second, and max dHash bits that still count as a duplicate tile
+# (empty = the dedup index's PCB_DEDUP_DISTANCE)
+AUTO_CROP_FPS = float(os.environ.get("PCB_AUTO_CROP_FPS", "2"))
+AUTO_CROP_DISTANCE = os.environ.get("PCB_AUTO_CROP_DISTANCE", "")
+# Model input size used for the warm-up frame
+IMGSZ = int(os.environ.get("PCB_IMGSZ", "640"))
+# Inspection results (verdicts and defects) for traceability; empty = off. NG trigger frames are saved under
+# RESULTS_SNAPSHOT_DIR. Both stay out of data/, which is the training input of Crop and auto-labelling
+RESULTS_DB = os.environ.get("PCB_RESULTS_DB", "inspections/inspections.sqlite")
+RESULTS_SNAPSHOT_DIR = os.environ.get("PCB_RESULTS_SNAPSHOT_DIR", "inspections/snapshots")
+# Replay PCB_CAMERA as a recording (1 = original timing, 0 = unthrottled) without dropping frames; empty = live camera
+REPLAY_SPEED = os.environ.get("PCB_REPLAY_SPEED", "")
+# Connect to an in-memory stub instead of the real PLC (replays, bench tests)
+PLC_STUB = os.environ.get("PCB_PLC_STUB", "0") == "1"
+# Perceptual-hash index of the stored captures and crops; near-duplicates are not saved. Empty = off
+DEDUP_INDEX = os.environ.get("PCB_DEDUP_INDEX", "data/dedup.sqlite")
+DEDUP_DISTANCE = int(os.environ.get("PCB_DEDUP_DISTANCE", str(DEFAULT_DISTANCE)))
+# Pre-trigger ring of the last RING_FRAMES camera frames; Save Burst (and every NG trigger verdict, if
+# BURST_ON_NG) writes the BURST_BEFORE frames up to that moment and the BURST_AFTER frames after it to BURST_DIR
+RING_FRAMES = int(os.environ.get("PCB_RING_FRAMES", "60"))
+BURST_BEFORE = int(os.environ.get("PCB_BURST_BEFORE", "15"))
+BURST_AFTER = int(os.environ.get("PCB_BURST_AFTER", "15"))
+BURST_DIR = os.environ.get("PCB_BURST_DIR", "bursts")
+BURST_ON_NG = os.environ.get("PCB_BURST_ON_NG", "1") == "1"
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+def create_backend():
+    """Load the configured model; runs on the ModelLoader thread, never at import"""
+    if INFERENCE_WORKERS:
+        # Worker processes load (and warm up) their own copy
+        return ProcessPoolInference(INFERENCE_BACKEND, MODEL_PATH, workers=INFERENCE_WORKERS, imgsz=IMGSZ).start()
+    backend = load_backend(INFERENCE_BACKEND, MODEL_PATH, imgsz=IMGSZ)
+    if TILE_SIZE:
+        backend = TiledPredictor(backend, TILE_SIZE, TILE_OVERLAP)
+    return backend
+
+
 class PLCWindow(QMainWindow):
+    model_status = pyqtSignal(str)
+    trigger_result = pyqtSignal(dict)
+    save_progress = pyqtSignal(str)
+    save_done = pyqtSignal(str, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("PLC Qt GUI")
@@ -36,6 +132,9 @@ class PLCWindow(QMainWindow):
             QPushButton:pressed { background-color: #1abc9c; }
         """)
 
+        # ---- Camera (one device shared by both tabs) ----
+        self.camera = ReplayCamera(float(REPLAY_SPEED)) if REPLAY_SPEED else CameraManager()
+
         # ---- Tabs ----
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
@@ -91,8 +190,12 @@ class PLCWindow(QMainWindow):
         self.capture_btn = QPushButton("📸 Capture Image")
         self.capture_btn.setFixedWidth(180)
         self.capture_btn.clicked.connect(self.capture_image)
+        self.burst_btn = QPushButton("🎞 Save Burst")
+        self.burst_btn.setFixedWidth(180)
+        self.burst_btn.clicked.connect(self.save_burst_clicked)
         button_row.addStretch()
         button_row.addWidget(self.capture_btn)
+        button_row.addWidget(self.burst_btn)
         button_row.addStretch()
 
         # Crop Section
@@ -146,6 +249,9 @@ class PLCWindow(QMainWindow):
         controls_layout.addLayout(crop_button_row)
         controls_layout.addLayout(auto_crop_button_row)
         controls_layout.addLayout(stop_auto_crop_button_row)
+        self.save_status_label = QLabel("")
+        self.save_status_label.setWordWrap(True)
+        controls_layout.addWidget(self.save_status_label)
         controls_layout.addStretch()
 
         # Add widgets to controls_layout
@@ -163,17 +269,40 @@ class PLCWindow(QMainWindow):
         )
         self.tab2_video_label.setMinimumSize(640, 480)
 
+        self.tab2_stats_label = QLabel("")
+        tab2_video_layout = QVBoxLayout()
+        tab2_video_layout.addWidget(self.tab2_video_label, 1)
+        tab2_video_layout.addWidget(self.tab2_stats_label)
+
         # ---------------- COMBINE ----------------
         tab2_main_layout.addLayout(controls_layout, 2)   # left panel (narrower)
-        tab2_main_layout.addWidget(self.tab2_video_label, 5)  # right video (wider)
+        tab2_main_layout.addLayout(tab2_video_layout, 5)  # right video (wider)
 
         self.tab2.setLayout(tab2_main_layout)
 
-        # ---- Detection Timer for tab2 ----
-        self.tab2_cap = cv2.VideoCapture(0)  # webcam
+        # ---- Snapshot writer (encodes and writes images off the GUI thread) ----
+        self.writer = SnapshotWriter(WRITER_THREADS, WRITER_QUEUE, SNAPSHOT_FORMAT, JPEG_QUALITY)
+        self.results = ResultsStore(RESULTS_DB) if RESULTS_DB else None
+        self.dedup = DedupIndex(DEDUP_INDEX, DEDUP_DISTANCE) if DEDUP_INDEX else None
+        # Room for the frames before the moment plus what arrives while they are handed to the writer
+        self.ring = FrameRing(max(RING_FRAMES, BURST_BEFORE + 8))
+        self.ring_sub = None
+        self.crop_job = None
+        self.auto_crop_shards = None  # ShardWriter for auto-crop tiles, opened on first use
+        self.auto_crop_job = None
+        self.save_progress.connect(self.save_status_label.setText)
+        self.save_done.connect(self.on_save_done)
+
+        # ---- Preview for tab2 (camera is only subscribed while the tab is visible) ----
+        self.tab2_sub = None
+        self.tab2_seq = 0
+        self.tab2_renderer = OverlayRenderer(self.tab2_video_label.width(), self.tab2_video_label.height())
+        self.tab2_scheduler = None
+        # Single-shot: the next poll is scheduled after each frame from its measured cost, never on a fixed beat
         self.tab2_timer = QTimer()
+        self.tab2_timer.setSingleShot(True)
         self.tab2_timer.timeout.connect(self.update_tab2_frame)
-        self.tab2_timer.start(30)
+        self.tabs.currentChanged.connect(self.on_tab_changed)
         # ========================================
         # ---- Main Tab 1 Layout ----
         main_layout = QHBoxLayout()
@@ -280,11 +409,14 @@ class PLCWindow(QMainWindow):
         self.btn_Rint.clicked.connect(self.read_int)
         self.btn_stop_connect = QPushButton("Disconnect PLC")
         self.btn_stop_connect.clicked.connect(self.stop_connect_plc)
+        self.btn_trigger = QPushButton("Start Trigger Mode")
+        self.btn_trigger.clicked.connect(self.toggle_trigger_mode)
 
         plc_button_row.addWidget(self.btn_connect)
         plc_button_row.addWidget(self.btn_Wint)
         plc_button_row.addWidget(self.btn_Rint)
         plc_button_row.addWidget(self.btn_stop_connect)
+        plc_button_row.addWidget(self.btn_trigger)
         left_layout.addLayout(plc_button_row)
         left_layout.addStretch()
 
@@ -333,6 +465,8 @@ class PLCWindow(QMainWindow):
         self.set_status_led(False)
         status_led_layout.addWidget(status_label_text)
         status_led_layout.addWidget(self.status_led)
+        self.model_status_label = QLabel("Model: loading…")
+        status_led_layout.addWidget(self.model_status_label)
         status_led_layout.addStretch()
         left_layout.addLayout(status_led_layout)
 
@@ -342,14 +476,37 @@ class PLCWindow(QMainWindow):
         self.video_label.setStyleSheet("background-color: #bdc3c7; border: 2px solid #7f8c8d; border-radius: 8px;")
         self.video_label.setMinimumSize(600, 400)
 
+        self.video_stats_label = QLabel("")
+        self.btn_metrics_overlay = QPushButton("Metrics Overlay")
+        self.btn_metrics_overlay.setCheckable(True)
+        self.btn_metrics_overlay.toggled.connect(self.toggle_metrics_overlay)
+        video_stats_row = QHBoxLayout()
+        video_stats_row.addWidget(self.video_stats_label, 1)
+        video_stats_row.addWidget(self.btn_metrics_overlay)
+        video_layout = QVBoxLayout()
+        video_layout.addWidget(self.video_label, 1)
+        video_layout.addLayout(video_stats_row)
+
         main_layout.addLayout(left_layout, 2)
-        main_layout.addWidget(self.video_label, 5)
+        main_layout.addLayout(video_layout, 5)
         self.tab1.setLayout(main_layout)
 
-        # ---- Detection Timer ----
-        self.cap = None
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
+        # ---- Detection Pipeline ----
+        self.pipeline = None
+        self.metrics_server = metrics.start_http_server(METRICS_PORT) if METRICS_PORT else None
+
+        # ---- PLC trigger mode ----
+        self.plc = None
+        self.trigger = None
+        self.trigger_renderer = OverlayRenderer()
+        self.trigger_result.connect(self.on_trigger_result)
+
+        # ---- Model (loaded and warmed up in the background) ----
+        self.model_status.connect(self.model_status_label.setText)
+        warmup = None if INFERENCE_WORKERS else (lambda backend: warmup_backend(backend, IMGSZ))
+        self.model_loader = ModelLoader(create_backend, warmup=warmup, name=f"{INFERENCE_BACKEND} model")
+        self.model_loader.add_ready_callback(self.on_model_loaded)
+        self.model_loader.start()
 
     ######### Functionality #########
     def save_plc_configuration(self):
@@ -367,30 +524,84 @@ class PLCWindow(QMainWindow):
 
     def start_detection(self):
         logger.info("Starting detection process...")
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
+        if self.pipeline and self.pipeline.is_running():
+            return
+        self.stop_trigger_mode()
+        try:
+            backend = self.model_loader.get(timeout=0)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not load the model: {e}")
+            return
+        if backend is None:
+            QMessageBox.information(self, "Model", "The model is still loading, try again in a moment.")
+            return
+        gate = MotionGate(roi=GATE_ROI, min_changed_fraction=GATE_THRESHOLD) if MOTION_GATE else None
+        inspector = BoardInspector(backend.names) if TRACKING else None
+        self.pipeline = DetectionPipeline(
+            backend, self.camera, source=CAMERA_SOURCE, gate=gate, inspector=inspector,
+            detect_every=DETECT_EVERY, scheduler=FrameScheduler(TARGET_FPS, name="detection"),
+            lossless=bool(REPLAY_SPEED),
+        )
+        self.pipeline.show_metrics = self.btn_metrics_overlay.isChecked()
+        self.pipeline.frame_ready.connect(self.update_frame)
+        self.pipeline.verdict.connect(self.on_board_verdict)
+        self.pipeline.error.connect(self.on_detection_error)
+        if not self.pipeline.start():
+            self.pipeline = None
             QMessageBox.critical(self, "Error", "Could not open webcam")
+
+    def on_model_loaded(self, backend, error):
+        """ModelLoader callback (loader thread): report the result to the status label"""
+        if error is not None:
+            self.model_status.emit(f"Model: failed ({error})")
             return
-        self.timer.start(30)
-
-    def update_frame(self):
-        if self.cap:
-            ret, frame = self.cap.read()
-            if ret:
-                results = model(frame, verbose=False)
-                annotated_frame = results[0].plot()
-                rgb_image = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = rgb_image.shape
-                bytes_per_line = ch * w
-                qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.video_label.setPixmap(QPixmap.fromImage(qt_image))
+        if self.results:
+            self.results.set_names(backend.names)
+        loader = self.model_loader
+        self.model_status.emit(f"Model: ready ({loader.load_seconds:.1f}s load, {loader.warmup_seconds or 0:.1f}s warm-up)")
+
+    def update_frame(self, qt_image, token):
+        """Show an annotated frame from the detection pipeline (runs on the GUI thread)"""
+        if not self.pipeline:
+            return
+        start = time.perf_counter()
+        self.video_label.setPixmap(QPixmap.fromImage(qt_image))
+        renderer = self.pipeline.renderer
+        renderer.release(token)
+        scheduler = self.pipeline.scheduler
+        scheduler.record("display", time.perf_counter() - start)
+        scheduler.frame_done()
+        self.show_stats(self.video_stats_label, scheduler)
+        rect = self.video_label.contentsRect()
+        size = (rect.width(), rect.height())
+        if renderer.target != size:
+            renderer.set_target_size(*size)
+
+    def toggle_metrics_overlay(self, checked):
+        """Draw FPS, inference ms and queue depth onto the detection video"""
+        if self.pipeline:
+            self.pipeline.show_metrics = checked
+
+    def show_stats(self, label, scheduler):
+        """Refresh an FPS / dropped-frames label at most twice a second"""
+        now = time.perf_counter()
+        if now - getattr(label, "updated", 0.0) >= 0.5:
+            label.updated = now
+            label.setText(scheduler.summary())
+
+    def on_board_verdict(self, verdict):
+        logger.info(f"Board {verdict['board_id']} verdict: {verdict['verdict']} {verdict['defects']}")
+        if self.results:
+            self.results.record_verdict(verdict, source=str(CAMERA_SOURCE))
+
+    def on_detection_error(self, message):
+        logger.warning(f"Detection pipeline: {message}")
 
     def stop_detection(self):
         logger.info("Stopping detection process...")
-        if self.cap:
-            self.cap.release()
-            self.cap = None
-        self.timer.stop()
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
         self.video_label.clear()
         self.video_label.setText("Video Stream")
         QMessageBox.information(self, "Stopped", "Detection process stopped.")
@@ -411,10 +622,84 @@ class PLCWindow(QMainWindow):
         self.set_status_led(False)
 
     def stop_connect_plc(self):
-        logger.info("Disconnecting from PLC (dummy action)")
-        QMessageBox.information(self, "PLC", "Disconnected from PLC (dummy action)")
+        logger.info("Disconnecting from PLC")
+        self.stop_trigger_mode()
+        if self.plc is not None:
+            self.plc.ConnectClose()
+            self.plc = None
+        QMessageBox.information(self, "PLC", "Disconnected from PLC")
         self.set_status_led(False)
 
+    def toggle_trigger_mode(self):
+        if self.trigger:
+            self.stop_trigger_mode()
+            return
+        if self.plc is None:
+            QMessageBox.warning(self, "PLC", "Connect to the PLC first")
+            return
+        try:
+            backend = self.model_loader.get(timeout=0)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not load the model: {e}")
+            return
+        if backend is None:
+            QMessageBox.information(self, "Model", "The model is still loading, try again in a moment.")
+            return
+        if self.pipeline:
+            # Trigger mode replaces free-running detection
+            self.pipeline.stop()
+            self.pipeline = None
+        self.trigger = TriggeredInspection(
+            self.plc, backend, self.camera, CAMERA_SOURCE, TRIGGER_ADDRESS, VERDICT_ADDRESS, TRIGGER_MODE,
+            poll_interval=TRIGGER_POLL_MS / 1000, debounce=TRIGGER_DEBOUNCE_MS / 1000,
+            on_result=self.trigger_result.emit,
+        )
+        if not self.trigger.start():
+            self.trigger = None
+            QMessageBox.critical(self, "Error", "Could not open webcam")
+            return
+        self.update_frame_ring()
+        self.btn_trigger.setText("Stop Trigger Mode")
+        self.video_label.setText(f"Waiting for PLC trigger on {TRIGGER_ADDRESS}...")
+
+    def stop_trigger_mode(self):
+        if self.trigger:
+            self.trigger.stop()
+            self.trigger = None
+            self.btn_trigger.setText("Start Trigger Mode")
+            self.update_frame_ring()
+
+    def on_trigger_result(self, result):
+        """Show the inspected frame and the trigger-to-verdict latency (GUI thread)"""
+        rect = self.video_label.contentsRect()
+        if self.trigger_renderer.target != (rect.width(), rect.height()):
+            self.trigger_renderer.set_target_size(rect.width(), rect.height())
+        line = f"Board {result['board']}: {result['verdict']} in {result['latency_ms']:.0f} ms"
+        names = self.trigger.backend.names if self.trigger else None
+        self.record_trigger_result(result)
+        if result["verdict"] == "NG" and BURST_ON_NG and self.ring_sub:
+            self.start_burst(f"board{result['board']}_NG", self.ring.seq_at(result["triggered_at"]))
+        qt_image, token = self.trigger_renderer.render(result["frame"], result["detections"], names, lines=[line])
+        if qt_image is not None:
+            self.video_label.setPixmap(QPixmap.fromImage(qt_image))
+            self.trigger_renderer.release(token)
+        if self.trigger:
+            total = self.trigger.latency_report()["total"]
+            self.video_stats_label.setText(
+                f"{line} | p50 {total['p50_ms']:.0f} ms p95 {total['p95_ms']:.0f} ms max {total['max_ms']:.0f} ms | missed {self.trigger.missed}"
+            )
+
+    def record_trigger_result(self, result):
+        """Store a trigger verdict; NG frames are saved so each defect can be traced to an image"""
+        if not self.results or not self.trigger:
+            return
+        snapshot = None
+        if result["verdict"] == "NG" and RESULTS_SNAPSHOT_DIR:
+            name = f"{time.strftime('%Y%m%d_%H%M%S')}_board{result['board']}"
+            snapshot = self.writer.submit(os.path.join(RESULTS_SNAPSHOT_DIR, name), result["frame"], copy=True)
+        items = detections_to_items(result["detections"], self.trigger.board_cls)
+        self.results.record(result["verdict"], items, result["board"], snapshot, source=f"trigger {TRIGGER_ADDRESS}")
+
     def reset_configuration(self):
         self.pcb_width.clear()
         self.conveyor_width.clear()
@@ -455,7 +740,14 @@ class PLCWindow(QMainWindow):
             QMessageBox.warning(self, "PLC", "Please enter a PLC IP address")
             return
         logger.info(f"Connecting to PLC at {ip}...")
-        QMessageBox.information(self, "PLC", f"Connected to PLC at {ip} (dummy connection)")
+        try:
+            self.plc = StubPLC() if PLC_STUB else connect_s7(ip)
+        except Exception as e:
+            self.set_status_led(False)
+            QMessageBox.critical(self, "PLC Error", str(e))
+            return
+        self.set_status_led(True)
+        QMessageBox.information(self, "PLC", f"Connected to PLC at {ip}")
 
     def btn_add(self):
         logger.info("Load Step button clicked (not implemented)")
@@ -469,12 +761,6 @@ class PLCWindow(QMainWindow):
         logger.info("Read Int clicked (not implemented)")
         QMessageBox.information(self, "PLC", "Read Int function not implemented")
 
-    def closeEvent(self, event):
-        if self.cap:
-            self.cap.release()
-        self.timer.stop()
-        super().closeEvent(event)
-
     def load_step(self):
         logger.info("Load Step button clicked (not implemented)")
         QMessageBox.information(self, "PLC", "Load Step function not implemented")
@@ -648,32 +934,137 @@ class PLCWindow(QMainWindow):
     #         self.cap.release()
     #         self.cap = None
 
+    def on_tab_changed(self, index):
+        """Subscribe the Tab 2 preview to the camera only while Tab 2 is shown"""
+        if self.tabs.widget(index) is self.tab2:
+            self.start_tab2_preview()
+        else:
+            self.stop_tab2_preview()
+
+    def start_tab2_preview(self):
+        if self.tab2_sub is None:
+            self.tab2_sub = self.camera.subscribe(CAMERA_SOURCE)
+            if self.tab2_sub is None:
+                self.tab2_video_label.setText("Cannot open webcam")
+                return
+            self.tab2_scheduler = FrameScheduler(TARGET_FPS, serial=True, name="preview")
+            self.tab2_seq = 0
+            self.update_frame_ring()
+        self.tab2_timer.start(0)
+
+    def stop_tab2_preview(self):
+        self.tab2_timer.stop()
+        if self.tab2_sub:
+            self.tab2_sub.close()
+            self.tab2_sub = None
+            self.update_frame_ring()
+
+    def update_frame_ring(self):
+        """Record every camera frame into the pre-trigger ring while the preview or trigger mode runs"""
+        active = bool(self.tab2_sub or self.trigger)
+        if active and self.ring_sub is None:
+            self.ring_sub = self.camera.subscribe(CAMERA_SOURCE, self.ring.push)
+        elif not active and self.ring_sub is not None:
+            self.ring_sub.close()
+            self.ring_sub = None
+
     def update_tab2_frame(self):
-        """Show live video on Tab 2"""
-        if self.tab2_cap:
-            ret, frame = self.tab2_cap.read()
-            if ret:
-                rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = rgb_image.shape
-                bytes_per_line = ch * w
-                qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.tab2_video_label.setPixmap(QPixmap.fromImage(qt_image))
-                self.last_frame = frame.copy()
+        """Show the newest camera frame on Tab 2, then schedule the next poll"""
+        if not self.tab2_sub:
+            return
+        scheduler = self.tab2_scheduler
+        seq, frame = self.tab2_sub.latest()
+        if frame is not None and seq != self.tab2_seq and scheduler.delay() == 0 and scheduler.admit():
+            if self.tab2_seq and seq > self.tab2_seq + 1:
+                scheduler.drop(seq - self.tab2_seq - 1)  # camera frames that were never shown
+            self.tab2_seq = seq
+            start = time.perf_counter()
+            rect = self.tab2_video_label.contentsRect()
+            size = (rect.width(), rect.height())
+            if self.tab2_renderer.target != size:
+                self.tab2_renderer.set_target_size(*size)
+            qt_image, token = self.tab2_renderer.render(frame)
+            scheduler.record("render", time.perf_counter() - start)
+            start = time.perf_counter()
+            self.tab2_video_label.setPixmap(QPixmap.fromImage(qt_image))
+            self.tab2_renderer.release(token)
+            scheduler.record("display", time.perf_counter() - start)
+            scheduler.frame_done()
+            self.show_stats(self.tab2_stats_label, scheduler)
+            # Read-only view of the shared camera buffer; the buffer is not reused while we hold it
+            self.last_frame = frame
+        # Wake up when the next frame is due; the 5 ms floor keeps an idle camera from spinning the GUI
+        self.tab2_timer.start(int(max(scheduler.delay(), 0.005) * 1000))
 
     def capture_image(self):
         """Capture current frame and save"""
         os.makedirs("data", exist_ok=True)
-        if not hasattr(self, "capture_counter"):
-            self.capture_counter = 0
-
         if hasattr(self, "last_frame"):
-            file_name = os.path.join("data", f"capture_{self.capture_counter}.jpg")
-            cv2.imwrite(file_name, self.last_frame)
-            QMessageBox.information(self, "Saved", f"Image saved to {file_name}")
-            self.capture_counter += 1
+            file_name = os.path.join("data", timestamped_name("capture") + ".jpg")
+            if self.dedup:
+                duplicate = self.dedup.check_and_add(file_name, self.last_frame)
+                if duplicate:
+                    self.save_status_label.setText(f"Capture skipped: same as {duplicate}")
+                    return
+            batch = self.snapshot_batch("Capture", notify=False)
+            # Copy: last_frame is a view of a shared camera buffer
+            saved = self.writer.submit(file_name, self.last_frame, batch=batch, copy=True)
+            batch.close()
+            if saved is None:
+                if self.dedup:
+                    self.dedup.remove([file_name])
+                self.save_status_label.setText("Writer busy: capture dropped")
+                return
         else:
             QMessageBox.warning(self, "Error", "No frame captured yet!")
 
+    def save_burst_clicked(self):
+        """Save the frames just before and after the button press"""
+        if self.ring_sub is None or not self.ring.seq:
+            QMessageBox.warning(self, "Error", "No frame captured yet!")
+            return
+        self.start_burst("manual", self.ring.seq)
+
+    def start_burst(self, reason, center):
+        """Write the burst around ring frame `center` from a worker thread (it waits for the frames after it)"""
+        directory = os.path.join(BURST_DIR, timestamped_name(f"burst_{reason}"))
+        batch = self.snapshot_batch(f"Burst {reason}", notify=reason == "manual")
+
+        def run():
+            try:
+                save_burst(self.ring, self.writer, directory, BURST_BEFORE, BURST_AFTER, center, batch)
+            except Exception:
+                logger.exception(f"Saving burst {directory} failed")
+            finally:
+                batch.close()
+
+        threading.Thread(target=run, name="burst", daemon=True).start()
+
+    def snapshot_batch(self, label, notify=True):
+        """SnapshotBatch whose progress goes to the status label (and a message box when notify is set)"""
+        def progress(batch):
+            self.save_progress.emit(f"{batch.label}: {batch.finished}/{batch.submitted} saved")
+
+        def done(batch):
+            paths = batch.paths
+            if len(paths) == 1:
+                message = f"{batch.label}: saved {paths[0]}"
+            else:
+                where = os.path.dirname(paths[0]) + "/" if paths else ""
+                message = f"{batch.label}: saved {batch.written} images to {where}"
+            if batch.failed or batch.rejected:
+                message += f" ({batch.failed} failed, {batch.rejected} dropped)"
+            if notify:
+                self.save_done.emit(batch.label, message)
+            else:
+                self.save_progress.emit(message)
+
+        return SnapshotBatch(label, on_progress=progress if notify else None, on_done=done)
+
+    def on_save_done(self, title, message):
+        self.save_status_label.setText(message)
+        QMessageBox.information(self, title, message)
+
     def crop_images(self):
         """Crop all images in data/ into smaller crops of user-defined size"""
         try:
@@ -683,88 +1074,96 @@ class PLCWindow(QMainWindow):
             QMessageBox.warning(self, "Invalid Input", "Width and Height must be integers.")
             return
 
+        if self.crop_job is not None:
+            QMessageBox.information(self, "Crop", "A crop job is already running.")
+            return
         input_dir = "data"
-        output_dir = "cropped"
-        os.makedirs(output_dir, exist_ok=True)
-
-        processed = 0
-        for file in os.listdir(input_dir):
-            if file.lower().endswith((".jpg", ".png", ".jpeg")):
-                img_path = os.path.join(input_dir, file)
-                img = cv2.imread(img_path)
-                if img is None:
-                    continue
-
-                h, w, _ = img.shape
-                for r in range(0, h, height):
-                    for c in range(0, w, width):
-                        crop = img[r:r+height, c:c+width]
-                        save_path = os.path.join(output_dir, f"crop_{processed}_{r}_{c}.jpg")
-                        cv2.imwrite(save_path, crop)
-                        processed += 1
-
-        QMessageBox.information(self, "Done", f"Cropped {processed} images into {output_dir}/")
+        shards = TILE_OUTPUT == "shards"
+        output_dir = "cropped.shards" if shards else "cropped"
+        os.makedirs(input_dir, exist_ok=True)
+
+        # Only new or changed captures are cropped, on a process pool fed from a worker thread
+        job = self.crop_job = CropJob(input_dir, output_dir, width, height, SNAPSHOT_FORMAT, JPEG_QUALITY,
+                                      shards=shards, dedup=self.dedup)
+
+        def run():
+            try:
+                stats = job.run(progress=lambda done, total: self.save_progress.emit(f"Crop: {done}/{total} images"))
+            except Exception as e:
+                logger.exception("Crop job failed")
+                self.save_done.emit("Crop", f"Crop failed: {e}")
+                return
+            finally:
+                self.crop_job = None
+            if not stats["cancelled"]:
+                self.save_done.emit("Crop", (
+                    f"Crop: {stats['tiles']} tiles from {stats['processed']} new or changed images in "
+                    f"{stats['seconds']:.1f}s ({stats['skipped']} unchanged, {stats['failed']} unreadable, "
+                    f"{stats['duplicates']} near-duplicate tiles skipped) -> {output_dir}/"
+                ))
+
+        threading.Thread(target=run, name="crop-images", daemon=True).start()
 
     def auto_crop_btn_clicked(self):
-        """Auto crop live webcam frame into N tiles"""
+        """Continuously tile live frames into auto_cropped/, skipping near-duplicate tiles, until Stop"""
         try:
             crop_w = int(self.crop_width_input.text())
             crop_h = int(self.crop_height_input.text())
         except ValueError:
             QMessageBox.warning(self, "Invalid Input", "Width and Height must be integers.")
             return
-
-        if not hasattr(self, "last_frame"):
-            QMessageBox.warning(self, "Error", "No webcam frame available yet.")
+        if self.auto_crop_job and self.auto_crop_job.is_running():
+            QMessageBox.information(self, "Auto Crop", "Auto crop is already running.")
             return
 
-        output_dir = "auto_cropped"
-        os.makedirs(output_dir, exist_ok=True)
-
-        frame = self.last_frame
-        h, w, _ = frame.shape
-        cols = w // crop_w
-        rows = h // crop_h
-        crop_count = 0
-
-        for r in range(rows):
-            for c in range(cols):
-                x = c * crop_w
-                y = r * crop_h
-                crop = frame[y:y+crop_h, x:x+crop_w]
-                save_path = os.path.join(output_dir, f"crop_{r}_{c}.jpg")
-                cv2.imwrite(save_path, crop)
-                crop_count += 1
-
-        QMessageBox.information(
-            self, "Auto Crop",
-            f"Saved {crop_count} crops ({rows}x{cols}) of size {crop_w}x{crop_h} into {output_dir}/"
+        # Shard tiles are named <folder>.shards/<name>, as the writer and the dedup index know them
+        output_dir = "auto_cropped.shards" if TILE_OUTPUT == "shards" else "auto_cropped"
+        writer = self.writer
+        if TILE_OUTPUT == "shards":
+            if self.auto_crop_shards is None:
+                self.auto_crop_shards = ShardWriter(output_dir, SNAPSHOT_FORMAT, JPEG_QUALITY)
+            writer = self.auto_crop_shards
+        self.auto_crop_job = AutoCropJob(
+            self.camera, CAMERA_SOURCE, writer, output_dir, crop_w, crop_h, AUTO_CROP_FPS,
+            int(AUTO_CROP_DISTANCE) if AUTO_CROP_DISTANCE else None,
+            on_progress=lambda job: self.save_progress.emit(f"Auto crop: {job.summary()}"), dedup=self.dedup,
         )
+        if not self.auto_crop_job.start():
+            self.auto_crop_job = None
+            QMessageBox.critical(self, "Error", "Could not open webcam")
 
     def stop_auto_crop_btn_clicked(self):
-        """Stop auto crop (if it was running in loop mode)"""
-        QMessageBox.information(self, "Auto Crop", "Stop button pressed (no loop active).")
-
-    ######### TAB1 (short detection demo) #########
-    def update_frame(self):
-        if self.cap:
-            ret, frame = self.cap.read()
-            if ret:
-                results = model(frame, verbose=False)
-                annotated_frame = results[0].plot()
-                rgb_image = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = rgb_image.shape
-                bytes_per_line = ch * w
-                qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.video_label.setPixmap(QPixmap.fromImage(qt_image))
+        """Stop the continuous auto crop"""
+        if not self.auto_crop_job:
+            QMessageBox.information(self, "Auto Crop", "Auto crop is not running.")
+            return
+        job, self.auto_crop_job = self.auto_crop_job, None
+        job.stop()
+        message = f"Auto crop stopped: {job.summary()}"
+        self.save_status_label.setText(message)
+        QMessageBox.information(self, "Auto Crop", message)
 
     def closeEvent(self, event):
-        if self.cap:
-            self.cap.release()
-        if self.tab2_cap:
-            self.tab2_cap.release()
-        self.timer.stop()
-        self.tab2_timer.stop()
+        self.stop_trigger_mode()
+        if self.pipeline:
+            self.pipeline.stop()
+        self.stop_tab2_preview()
+        if self.crop_job is not None:
+            self.crop_job.cancel()
+        if self.auto_crop_job:
+            self.auto_crop_job.stop()
+        self.camera.close()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+        self.writer.close()  # finish the queued images
+        if self.auto_crop_shards:
+            self.auto_crop_shards.close()
+        if self.results:
+            self.results.close()
+        if self.dedup:
+            self.dedup.close()
+        if self.model_loader.is_ready() and hasattr(self.model_loader.model, "close"):
+            self.model_loader.model.close()
         super().closeEvent(event)
 
 def main():
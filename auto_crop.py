@@ -0,0 +1,149 @@
+"""
+Continuous auto-crop: tile live camera frames into a training set, skipping repeats.
+
+Collecting a training set used to mean clicking Auto Crop hundreds of times,
+and a line that stands still produced the same tiles again and again.
+AutoCropJob subscribes to the shared camera, samples the newest frame at a
+fixed rate and cuts it into tiles. A tile is only kept if its difference hash
+(dHash, 64 bits from a 9x8 grey thumbnail) is more than `max_distance` bits
+away from the last tile kept at the same position. The hashes of all tiles
+come from one resize of the whole frame. With a DedupIndex, a tile is also
+skipped when any stored image is that close, and `max_distance` defaults to
+the index's own distance (otherwise to dedup_index.DEFAULT_DISTANCE). Kept tiles go to a SnapshotWriter
+(or ShardWriter), whose bounded queue slows the job down instead of piling up
+memory. stop() ends it cleanly.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from dedup_index import DEFAULT_DISTANCE, dhash_tiles, hamming
+
+logger = logging.getLogger(__name__)
+
+
+class AutoCropJob:
+    """Sample camera frames at `fps`, tile them and write the tiles that are not near-duplicates"""
+
+    def __init__(self, camera, source, writer, output_dir, tile_w, tile_h, fps=2.0, max_distance=None,
+                 on_progress=None, dedup=None):
+        self.camera = camera
+        self.source = source
+        self.writer = writer            # SnapshotWriter or ShardWriter
+        self.output_dir = output_dir
+        self.tile_w = tile_w
+        self.tile_h = tile_h
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        if max_distance is None:
+            max_distance = dedup.max_distance if dedup else DEFAULT_DISTANCE
+        self.max_distance = max_distance
+        self.on_progress = on_progress  # (job) after every sampled frame, on the job thread
+        self.dedup = dedup              # DedupIndex of the stored dataset, optional
+        self.frames = 0
+        self.kept = 0
+        self.duplicates = 0
+        self.failed = 0
+        self._last_hash = {}            # (row, col) -> hash of the last kept tile there
+        self._frame = (0, None)
+        self._frame_cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.subscription = None
+
+    def start(self):
+        """Subscribe to the camera and start sampling. Returns False if it cannot be opened."""
+        self.subscription = self.camera.subscribe(self.source, self._on_frame)
+        if self.subscription is None:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="auto-crop", daemon=True)
+        self._thread.start()
+        logger.info(f"Auto crop started: {self.tile_w}x{self.tile_h} tiles every {self.interval:.2f}s to {self.output_dir}")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        if self.subscription:
+            self.subscription.close()
+            self.subscription = None
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        logger.info(f"Auto crop stopped: {self.summary()}")
+
+    def is_running(self):
+        return self._thread is not None and not self._stop.is_set()
+
+    def summary(self):
+        return f"{self.frames} frames, {self.kept} tiles kept, {self.duplicates} near-duplicates skipped"
+
+    def _on_frame(self, seq, frame):
+        # Camera grab thread: only remember the newest frame
+        with self._frame_cond:
+            self._frame = (seq, frame)
+            self._frame_cond.notify_all()
+
+    def _next_frame(self, after_seq):
+        with self._frame_cond:
+            while self._frame[0] <= after_seq and not self._stop.is_set():
+                self._frame_cond.wait(0.5)
+            return self._frame
+
+    def _run(self):
+        seq = 0
+        next_due = time.perf_counter()
+        while not self._stop.is_set():
+            if self._stop.wait(max(0.0, next_due - time.perf_counter())):
+                break
+            next_due = max(next_due + self.interval, time.perf_counter())
+            seq, frame = self._next_frame(seq)
+            if frame is None or self._stop.is_set():
+                continue
+            try:
+                self._crop(frame)
+            except ValueError as e:
+                logger.error(f"Auto crop stopped: {e}")
+                self._stop.set()
+            except Exception:
+                logger.exception("Auto crop failed on a frame")
+            del frame
+            if self.on_progress:
+                self.on_progress(self)
+
+    def _crop(self, frame):
+        h, w = frame.shape[:2]
+        rows, cols = h // self.tile_h, w // self.tile_w
+        if not rows or not cols:
+            raise ValueError(f"Tile {self.tile_w}x{self.tile_h} is larger than the {w}x{h} frame")
+        self.frames += 1
+        hashes = dhash_tiles(frame, rows, cols, self.tile_w, self.tile_h)
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        for r in range(rows):
+            for c in range(cols):
+                tile_hash = hashes[r, c]
+                last = self._last_hash.get((r, c))
+                if last is not None and hamming(tile_hash, last) <= self.max_distance:
+                    self.duplicates += 1
+                    continue
+                y, x = r * self.tile_h, c * self.tile_w
+                # No frame seq: the hash already tells tiles apart, and the name must fit a shard
+                # index record (46 bytes; this is 43 up to row/column 99)
+                name = f"{stamp}_r{r}c{c}_{int(tile_hash):016x}.jpg"
+                path = os.path.join(self.output_dir, name)
+                if self.dedup and self.dedup.check_and_add(path, h=int(tile_hash)):
+                    self._last_hash[r, c] = tile_hash
+                    self.duplicates += 1
+                    continue
+                # copy: the tile is a view of a shared camera buffer; block: the writer's queue bounds memory
+                saved = self.writer.submit(path, frame[y:y + self.tile_h, x:x + self.tile_w], block=True, copy=True)
+                if saved is None:
+                    if self.dedup:
+                        self.dedup.remove([path])
+                    self.failed += 1
+                    continue
+                self._last_hash[r, c] = tile_hash
+                self.kept += 1
@@ -0,0 +1,214 @@
+"""
+Batch pre-labelling of captured datasets with the current model.
+
+Retraining weights/best.pt needs YOLO labels for the images collected with
+Capture, Crop and Auto Crop. LabelJob runs the model over a folder (data/,
+cropped/, auto_cropped/ ...) and writes one YOLO-format label file next to
+each image:
+
+    <image name>.txt     one "cls cx cy w h" line per detection, normalised to 0..1
+
+An image without detections gets an empty label file, which YOLO reads as a
+background image. Images that already have a label file are skipped, and each
+label file is written atomically, so an interrupted job simply picks up where
+it stopped and hand-corrected labels are never overwritten (unless
+--overwrite). The images are split into batches over a pool of worker
+processes, each with its own copy of the backend and a share of the cores.
+
+Usage:
+    python auto_label.py --input data
+    python auto_label.py --input cropped --backend onnx --weights weights/best.onnx --workers 4
+    python auto_label.py --input auto_cropped --conf 0.4 --overwrite
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from backends import BACKENDS, load_backend
+from crop_dataset import scan_images, write_atomic
+
+# Class names in id order, next to the labels, as labelImg and most YOLO tools expect
+CLASSES_FILE = "classes.txt"
+
+logger = logging.getLogger(__name__)
+
+_backend = None  # per worker process
+
+
+def label_path(image_path):
+    return os.path.splitext(image_path)[0] + ".txt"
+
+
+def yolo_lines(detections, width, height):
+    """YOLO label lines ("cls cx cy w h", normalised) for an (N, 6+) detection array"""
+    lines = []
+    for x1, y1, x2, y2, _, cls in detections[:, :6]:
+        x1, x2 = max(0.0, float(x1)), min(float(width), float(x2))
+        y1, y2 = max(0.0, float(y1)), min(float(height), float(y2))
+        if x2 <= x1 or y2 <= y1:
+            continue
+        lines.append(f"{int(cls)} {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} "
+                     f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}")
+    return lines
+
+
+def label_batch(backend, paths):
+    """Predict a batch of images and write their label files. Returns (labelled, boxes, failed paths)."""
+    images, readable, failed = [], [], []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            failed.append(path)
+        else:
+            images.append(img)
+            readable.append(path)
+    boxes = 0
+    if images:
+        for path, img, detections in zip(readable, images, backend.predict(images)):
+            lines = yolo_lines(detections, img.shape[1], img.shape[0])
+            write_atomic(label_path(path), "".join(line + "\n" for line in lines).encode())
+            boxes += len(lines)
+    return len(readable), boxes, failed
+
+
+def _init_worker(backend_name, model_path, backend_kwargs, threads):
+    global _backend
+    # Limit intra-op threads so the workers share the cores instead of oversubscribing them
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    cv2.setNumThreads(1)
+    if backend_name == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    elif backend_name == "onnx":
+        backend_kwargs = dict(backend_kwargs, threads=threads)
+    _backend = load_backend(backend_name, model_path, **backend_kwargs)
+
+
+def _label_in_worker(paths):
+    return label_batch(_backend, paths)
+
+
+def _worker_names():
+    return _backend.names
+
+
+class LabelJob:
+    """Write YOLO labels for every unlabelled image in input_dir"""
+
+    def __init__(self, input_dir, backend_name="torch", model_path=None, workers=None, batch_size=8,
+                 overwrite=False, **backend_kwargs):
+        if backend_name not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend_name}', expected one of {sorted(BACKENDS)}")
+        self.input_dir = input_dir
+        self.backend_name = backend_name
+        self.model_path = model_path
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.overwrite = overwrite
+        self.backend_kwargs = backend_kwargs
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop after the batches already being labelled; a re-run continues from there"""
+        self._cancel.set()
+
+    def pending(self):
+        """Image paths without a label file (all images with overwrite), and how many were scanned"""
+        todo, scanned = [], 0
+        for path, _ in scan_images(self.input_dir):
+            scanned += 1
+            if self.overwrite or not os.path.exists(label_path(path)):
+                todo.append(path)
+        return sorted(todo), scanned
+
+    def run(self, progress=None):
+        """Label everything pending; progress(done, total, images_per_second) follows each batch. Returns stats."""
+        start = time.perf_counter()
+        todo, scanned = self.pending()
+        stats = {"scanned": scanned, "labelled": 0, "skipped": scanned - len(todo), "failed": 0, "boxes": 0}
+        batches = [todo[i:i + self.batch_size] for i in range(0, len(todo), self.batch_size)]
+        workers = min(self.workers, len(batches))
+        threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+        init_args = (self.backend_name, self.model_path, self.backend_kwargs, threads)
+
+        def finish(result):
+            labelled, boxes, failed = result
+            stats["labelled"] += labelled
+            stats["boxes"] += boxes
+            stats["failed"] += len(failed)
+            for path in failed:
+                logger.warning(f"Skipping unreadable image {path}")
+            done = stats["labelled"] + stats["failed"]
+            if progress:
+                progress(done, len(todo), done / max(time.perf_counter() - ready[0], 1e-9))
+
+        names = None
+        ready = [start]  # when the model was loaded; images/s leaves out the start-up
+        if workers == 1:
+            _init_worker(*init_args)
+            names = _worker_names()
+            ready[0] = time.perf_counter()
+            for paths in batches:
+                if self._cancel.is_set():
+                    break
+                finish(_label_in_worker(paths))
+        elif workers > 1:
+            # spawn: the workers load their own model instead of inheriting the parent's threads
+            with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn"),
+                                     initializer=_init_worker, initargs=init_args) as pool:
+                names = pool.submit(_worker_names).result()
+                ready[0] = time.perf_counter()
+                futures = [pool.submit(_label_in_worker, paths) for paths in batches]
+                for future in as_completed(futures):
+                    finish(future.result())
+                    if self._cancel.is_set():
+                        for other in futures:
+                            other.cancel()
+                        break
+        if names and not os.path.exists(os.path.join(self.input_dir, CLASSES_FILE)):
+            write_atomic(os.path.join(self.input_dir, CLASSES_FILE),
+                         "".join(f"{names[i]}\n" for i in sorted(names)).encode())
+        stats["seconds"] = time.perf_counter() - start
+        stats["images_per_second"] = (stats["labelled"] + stats["failed"]) / max(time.perf_counter() - ready[0], 1e-9)
+        stats["cancelled"] = self._cancel.is_set()
+        logger.info(f"Label job {self.input_dir}: {stats}")
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write YOLO labels for unlabelled captures with the current model")
+    parser.add_argument("--input", default="data", help="image folder (subfolders are not searched)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=os.environ.get("PCB_BACKEND", "torch"))
+    parser.add_argument("--weights", default=os.environ.get("PCB_MODEL_PATH") or None)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=8, help="images per model call")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument("--overwrite", action="store_true", help="relabel images that already have a label file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    job = LabelJob(args.input, args.backend, args.weights, args.workers, args.batch, args.overwrite,
+                   imgsz=args.imgsz, conf=args.conf)
+    last = [0.0]
+
+    def progress(done, total, rate):
+        now = time.perf_counter()
+        if now - last[0] >= 2.0 or done == total:
+            last[0] = now
+            logger.info(f"{done}/{total} images, {rate:.1f} img/s")
+
+    stats = job.run(progress)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""
+Pluggable CPU inference backends for weights/best.pt.
+
+Every backend exposes the same interface:
+    backend.names                    -> {class_id: class_name}
+    backend.predict(list_of_bgr)     -> list of (N, 6) float32 arrays
+                                        (x1, y1, x2, y2, conf, cls) in frame pixels
+
+Backends:
+    torch     Ultralytics PyTorch (baseline)
+    onnx      ONNX Runtime, CPUExecutionProvider (FP32 or INT8 QDQ models)
+    openvino  OpenVINO runtime on CPU (reads .onnx or .xml directly)
+
+Usage:
+    python backends.py export   --weights weights/best.pt
+    python backends.py quantize --model weights/best.onnx --calib data/ --out weights/best_int8.onnx
+    python backends.py compare  --images cropped/ --candidates onnx:weights/best.onnx onnx:weights/best_int8.onnx
+"""
+
+import argparse
+import ast
+import json
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+WEIGHTS_PATH = "weights/best.pt"
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg", ".bmp")
+# Same limits as Ultralytics' non_max_suppression
+MAX_NMS_CANDIDATES = 30000
+MAX_DETECTIONS = 300
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ Shared helpers ------------------
+def detections_from_result(result):
+    """Convert an Ultralytics result into an (N, 6) float32 array of x1, y1, x2, y2, conf, cls"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    data = boxes.data
+    if hasattr(data, "cpu"):
+        data = data.cpu().numpy()
+    return np.asarray(data, dtype=np.float32)[:, :6]
+
+
+def box_iou(box, boxes):
+    """IoU of one x1y1x2y2 box against an (N, 4) array"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(detections, iou_thres=0.45, max_det=None):
+    """Class-aware greedy NMS over an (N, 6) detection array, highest confidence first; stops at max_det kept"""
+    if len(detections) == 0:
+        return detections
+    if iou_thres >= 1.0:  # nothing can be suppressed
+        return detections[detections[:, 4].argsort()[::-1]][:max_det]
+    # Offset boxes per class so boxes of different classes never overlap
+    offset = detections[:, 5:6] * (detections[:, :4].max() + 1)
+    boxes = detections[:, :4] + offset
+    order = detections[:, 4].argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1 or len(keep) == max_det:
+            break
+        ious = box_iou(boxes[i], boxes[order[1:]])
+        order = order[1:][ious <= iou_thres]
+    return detections[keep]
+
+
+def letterbox(img, size):
+    """Resize keeping aspect ratio and pad to size x size. Returns (image, ratio, (pad_x, pad_y))"""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = round(h * r), round(w * r)
+    out = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    out[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return out, r, (left, top)
+
+
+def list_images(path, limit=None):
+    files = sorted(
+        entry.path for entry in os.scandir(path)
+        if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return files[:limit] if limit else files
+
+
+# ------------------ Backends ------------------
+class TorchBackend:
+    """Ultralytics PyTorch baseline"""
+
+    name = "torch"
+
+    def __init__(self, weights=WEIGHTS_PATH, imgsz=640, conf=0.25, iou=0.45, max_det=MAX_DETECTIONS):
+        from ultralytics import YOLO
+        self.model = YOLO(weights)
+        self.names = dict(self.model.names)
+        self.imgsz, self.conf, self.iou, self.max_det = imgsz, conf, iou, max_det
+
+    def predict(self, images):
+        results = self.model(images, verbose=False, imgsz=self.imgsz, conf=self.conf, iou=self.iou,
+                             max_det=self.max_det)
+        return [detections_from_result(r) for r in results]
+
+
+class _ExportedBackend:
+    """Shared letterbox pre-processing and YOLOv8 head post-processing for exported models"""
+
+    def __init__(self, imgsz=640, conf=0.25, iou=0.45, names=None, max_det=MAX_DETECTIONS):
+        self.imgsz, self.conf, self.iou, self.max_det = imgsz, conf, iou, max_det
+        self.names = names or {}
+        self.max_batch = None  # None means dynamic batch
+
+    def predict(self, images):
+        if not images:
+            return []
+        step = self.max_batch or len(images)
+        detections = []
+        for i in range(0, len(images), step):
+            chunk = images[i:i + step]
+            blob, metas = self.preprocess(chunk)
+            output = self.forward(blob)
+            detections.extend(self.postprocess(output, metas))
+        return detections
+
+    def preprocess(self, images):
+        blob = np.empty((len(images), 3, self.imgsz, self.imgsz), dtype=np.float32)
+        metas = []
+        for i, img in enumerate(images):
+            padded, r, pad = letterbox(img, self.imgsz)
+            # BGR HWC uint8 -> RGB CHW float
+            np.multiply(padded[..., ::-1].transpose(2, 0, 1), 1 / 255.0, out=blob[i], casting="unsafe")
+            metas.append((r, pad, img.shape[:2]))
+        return blob, metas
+
+    def postprocess(self, output, metas):
+        detections = []
+        for pred, (r, (pad_x, pad_y), (h, w)) in zip(output, metas):
+            pred = pred.T  # (anchors, 4 + num_classes)
+            scores = pred[:, 4:]
+            cls = scores.argmax(1)
+            conf = scores[np.arange(len(scores)), cls]
+            mask = conf >= self.conf
+            if not mask.any():
+                detections.append(np.zeros((0, 6), dtype=np.float32))
+                continue
+            xywh, conf, cls = pred[mask, :4], conf[mask], cls[mask]
+            if len(conf) > MAX_NMS_CANDIDATES:
+                top = conf.argpartition(-MAX_NMS_CANDIDATES)[-MAX_NMS_CANDIDATES:]
+                xywh, conf, cls = xywh[top], conf[top], cls[top]
+            dets = np.empty((len(conf), 6), dtype=np.float32)
+            dets[:, 0] = (xywh[:, 0] - xywh[:, 2] / 2 - pad_x) / r
+            dets[:, 1] = (xywh[:, 1] - xywh[:, 3] / 2 - pad_y) / r
+            dets[:, 2] = (xywh[:, 0] + xywh[:, 2] / 2 - pad_x) / r
+            dets[:, 3] = (xywh[:, 1] + xywh[:, 3] / 2 - pad_y) / r
+            dets[:, [0, 2]] = dets[:, [0, 2]].clip(0, w)
+            dets[:, [1, 3]] = dets[:, [1, 3]].clip(0, h)
+            dets[:, 4] = conf
+            dets[:, 5] = cls
+            detections.append(nms(dets, self.iou, self.max_det))
+        return detections
+
+    def forward(self, blob):
+        raise NotImplementedError
+
+
+class OnnxBackend(_ExportedBackend):
+    """ONNX Runtime on CPU"""
+
+    name = "onnx"
+
+    def __init__(self, model_path, imgsz=640, conf=0.25, iou=0.45, threads=0, max_det=MAX_DETECTIONS):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads  # 0 = all physical cores
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        names = ast.literal_eval(metadata["names"]) if "names" in metadata else None
+        super().__init__(imgsz, conf, iou, names, max_det)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        if isinstance(model_input.shape[0], int):
+            self.max_batch = model_input.shape[0]
+
+    def forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(_ExportedBackend):
+    """OpenVINO runtime on CPU, tuned for throughput"""
+
+    name = "openvino"
+
+    def __init__(self, model_path, imgsz=640, conf=0.25, iou=0.45, max_det=MAX_DETECTIONS):
+        import openvino as ov
+        core = ov.Core()
+        model = core.read_model(model_path)
+        names = _onnx_names(model_path) if model_path.endswith(".onnx") else _yaml_names(model_path)
+        super().__init__(imgsz, conf, iou, names, max_det)
+        if not model.input(0).get_partial_shape()[0].is_dynamic:
+            self.max_batch = model.input(0).get_partial_shape()[0].get_length()
+        self.compiled = core.compile_model(model, "CPU", {"PERFORMANCE_HINT": "THROUGHPUT"})
+
+    def forward(self, blob):
+        return self.compiled(blob)[0]
+
+
+def _onnx_names(model_path):
+    try:
+        import onnx
+        meta = {p.key: p.value for p in onnx.load(model_path, load_external_data=False).metadata_props}
+        return ast.literal_eval(meta["names"]) if "names" in meta else None
+    except ImportError:
+        return None
+
+
+def _yaml_names(model_path):
+    """Ultralytics OpenVINO exports keep class names in metadata.yaml next to the .xml"""
+    meta_path = os.path.join(os.path.dirname(model_path), "metadata.yaml")
+    if not os.path.exists(meta_path):
+        return None
+    import yaml
+    with open(meta_path) as f:
+        return yaml.safe_load(f).get("names")
+
+
+BACKENDS = {"torch": TorchBackend, "onnx": OnnxBackend, "openvino": OpenVinoBackend}
+
+
+def resolve_model_path(name, model_path=None):
+    """Default model file for a backend: best.pt for torch, its .onnx export otherwise"""
+    if model_path is not None:
+        return model_path
+    return WEIGHTS_PATH if name == "torch" else os.path.splitext(WEIGHTS_PATH)[0] + ".onnx"
+
+
+def load_backend(name="torch", model_path=None, **kwargs):
+    """Create a backend by name; model_path defaults to the matching file next to best.pt"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of {sorted(BACKENDS)}")
+    model_path = resolve_model_path(name, model_path)
+    logger.info(f"Loading {name} backend from {model_path}")
+    return BACKENDS[name](model_path, **kwargs)
+
+
+# ------------------ Export / quantization ------------------
+def export_onnx(weights=WEIGHTS_PATH, imgsz=640, dynamic=True):
+    """Export best.pt to ONNX next to the weights file. Returns the .onnx path."""
+    from ultralytics import YOLO
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True)
+
+
+class _CalibrationReader:
+    """Feeds letterboxed calibration images to the ONNX Runtime quantizer"""
+
+    def __init__(self, input_name, files, imgsz):
+        self.input_name = input_name
+        self.files = iter(files)
+        self.prep = _ExportedBackend(imgsz)
+
+    def get_next(self):
+        for file in self.files:
+            img = cv2.imread(file)
+            if img is not None:
+                blob, _ = self.prep.preprocess([img])
+                return {self.input_name: blob}
+        return None
+
+    def rewind(self):
+        pass
+
+
+def quantize_int8(model_path, calib_dir, out_path=None, imgsz=640, max_images=300):
+    """Static INT8 (QDQ) quantization of an ONNX model calibrated on images from calib_dir"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    out_path = out_path or os.path.splitext(model_path)[0] + "_int8.onnx"
+    files = list_images(calib_dir, max_images)
+    if not files:
+        raise ValueError(f"No calibration images found in {calib_dir}")
+
+    prepared = os.path.splitext(out_path)[0] + "_prep.onnx"
+    quant_pre_process(model_path, prepared)
+    input_name = ort.InferenceSession(prepared, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    logger.info(f"Calibrating on {len(files)} images from {calib_dir}")
+    quantize_static(
+        prepared, out_path, _CalibrationReader(input_name, files, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        op_types_to_quantize=["Conv", "MatMul"],
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    os.remove(prepared)
+    return out_path
+
+
+# ------------------ Comparison report ------------------
+def match_detections(reference, candidate, iou_thres=0.5):
+    """Greedy same-class IoU matching. Returns (matched, missed, extra, sum_iou, sum_conf_diff)"""
+    used = np.zeros(len(candidate), dtype=bool)
+    matched, sum_iou, sum_conf = 0, 0.0, 0.0
+    for ref in reference[reference[:, 4].argsort()[::-1]]:
+        same = (candidate[:, 5] == ref[5]) & ~used
+        if not same.any():
+            continue
+        idx = np.flatnonzero(same)
+        ious = box_iou(ref[:4], candidate[idx, :4])
+        best = ious.argmax()
+        if ious[best] >= iou_thres:
+            used[idx[best]] = True
+            matched += 1
+            sum_iou += ious[best]
+            sum_conf += abs(ref[4] - candidate[idx[best], 4])
+    return matched, len(reference) - matched, len(candidate) - matched, sum_iou, sum_conf
+
+
+def _time_backend(backend, images, warmup=3):
+    for img in images[:warmup]:
+        backend.predict([img])
+    latencies, outputs = [], []
+    for img in images:
+        start = time.perf_counter()
+        outputs.append(backend.predict([img])[0])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), outputs
+
+
+def compare_backends(images, baseline, candidates):
+    """Latency and agreement of each candidate backend against the baseline detections"""
+    base_lat, base_out = _time_backend(baseline, images)
+    report = {"images": len(images), "baseline": {
+        "backend": baseline.name,
+        "p50_ms": float(np.percentile(base_lat, 50)),
+        "p95_ms": float(np.percentile(base_lat, 95)),
+        "detections": int(sum(len(d) for d in base_out)),
+    }, "candidates": []}
+
+    for label, backend in candidates:
+        lat, out = _time_backend(backend, images)
+        matched = missed = extra = 0
+        sum_iou = sum_conf = 0.0
+        for ref, cand in zip(base_out, out):
+            m, mi, ex, si, sc = match_detections(ref, cand)
+            matched, missed, extra = matched + m, missed + mi, extra + ex
+            sum_iou, sum_conf = sum_iou + si, sum_conf + sc
+        report["candidates"].append({
+            "backend": label,
+            "p50_ms": float(np.percentile(lat, 50)),
+            "p95_ms": float(np.percentile(lat, 95)),
+            "speedup_p50": float(np.percentile(base_lat, 50) / max(np.percentile(lat, 50), 1e-9)),
+            "detections": int(sum(len(d) for d in out)),
+            "recall_vs_baseline": matched / max(matched + missed, 1),
+            "precision_vs_baseline": matched / max(matched + extra, 1),
+            "mean_iou": sum_iou / max(matched, 1),
+            "mean_conf_diff": sum_conf / max(matched, 1),
+        })
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"Images: {report['images']}",
+        f"{'backend':<40} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8} {'recall':>7} {'prec':>7} {'mIoU':>6}",
+        f"{report['baseline']['backend']:<40} {report['baseline']['p50_ms']:>8.1f} "
+        f"{report['baseline']['p95_ms']:>8.1f} {'1.00x':>8} {'-':>7} {'-':>7} {'-':>6}",
+    ]
+    for c in report["candidates"]:
+        lines.append(
+            f"{c['backend']:<40} {c['p50_ms']:>8.1f} {c['p95_ms']:>8.1f} {c['speedup_p50']:>7.2f}x "
+            f"{c['recall_vs_baseline']:>7.3f} {c['precision_vs_baseline']:>7.3f} {c['mean_iou']:>6.3f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, quantize and compare CPU inference backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="export best.pt to ONNX")
+    p.add_argument("--weights", default=WEIGHTS_PATH)
+    p.add_argument("--imgsz", type=int, default=640)
+
+    p = sub.add_parser("quantize", help="static INT8 quantization against a calibration folder")
+    p.add_argument("--model", required=True, help="FP32 .onnx model")
+    p.add_argument("--calib", default="data", help="calibration image folder, e.g. data/ or cropped/")
+    p.add_argument("--out", default=None)
+    p.add_argument("--imgsz", type=int, default=640)
+    p.add_argument("--max-images", type=int, default=300)
+
+    p = sub.add_parser("compare", help="accuracy/latency report against the PyTorch baseline")
+    p.add_argument("--images", required=True)
+    p.add_argument("--weights", default=WEIGHTS_PATH)
+    p.add_argument("--candidates", nargs="+", required=True, help="backend:model_path, e.g. onnx:weights/best.onnx")
+    p.add_argument("--imgsz", type=int, default=640)
+    p.add_argument("--limit", type=int, default=200)
+    p.add_argument("--report", default=None, help="write the JSON report here")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "export":
+        logger.info(f"Exported {export_onnx(args.weights, args.imgsz)}")
+    elif args.command == "quantize":
+        logger.info(f"Wrote {quantize_int8(args.model, args.calib, args.out, args.imgsz, args.max_images)}")
+    elif args.command == "compare":
+        images = [img for img in (cv2.imread(f) for f in list_images(args.images, args.limit)) if img is not None]
+        baseline = TorchBackend(args.weights, imgsz=args.imgsz)
+        candidates = []
+        for spec in args.candidates:
+            name, _, path = spec.partition(":")
+            candidates.append((spec, load_backend(name, path or None, imgsz=args.imgsz)))
+        report = compare_backends(images, baseline, candidates)
+        print(format_report(report))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+End-to-end performance benchmark over a recorded video fixture.
+
+The detection path runs the real DetectionPipeline on a ReplayCamera playing
+the fixture, unthrottled and lossless, with its frames shown by a slot that
+does what PLCWindow.update_frame does (QPixmap from the pooled QImage, release
+the buffer). The stage timings are decode (the replay source reading the next
+frame), plus the pipeline's own scheduler samples: inference and render on the
+worker threads, display on the Qt thread. The preview path repeats
+update_tab2_frame's steps -- decode, OverlayRenderer.render, QPixmap -- on
+every fixture frame.
+
+Colour conversion and QImage creation are not separate stages: both happen
+inside OverlayRenderer.render and are counted in "render". The QImage only
+wraps the pooled buffer, and the BGR->RGB swap runs only on Qt < 5.14; the
+report's "merged_stages" and "colour_conversion" fields say so. The copy into
+the QPixmap is "display".
+
+There is no camera and the Qt platform is offscreen. Each path runs in its own
+process so its peak RSS is its own. Per-stage p50/p95/p99, FPS and peak RSS go
+to a JSON file that later runs can be compared against.
+
+Usage:
+    python bench_pipeline.py                                   # all paths on the committed fixture
+    python bench_pipeline.py --backend onnx --weights weights/best.onnx --out data/bench/onnx.json
+    python bench_pipeline.py --compare data/bench/pipeline-20250101-120000.json
+    python bench_pipeline.py --make-fixture                    # regenerate the fixture video
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+FIXTURE_PATH = "data/fixtures/conveyor_640x360.avi"
+PATHS = ("detection", "preview")
+# Requested stages that have no timer of their own, and the stage they are counted in
+MERGED_STAGES = {
+    "colour conversion": "render",
+    "QImage": "render",
+}
+
+
+def make_fixture(path=FIXTURE_PATH, frames=60, size=(640, 360), fps=30):
+    """Synthetic conveyor clip: a board with pads and one dark blemish crossing the view"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    w, h = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    # Smooth belt gradient: keeps the committed file small
+    background = np.repeat(np.linspace(45, 75, w, dtype=np.uint8)[None, :, None], h, 0).repeat(3, 2)
+    for i in range(frames):
+        frame = background.copy()
+        x = int(-220 + i * (w + 220) / frames)
+        cv2.rectangle(frame, (x, 90), (x + 220, 270), (40, 120, 30), -1)
+        for px in range(x + 20, x + 200, 30):
+            cv2.circle(frame, (px, 130), 6, (60, 190, 210), -1)
+            cv2.circle(frame, (px, 230), 6, (60, 190, 210), -1)
+        cv2.circle(frame, (x + 150, 180), 9, (20, 20, 20), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None if it cannot be read"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    except ImportError:
+        return None
+
+
+def summarize(samples):
+    arr = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(arr, 50)), "p95_ms": float(np.percentile(arr, 95)),
+            "p99_ms": float(np.percentile(arr, 99)), "mean_ms": float(arr.mean())}
+
+
+def _run_detection(fixture, backend_name, weights, label_size, repeat):
+    """DetectionPipeline over a ReplayCamera; runs inside a child process"""
+    from PyQt5.QtCore import QObject
+    from PyQt5.QtGui import QGuiApplication, QPixmap
+
+    from backends import load_backend
+    from frame_scheduler import FrameScheduler
+    from model_loader import warmup_backend
+    from pipeline import DetectionPipeline
+    from replay import ReplayCamera, ReplaySource
+
+    class SampledScheduler(FrameScheduler):
+        """Keeps every latency sample the pipeline records, for percentiles"""
+
+        def __init__(self):
+            super().__init__(name="bench")
+            self.samples = {}
+
+        def record(self, stage, seconds):
+            super().record(stage, seconds)
+            with self.lock:
+                self.samples.setdefault(stage, []).append(seconds)
+
+    class TimedReplaySource(ReplaySource):
+        """ReplaySource that records how long each frame takes to decode"""
+
+        @property
+        def _iterator(self):
+            return self._timed
+
+        @_iterator.setter
+        def _iterator(self, frames):
+            self._timed = None if frames is None else self._time(frames)
+
+        def _time(self, frames):
+            while True:
+                start = time.perf_counter()
+                item = next(frames, None)
+                if item is None:
+                    return
+                scheduler.record("decode", time.perf_counter() - start)
+                yield item
+
+    class TimedReplayCamera(ReplayCamera):
+        def create_source(self, source):
+            return TimedReplaySource(source, self.speed, self.max_buffers)
+
+    class Display(QObject):
+        """What PLCWindow.update_frame does with a pipeline frame, minus the label"""
+
+        def __init__(self, pipeline):
+            super().__init__()
+            self.pipeline = pipeline
+
+        def show(self, qt_image, token):
+            start = time.perf_counter()
+            pixmap = QPixmap.fromImage(qt_image)
+            self.pipeline.renderer.release(token)
+            self.pipeline.scheduler.record("display", time.perf_counter() - start)
+            self.pipeline.scheduler.frame_done()
+            del pixmap
+
+    app = QGuiApplication(sys.argv[:1])  # QPixmap needs a GUI application
+    backend = load_backend(backend_name, weights)
+    warmup_backend(backend)
+    scheduler = SampledScheduler()
+    frames = 0
+    total_start = time.perf_counter()
+    for _ in range(repeat):
+        camera = TimedReplayCamera(speed=0.0)
+        tracked = []
+        pipeline = DetectionPipeline(backend, camera, source=fixture, scheduler=scheduler, lossless=True,
+                                     on_result=lambda seq, detections: tracked.append(seq))
+        pipeline.renderer.set_target_size(*label_size)
+        display = Display(pipeline)
+        pipeline.frame_ready.connect(display.show)
+        if not pipeline.start():
+            raise RuntimeError(f"Cannot open fixture {fixture}")
+        source = camera.sources[fixture]
+        # Every frame is tracked (lossless); then let the last queued frames reach the display
+        while not (source.finished.is_set() and len(tracked) >= source.seq):
+            app.processEvents()
+            time.sleep(0.001)
+        deadline = time.perf_counter() + 0.5
+        while len(pipeline.results) and time.perf_counter() < deadline:
+            app.processEvents()
+        app.processEvents()
+        pipeline.stop()
+        camera.close()
+        frames += len(tracked)
+    elapsed = time.perf_counter() - total_start
+    app.quit()
+    return {
+        "frames": frames,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "displayed": scheduler.shown,
+        "display_dropped": scheduler.dropped,
+        "stages": {stage: summarize(samples) for stage, samples in scheduler.samples.items()},
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def _run_preview(fixture, label_size, repeat):
+    """update_tab2_frame's steps on every fixture frame; runs inside a child process"""
+    from PyQt5.QtGui import QGuiApplication, QPixmap
+
+    from overlay import OverlayRenderer
+
+    app = QGuiApplication(sys.argv[:1])
+    renderer = OverlayRenderer(*label_size)
+    stages = {}
+
+    def timed(stage, start):
+        now = time.perf_counter()
+        stages.setdefault(stage, []).append(now - start)
+        return now
+
+    frames = 0
+    total_start = time.perf_counter()
+    for _ in range(repeat):
+        cap = cv2.VideoCapture(fixture)
+        if not cap.isOpened():
+            raise RuntimeError(f"Cannot open fixture {fixture}")
+        buf = None
+        while True:
+            t = time.perf_counter()
+            ret, frame = cap.read(buf) if buf is not None else cap.read()
+            if not ret:
+                break
+            buf = frame  # reuse the decode buffer, as CameraSource does
+            t = timed("decode", t)
+            # OverlayRenderer draws into a pooled buffer at label size; colour conversion only on Qt < 5.14
+            image, token = renderer.render(frame)
+            t = timed("render", t)
+            pixmap = QPixmap.fromImage(image)
+            renderer.release(token)
+            timed("display", t)
+            del pixmap
+            frames += 1
+        cap.release()
+    elapsed = time.perf_counter() - total_start
+    app.quit()
+    return {
+        "frames": frames,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "stages": {stage: summarize(samples) for stage, samples in stages.items()},
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def _run_path(path, fixture, backend_name, weights, label_size, repeat):
+    """Runs inside a child process; returns the report for one display path"""
+    from overlay import HAS_BGR888
+
+    if path == "detection":
+        report = _run_detection(fixture, backend_name, weights, label_size, repeat)
+    else:
+        report = _run_preview(fixture, label_size, repeat)
+    report["colour_conversion"] = not HAS_BGR888
+    return report
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run_benchmark(paths, fixture, backend_name, weights, label_size=(640, 480), repeat=3):
+    """Run every path in a fresh offscreen process and collect the reports"""
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "fixture": fixture,
+        "backend": backend_name,
+        "weights": weights,
+        "label_size": list(label_size),
+        "merged_stages": MERGED_STAGES,
+        "paths": {},
+    }
+    for path in paths:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", path, "--fixture", fixture,
+               "--backend", backend_name, "--repeat", str(repeat), "--label", f"{label_size[0]}x{label_size[1]}"]
+        if weights:
+            cmd += ["--weights", weights]
+        out = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(f"Benchmark path '{path}' failed:\n{out.stderr[-2000:]}")
+        report["paths"][path] = json.loads(out.stdout.strip().splitlines()[-1])
+    return report
+
+
+def compare(report, baseline):
+    """Lines describing the change of FPS and p95 per stage against a previous report"""
+    lines = []
+    for path, current in report["paths"].items():
+        old = baseline.get("paths", {}).get(path)
+        if not old:
+            continue
+        lines.append(f"{path}: {old['fps']:.1f} -> {current['fps']:.1f} FPS ({current['fps'] / old['fps'] - 1:+.0%})")
+        for stage, stats in current["stages"].items():
+            before = old["stages"].get(stage)
+            if before and before["p95_ms"] > 0:
+                change = stats["p95_ms"] / before["p95_ms"] - 1
+                lines.append(f"  {stage:<10} p95 {before['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms ({change:+.0%})")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmark over a recorded video")
+    parser.add_argument("--child", choices=PATHS, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the fixture")
+    parser.add_argument("--label", default="640x480", help="display label size WxH")
+    parser.add_argument("--out", default=None, help="JSON report (default data/bench/pipeline-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier JSON report to compare against")
+    parser.add_argument("--make-fixture", action="store_true")
+    args = parser.parse_args(argv)
+
+    label_size = tuple(int(v) for v in args.label.lower().split("x"))
+    if args.make_fixture:
+        print(f"Wrote {make_fixture(args.fixture)}")
+        return
+    if args.child:
+        print(json.dumps(_run_path(args.child, args.fixture, args.backend, args.weights, label_size, args.repeat)))
+        return
+
+    report = run_benchmark(args.paths, args.fixture, args.backend, args.weights, label_size, args.repeat)
+    out = args.out or os.path.join("data", "bench", f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'path':<10} {'stage':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for path, r in report["paths"].items():
+        for stage, s in r["stages"].items():
+            print(f"{path:<10} {stage:<10} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f}")
+        rss = f"{r['peak_rss_bytes'] / 2 ** 20:.0f} MiB" if r["peak_rss_bytes"] else "n/a"
+        print(f"{path:<10} {r['fps']:.1f} FPS over {r['frames']} frames, peak RSS {rss}")
+    merged = ", ".join(f"{stage} in {into}" for stage, into in MERGED_STAGES.items())
+    print(f"Not timed separately: {merged}")
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(report, json.load(f)):
+                print(line)
+    print(f"Report written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Startup benchmark for the GUI.
+
+Launches application.py in a fresh process (offscreen Qt) and measures
+time-to-window (process start until PLCWindow is shown and has painted) and
+time-to-first-inference (until the background-loaded model has returned its
+first result). Exits with status 1 if either exceeds its budget or regresses
+past a saved baseline, so it can run as a CI gate.
+
+Usage:
+    python bench_startup.py --max-window-s 3 --max-first-inference-s 20
+    python bench_startup.py --save-baseline data/startup_baseline.json
+    python bench_startup.py --baseline data/startup_baseline.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+def _child(start_time, timeout):
+    """Runs inside the measured process; prints one JSON line"""
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    import application
+
+    window = application.PLCWindow()
+    window.show()
+    app.processEvents()
+    time_to_window = time.time() - start_time
+
+    # Keep the event loop turning while the loader works, as the real GUI would
+    deadline = time.time() + timeout
+    backend = None
+    while backend is None and time.time() < deadline:
+        app.processEvents()
+        backend = window.model_loader.get(timeout=0.05)
+    if backend is None:
+        raise TimeoutError(f"Model not ready after {timeout}s")
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    backend.predict([frame])
+    time_to_first_inference = time.time() - start_time
+
+    print(json.dumps({
+        "time_to_window_s": time_to_window,
+        "time_to_first_inference_s": time_to_first_inference,
+        "model_load_s": window.model_loader.load_seconds,
+        "model_warmup_s": window.model_loader.warmup_seconds,
+    }))
+    window.close()
+
+
+def measure(runs=3, timeout=300):
+    """Median of each metric over `runs` fresh processes"""
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    samples = []
+    for _ in range(runs):
+        start = time.time()
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", repr(start), "--timeout", str(timeout)],
+            env=env, capture_output=True, text=True, timeout=timeout + 60,
+        )
+        if out.returncode != 0:
+            raise RuntimeError(f"Startup run failed:\n{out.stderr[-2000:]}")
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {key: float(np.median([s[key] or 0.0 for s in samples])) for key in samples[0]}
+
+
+def check(report, max_window, max_first, baseline=None, tolerance=0.25):
+    """Return a list of failure messages (empty when within budget)"""
+    failures = []
+    if max_window and report["time_to_window_s"] > max_window:
+        failures.append(f"time-to-window {report['time_to_window_s']:.2f}s > budget {max_window:.2f}s")
+    if max_first and report["time_to_first_inference_s"] > max_first:
+        failures.append(f"time-to-first-inference {report['time_to_first_inference_s']:.2f}s > budget {max_first:.2f}s")
+    for key in ("time_to_window_s", "time_to_first_inference_s") if baseline else ():
+        limit = baseline[key] * (1 + tolerance)
+        if report[key] > limit:
+            failures.append(f"{key} {report[key]:.2f}s regressed past baseline {baseline[key]:.2f}s (+{tolerance:.0%})")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time-to-window / time-to-first-inference startup benchmark")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--max-window-s", type=float, default=3.0)
+    parser.add_argument("--max-first-inference-s", type=float, default=30.0)
+    parser.add_argument("--baseline", default=None, help="JSON from --save-baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs the baseline")
+    parser.add_argument("--save-baseline", default=None)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        _child(float(args.child), args.timeout)
+        return
+
+    report = measure(args.runs, args.timeout)
+    print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = check(report, args.max_window_s, args.max_first_inference_s, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Shared camera manager: one decoder per physical source, fanned out to any number of subscribers.
+
+Each source is grabbed once on its own thread into a small pool of reused
+buffers. Subscribers receive read-only numpy views of those buffers, so no
+frame is copied per consumer. A buffer is only reused once no view of it is
+alive any more, which makes it safe for a slow consumer to hold on to a frame.
+The device is released as soon as the last subscriber unsubscribes.
+"""
+
+import logging
+import sys
+import threading
+
+import cv2
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Handle returned by CameraManager.subscribe"""
+
+    def __init__(self, manager, source, callback, on_error):
+        self.manager = manager
+        self.source = source
+        self.callback = callback    # called on the grab thread with (seq, frame); must be fast
+        self.on_error = on_error
+        self.closed = False
+
+    def latest(self):
+        """Return (seq, frame) of the newest frame, or (0, None) before the first one"""
+        return self.manager.latest(self.source)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.manager.unsubscribe(self)
+
+
+class CameraSource:
+    """Owns one cv2.VideoCapture and its grab thread"""
+
+    def __init__(self, source, max_buffers=8):
+        self.source = source
+        self.max_buffers = max_buffers
+        self.cap = None
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self._slots = []
+        self._latest = None
+        self.seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._grab_loop, name=f"camera-{self.source}", daemon=True)
+        self._thread.start()
+        logger.info(f"Camera {self.source} opened")
+        return True
+
+    def close(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+        if self.cap:
+            self.cap.release()
+            self.cap = None
+        self._slots = []
+        self._latest = None
+        logger.info(f"Camera {self.source} released")
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def latest(self):
+        with self.lock:
+            if self._latest is None:
+                return 0, None
+            return self.seq, _read_only_view(self._latest)
+
+    def _free_slot(self):
+        """Pick a buffer nobody holds a view of"""
+        for slot in self._slots:
+            # Only the pool list, the loop variable and the getrefcount argument refer to a free buffer
+            if slot is not self._latest and sys.getrefcount(slot) <= 3:
+                return slot
+        return None
+
+    def _grab_loop(self):
+        while not self._stop.is_set():
+            slot = self._free_slot()
+            ret, frame = self.cap.read(slot) if slot is not None else self.cap.read()
+            if not ret:
+                metrics.CAMERA_ERRORS.inc(str(self.source))
+                logger.warning(f"Camera {self.source}: read failed")
+                for sub in list(self.subscribers):
+                    if sub.on_error:
+                        sub.on_error("Failed to read frame from camera")
+                break
+            if frame is not slot:
+                # First frames, a resolution change or every buffer still in use: adopt the new array
+                if self._slots and frame.shape != self._slots[0].shape:
+                    self._slots = []
+                if len(self._slots) < self.max_buffers:
+                    self._slots.append(frame)
+                elif slot is None:
+                    logger.debug(f"Camera {self.source}: all {self.max_buffers} buffers busy")
+            metrics.CAMERA_FRAMES.inc(str(self.source))
+            with self.lock:
+                self._latest = frame
+                self.seq += 1
+                seq = self.seq
+            view = _read_only_view(frame)
+            for sub in list(self.subscribers):
+                if sub.callback:
+                    sub.callback(seq, view)
+            del view, frame, slot
+
+
+def _read_only_view(frame):
+    view = frame[...]
+    view.flags.writeable = False
+    return view
+
+
+class CameraManager:
+    """Opens each physical source once and shares its frames with every subscriber"""
+
+    def __init__(self, max_buffers=8):
+        self.max_buffers = max_buffers
+        self.sources = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, source=0, callback=None, on_error=None):
+        """Start receiving frames from source. Returns None if the device cannot be opened."""
+        with self.lock:
+            cam = self.sources.get(source)
+            if cam is None:
+                cam = self.create_source(source)
+                if not cam.open():
+                    return None
+                self.sources[source] = cam
+            elif not cam.is_alive():
+                # The grab thread died on a read error; reopen the device for the new subscriber
+                cam.close()
+                if not cam.open():
+                    del self.sources[source]
+                    return None
+            sub = Subscription(self, source, callback, on_error)
+            cam.subscribers.append(sub)
+            return sub
+
+    def create_source(self, source):
+        """The grabber for a new source; ReplayCamera overrides it to read recordings"""
+        return CameraSource(source, self.max_buffers)
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            cam = self.sources.get(sub.source)
+            if cam is None:
+                return
+            if sub in cam.subscribers:
+                cam.subscribers.remove(sub)
+            if not cam.subscribers:
+                del self.sources[sub.source]
+                cam.close()
+
+    def latest(self, source=0):
+        cam = self.sources.get(source)
+        return cam.latest() if cam else (0, None)
+
+    def close(self):
+        with self.lock:
+            for cam in self.sources.values():
+                cam.close()
+            self.sources = {}
@@ -0,0 +1,304 @@
+"""
+Incremental, parallel tiling of a capture folder into a crop dataset.
+
+The old crop button re-read and re-cropped every image in data/ on each click
+and numbered the tiles by processing order, so re-runs overwrote unrelated
+tiles. CropJob streams the input directory with os.scandir and keeps a
+manifest (source path, mtime, size and crop parameters -> tiles), so only new
+or changed images are processed. Each image is read once in a worker process,
+hashed, decoded, cut and encoded there, and every tile is written atomically
+under a content-derived name:
+
+    <blake2b of the source file>_<W>x<H>_<y>_<x>.<fmt>
+
+so the same capture always produces the same tile names, wherever it lives.
+With shards=True the tiles are appended to packed shards (tile_shards.py) in
+the output folder instead of loose files; the workers only encode and the
+parent process appends. With a DedupIndex (dedup_index.py) the parent also
+writes the tiles, dropping any tile within the index's distance of an image
+already stored.
+
+Usage:
+    python crop_dataset.py --input data --output cropped --size 640x640
+    python crop_dataset.py --input data --output cropped --size 320x320 --format png --workers 8
+    python crop_dataset.py --input data --output cropped.shards --size 640x640 --shards
+    python crop_dataset.py --input data --output cropped --size 640x640 --dedup data/dedup.sqlite
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from backends import IMAGE_EXTENSIONS
+from dedup_index import DEFAULT_DISTANCE, DedupIndex, dhash
+from tile_shards import ShardReader, ShardWriter, encode_tile
+
+MANIFEST_NAME = ".crop_manifest.json"
+# Below this many images the pool start-up costs more than it saves
+MIN_PARALLEL = 8
+
+logger = logging.getLogger(__name__)
+
+
+def scan_images(directory, recursive=False, skip=()):
+    """Yield (path, stat) for every image in directory (and its subfolders if recursive), streamed with os.scandir
+
+    Not recursive by default: data/ keeps other output (inspection snapshots, bursts ...) in subfolders.
+    """
+    skip = {os.path.abspath(p) for p in skip}
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and os.path.abspath(entry.path) not in skip:
+                        pending.append(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield entry.path, entry.stat()
+
+
+def write_atomic(path, data):
+    """Write bytes through a temporary file in the same directory, then rename over path"""
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def crop_file(path, output_dir, width, height, fmt="jpg", quality=95, payloads=False):
+    """Cut one image into width x height tiles (edge tiles keep the remainder). Returns the tile names, or None.
+
+    payloads=True writes nothing and returns (name, encoded bytes, shape, dHash) per tile instead.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if fmt == "jpg" else [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    h, w = img.shape[:2]
+    names = []
+    for y in range(0, h, height):
+        for x in range(0, w, width):
+            name = f"{digest}_{width}x{height}_{y}_{x}.{fmt}"
+            if payloads:
+                tile = img[y:y + height, x:x + width]
+                names.append((name, *encode_tile(tile, fmt, quality), dhash(tile)))
+                continue
+            out = os.path.join(output_dir, name)
+            if not os.path.exists(out):  # identical content was already tiled under another name
+                ok, encoded = cv2.imencode("." + fmt, img[y:y + height, x:x + width], params)
+                if not ok:
+                    raise ValueError(f"Encoding a tile of {path} failed")
+                write_atomic(out, encoded)
+            names.append(name)
+    return names
+
+
+def _init_worker():
+    cv2.setNumThreads(1)  # one image per process; OpenCV's own threads would only oversubscribe
+
+
+class CropJob:
+    """Tile new or changed images of input_dir into output_dir, remembering what was done"""
+
+    def __init__(self, input_dir, output_dir, width, height, fmt="jpg", quality=95, workers=None, shards=False,
+                 dedup=None):
+        if fmt not in ("jpg", "png") and not (shards and fmt == "raw"):
+            raise ValueError(f"Unknown image format '{fmt}', expected 'jpg' or 'png' (or 'raw' with shards)")
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.width = width
+        self.height = height
+        self.fmt = fmt
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = shards
+        self.dedup = dedup              # DedupIndex; near-duplicate tiles are not written
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.params = f"{width}x{height}.{fmt}.q{quality}"
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop after the images already being processed; the manifest keeps what was finished"""
+        self._cancel.set()
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring unreadable crop manifest {self.manifest_path}")
+            return {}
+
+    def save_manifest(self, manifest):
+        write_atomic(self.manifest_path, json.dumps(manifest, indent=0, sort_keys=True).encode())
+
+    def pending(self, manifest):
+        """(key, path, stat) of the images that are new, changed or were cut with other parameters"""
+        todo = []
+        seen = set()
+        for path, st in scan_images(self.input_dir):
+            key = os.path.relpath(path, self.input_dir).replace(os.sep, "/")
+            seen.add(key)
+            entry = manifest.get(key)
+            if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size \
+                    and entry["params"] == self.params:
+                continue
+            todo.append((key, path, st))
+        return todo, seen
+
+    def run(self, progress=None):
+        """Process everything pending; progress(done, total) is called as images finish. Returns stats."""
+        start = time.perf_counter()
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = self.load_manifest()
+        todo, seen = self.pending(manifest)
+        for key in set(manifest) - seen:
+            del manifest[key]  # source deleted; its tiles stay in the dataset
+        stats = {"scanned": len(seen), "processed": 0, "skipped": len(seen) - len(todo), "failed": 0,
+                 "tiles": 0, "duplicates": 0, "removed": 0}
+        payloads = self.shards or self.dedup is not None
+        args = (self.output_dir, self.width, self.height, self.fmt, self.quality, payloads)
+        stale = set()  # tiles a changed image no longer produces
+        shard_writer = stored = None
+        if self.shards and todo:
+            reader = ShardReader(self.output_dir)
+            stored = set(reader.names())
+            reader.close()
+            shard_writer = ShardWriter(self.output_dir, self.fmt, self.quality)
+
+        def store(name, payload, shape, h, previous):
+            path = os.path.normpath(os.path.join(self.output_dir, name))
+            # The image's own earlier tiles do not count: they are what it is being re-cut into
+            if self.dedup is not None and self.dedup.find(h, exclude=previous | {path}):
+                stats["duplicates"] += 1
+                return False
+            if shard_writer is not None:
+                if name not in stored:  # identical content is already packed
+                    shard_writer.add(name, payload=payload, shape=shape)
+                    stored.add(name)
+            elif not os.path.exists(path):
+                write_atomic(path, payload)
+            if self.dedup is not None:
+                self.dedup.add(path, h)
+            return True
+
+        def finish(key, st, names):
+            if names is None:
+                stats["failed"] += 1
+                logger.warning(f"Skipping unreadable image {key}")
+                return
+            if payloads:
+                previous = {os.path.normpath(os.path.join(self.output_dir, name))
+                            for name in manifest.get(key, {}).get("outputs", ())}
+                names = [tile[0] for tile in names if store(*tile, previous)]
+            stale.update(set(manifest.get(key, {}).get("outputs", ())) - set(names))
+            manifest[key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "params": self.params, "outputs": names}
+            stats["processed"] += 1
+            stats["tiles"] += len(names)
+            if progress:
+                progress(stats["processed"] + stats["failed"], len(todo))
+
+        try:
+            if len(todo) < MIN_PARALLEL or self.workers == 1:
+                for key, path, st in todo:
+                    if self._cancel.is_set():
+                        break
+                    finish(key, st, self._crop_safe(path, *args))
+            else:
+                with ProcessPoolExecutor(self.workers, initializer=_init_worker) as pool:
+                    futures = {pool.submit(crop_file, path, *args): (key, st) for key, path, st in todo}
+                    for future in as_completed(futures):
+                        key, st = futures[future]
+                        try:
+                            names = future.result()
+                        except Exception as e:
+                            logger.warning(f"Cropping {key} failed: {e}")
+                            names = None
+                        finish(key, st, names)
+                        if self._cancel.is_set():
+                            for other in futures:
+                                other.cancel()
+                            break
+        finally:
+            if shard_writer is not None:
+                shard_writer.close()
+            if stale and not self.shards:  # shards are append-only; replaced tiles stay packed
+                stats["removed"] = self._remove_unreferenced(stale, manifest)
+            self.save_manifest(manifest)
+        stats["seconds"] = time.perf_counter() - start
+        stats["cancelled"] = self._cancel.is_set()
+        logger.info(f"Crop job {self.input_dir} -> {self.output_dir}: {stats}")
+        return stats
+
+    @staticmethod
+    def _crop_safe(path, *args):
+        try:
+            return crop_file(path, *args)
+        except Exception as e:
+            logger.warning(f"Cropping {path} failed: {e}")
+            return None
+
+    def _remove_unreferenced(self, names, manifest):
+        """Delete tiles of a changed image unless another source produced the same content"""
+        referenced = set()
+        for entry in manifest.values():
+            referenced.update(entry["outputs"])
+        removed = 0
+        for name in names - referenced:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        if self.dedup is not None:
+            self.dedup.remove([os.path.join(self.output_dir, name) for name in names - referenced])
+        return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tile new or changed captures into a crop dataset")
+    parser.add_argument("--input", default="data")
+    parser.add_argument("--output", default="cropped")
+    parser.add_argument("--size", default="640x640", help="tile size WxH")
+    parser.add_argument("--format", choices=["jpg", "png", "raw"], default="jpg", help="raw needs --shards")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument("--shards", action="store_true", help="append tiles to packed shards instead of files")
+    parser.add_argument("--dedup", default=None, help="dedup index; tiles close to a stored image are skipped")
+    parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE, help="max differing bits of a duplicate")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    dedup = DedupIndex(args.dedup, args.distance) if args.dedup else None
+    job = CropJob(args.input, args.output, width, height, args.format, args.quality, args.workers, args.shards,
+                  dedup)
+    try:
+        stats = job.run()
+    finally:
+        if dedup:
+            dedup.close()
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""
+Perceptual-hash dedup index for the capture dataset.
+
+data/, cropped/ and auto_cropped/ fill up with near-identical frames of an
+empty conveyor or the same board. DedupIndex keeps a 64-bit difference hash
+(dHash, from a 9x8 grey thumbnail) of every stored image in SQLite and in an
+in-memory multi-index hash table, so "is there a stored image within d bits
+of this one?" costs a few table probes instead of a pass over every image.
+Capture, Crop and Auto Crop ask it before writing and register what they
+wrote.
+
+Multi-index hashing: the 64 bits are split into four 16-bit parts, each with
+a sorted lookup table. If two hashes differ in at most d bits, one of the
+parts differs in at most d // 4 bits, so only those table entries need their
+full distance checked. Hashes added since the tables were last sorted are
+checked directly, and the tables are rebuilt once that tail grows.
+
+The command line indexes existing folders and prunes duplicates, keeping the
+oldest image of each group (and deleting the YOLO label next to a pruned
+image). Tiles packed into a <folder>.shards directory are not files: they
+are indexed under <folder>.shards/<name> as they are written, and scan and
+prune leave those entries alone.
+
+Usage:
+    python dedup_index.py scan data cropped auto_cropped
+    python dedup_index.py prune data --distance 4 --dry-run
+    python dedup_index.py query data/capture_12.jpg
+    python dedup_index.py bench --count 300000
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+DEDUP_PATH = "data/dedup.sqlite"
+# Bits two images may differ in and still count as duplicates
+DEFAULT_DISTANCE = 4
+CHUNKS = 4
+CHUNK_BITS = 16
+
+logger = logging.getLogger(__name__)
+
+_BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+_SHIFTS = np.arange(CHUNKS, dtype=np.uint64) * np.uint64(CHUNK_BITS)
+_CHUNK_MASK = np.uint64((1 << CHUNK_BITS) - 1)
+# Set bits of every byte value, for NumPy < 2 which has no bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# ------------------ Hashing ------------------
+def dhash_tiles(frame, rows, cols, tile_w, tile_h):
+    """64-bit difference hash of each of the rows x cols tiles at the top left of frame, as a (rows, cols) uint64 array"""
+    gray = frame[:rows * tile_h, :cols * tile_w]
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    # 9x8 pixels per tile: each tile's thumbnail is its own block of the small image
+    small = cv2.resize(gray, (cols * 9, rows * 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    blocks = small.reshape(rows, 8, cols, 9).transpose(0, 2, 1, 3)
+    bits = (blocks[..., 1:] > blocks[..., :-1]).reshape(rows, cols, 64)
+    return (bits.astype(np.uint64) * _BIT_WEIGHTS).sum(axis=-1, dtype=np.uint64)
+
+
+def dhash(image):
+    """64-bit difference hash of a whole image"""
+    h, w = image.shape[:2]
+    return int(dhash_tiles(image, 1, 1, w, h)[0, 0])
+
+
+def hamming(a, b):
+    """Number of differing bits between two 64-bit hashes"""
+    return bin(int(a) ^ int(b)).count("1")
+
+
+def hash_file(path):
+    """dHash of an image file, or None if it cannot be read"""
+    # Half-size greyscale decode: JPEG skips most of the work, and the 9x8 thumbnail comes out the same
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    return None if img is None else dhash(img)
+
+
+def _hash_files(paths):
+    return [hash_file(path) for path in paths]
+
+
+def _in_shards(path):
+    """True for a tile packed into a <folder>.shards directory rather than a file"""
+    return any(part.endswith(".shards") for part in os.path.normpath(path).split(os.sep)[:-1])
+
+
+def _popcount(values):
+    """Set bits per element of a uint64 array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _BYTE_POPCOUNT[values.reshape(-1).view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def _to_signed(h):
+    # SQLite integers are signed 64-bit
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+# ------------------ Multi-index hash table ------------------
+@functools.lru_cache(maxsize=None)
+def _chunk_masks(radius):
+    """All 16-bit masks with at most radius bits set"""
+    masks = np.arange(1 << CHUNK_BITS, dtype=np.uint64)
+    return masks[_popcount(masks) <= radius]
+
+
+class HashIndex:
+    """In-memory key -> 64-bit hash table with fast Hamming-radius lookup"""
+
+    def __init__(self):
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._alive = np.zeros(1024, dtype=bool)
+        self.keys = []              # key per slot; None once removed
+        self.slots = {}             # key -> slot
+        self.size = 0
+        self._offsets = None        # (CHUNKS, 2**16 + 1): where each chunk value's bucket starts in _order
+        self._order = None          # per chunk, the indexed slots sorted by that chunk's value, concatenated
+        self._indexed = 0           # slots below this are in the tables; the rest is scanned
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def get(self, key):
+        slot = self.slots.get(key)
+        return None if slot is None else int(self._hashes[slot])
+
+    def add(self, key, h):
+        if key in self.slots:
+            self.remove(key)
+        if self.size == len(self._hashes):
+            self._hashes = np.resize(self._hashes, self.size * 2)
+            self._alive = np.resize(self._alive, self.size * 2)
+        self._hashes[self.size] = h
+        self._alive[self.size] = True
+        self.keys.append(key)
+        self.slots[key] = self.size
+        self.size += 1
+        if self.size - self._indexed > max(4096, self._indexed // 32):
+            self.reindex()
+
+    def add_many(self, keys, hashes):
+        for key in keys:
+            if key in self.slots:
+                self.remove(key)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        need = self.size + len(hashes)
+        if need > len(self._hashes):
+            self._hashes = np.resize(self._hashes, max(need, self.size * 2))
+            self._alive = np.resize(self._alive, len(self._hashes))
+        self._hashes[self.size:need] = hashes
+        self._alive[self.size:need] = True
+        for key in keys:
+            self.slots[key] = len(self.keys)
+            self.keys.append(key)
+        self.size = need
+        self.reindex()
+
+    def remove(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self._alive[slot] = False
+            self.keys[slot] = None
+
+    def reindex(self):
+        """Drop removed slots and rebuild the sorted chunk tables"""
+        if len(self.slots) < self.size:
+            live = np.flatnonzero(self._alive[:self.size])
+            self._hashes[:len(live)] = self._hashes[live]
+            self._alive[:len(live)] = True
+            self._alive[len(live):] = False
+            self.keys = [self.keys[i] for i in live]
+            self.slots = {key: i for i, key in enumerate(self.keys)}
+            self.size = len(live)
+        chunks = (self._hashes[:self.size, None] >> _SHIFTS) & _CHUNK_MASK
+        order = np.argsort(chunks, axis=0, kind="stable")
+        self._offsets = np.stack([
+            np.searchsorted(chunks[order[:, i], i], np.arange((1 << CHUNK_BITS) + 1, dtype=np.uint64))
+            for i in range(CHUNKS)
+        ]) + (np.arange(CHUNKS) * self.size)[:, None]
+        self._order = order.T.ravel()
+        self._indexed = self.size
+
+    def query(self, h, max_distance):
+        """[(distance, key)] of every stored hash within max_distance bits of h, closest first"""
+        h = np.uint64(h)
+        slots = np.arange(self._indexed, self.size)
+        if self._indexed:
+            # Every bucket whose chunk value is within max_distance // CHUNKS bits of h's chunk
+            probes = (((h >> _SHIFTS) & _CHUNK_MASK)[:, None] ^ _chunk_masks(max_distance // CHUNKS)).astype(np.intp)
+            rows = np.arange(CHUNKS)[:, None]
+            lo = self._offsets[rows, probes].ravel()
+            lengths = self._offsets[rows, probes + 1].ravel() - lo
+            starts = np.cumsum(lengths) - lengths
+            positions = np.repeat(lo - starts, lengths) + np.arange(lengths.sum())
+            slots = np.concatenate([self._order[positions], slots])
+        distances = _popcount(self._hashes[slots] ^ h)
+        hit = (distances <= max_distance) & self._alive[slots]
+        # A hash can come up in several chunks
+        slots, first = np.unique(slots[hit], return_index=True)
+        return sorted((int(d), self.keys[s]) for d, s in zip(distances[hit][first], slots))
+
+
+# ------------------ Persistent index ------------------
+class DedupIndex:
+    """SQLite-backed dHash index of the stored images; thread-safe"""
+
+    def __init__(self, path=DEDUP_PATH, max_distance=DEFAULT_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " path TEXT PRIMARY KEY, hash INTEGER NOT NULL, mtime_ns INTEGER, size INTEGER) WITHOUT ROWID"
+        )
+        self.db.commit()
+        self.index = HashIndex()
+        start = time.perf_counter()
+        rows = self.db.execute("SELECT path, hash FROM images").fetchall()
+        if rows:
+            keys, hashes = zip(*rows)
+            self.index.add_many(list(keys), np.array(hashes, dtype=np.int64).view(np.uint64))
+        logger.info(f"Dedup index {path}: {len(rows)} images loaded in {time.perf_counter() - start:.2f}s")
+
+    def matches(self, h, max_distance=None):
+        """[(distance, path)] of the stored images within max_distance bits of hash h, closest first"""
+        with self.lock:
+            return self.index.query(h, self.max_distance if max_distance is None else max_distance)
+
+    def find(self, h, max_distance=None, exclude=()):
+        """(path, distance) of the closest stored image within max_distance bits of hash h, or None"""
+        for distance, path in self.matches(h, max_distance):
+            if path not in exclude:
+                return path, distance
+        return None
+
+    def add(self, path, h, st=None):
+        """Register a stored image (st: its os.stat, if it is already on disk)"""
+        path = os.path.normpath(path)
+        with self.lock:
+            self.index.add(path, h)
+            self.db.execute(
+                "INSERT OR REPLACE INTO images (path, hash, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                (path, _to_signed(h), st.st_mtime_ns if st else None, st.st_size if st else None),
+            )
+            self.db.commit()
+
+    def check_and_add(self, path, image=None, h=None):
+        """Register path unless a near-duplicate is stored; returns that duplicate's path, or None if added"""
+        h = dhash(image) if h is None else h
+        path = os.path.normpath(path)
+        with self.lock:
+            matches = [m for m in self.index.query(h, self.max_distance) if m[1] != path]
+            if matches:
+                return matches[0][1]
+            self.index.add(path, h)
+            self.db.execute("INSERT OR REPLACE INTO images (path, hash, mtime_ns, size) VALUES (?, ?, NULL, NULL)",
+                            (path, _to_signed(h)))
+            self.db.commit()
+        return None
+
+    def remove(self, paths):
+        paths = [os.path.normpath(p) for p in paths]
+        with self.lock:
+            for path in paths:
+                self.index.remove(path)
+            self.db.executemany("DELETE FROM images WHERE path = ?", [(p,) for p in paths])
+            self.db.commit()
+
+    def _entries_in(self, directory, columns="mtime_ns, size"):
+        """[(path, *columns)] of the images directly in directory (scan_images does not recurse)"""
+        directory = os.path.normpath(directory)
+        prefix = directory + os.sep
+        with self.lock:
+            rows = self.db.execute(f"SELECT path, {columns} FROM images WHERE substr(path, 1, ?) = ?",
+                                   (len(prefix), prefix)).fetchall()
+        return [row for row in rows if os.path.dirname(row[0]) == directory]
+
+    def scan(self, directories, workers=None):
+        """Index new or changed images in the directories and forget deleted ones. Returns stats."""
+        from crop_dataset import scan_images
+
+        start = time.perf_counter()
+        stats = {"scanned": 0, "hashed": 0, "unreadable": 0, "forgotten": 0}
+        for directory in directories:
+            if _in_shards(os.path.join(directory, "tile")):
+                logger.warning(f"Dedup scan: skipping {directory}, shard tiles are indexed as they are written")
+                continue
+            known = {path: (mtime_ns, size) for path, mtime_ns, size in self._entries_in(directory)}
+            todo = []
+            for path, st in scan_images(directory):
+                path = os.path.normpath(path)
+                stats["scanned"] += 1
+                if known.pop(path, None) != (st.st_mtime_ns, st.st_size):
+                    todo.append((path, st))
+            if known:
+                self.remove(list(known))
+                stats["forgotten"] += len(known)
+            rows = []
+            for (path, st), h in zip(todo, self._hash_all([p for p, _ in todo], workers)):
+                if h is None:
+                    stats["unreadable"] += 1
+                    continue
+                rows.append((path, h, st))
+            with self.lock:
+                if rows:
+                    self.index.add_many([p for p, _, _ in rows], [h for _, h, _ in rows])
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO images (path, hash, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                    [(p, _to_signed(h), st.st_mtime_ns, st.st_size) for p, h, st in rows],
+                )
+                self.db.commit()
+            stats["hashed"] += len(rows)
+        stats["seconds"] = time.perf_counter() - start
+        logger.info(f"Dedup scan {directories}: {stats}")
+        return stats
+
+    @staticmethod
+    def _hash_all(paths, workers=None):
+        from crop_dataset import MIN_PARALLEL
+
+        workers = workers or os.cpu_count() or 1
+        if len(paths) < MIN_PARALLEL or workers == 1:
+            return _hash_files(paths)
+        chunks = [paths[i:i + 256] for i in range(0, len(paths), 256)]
+        with ProcessPoolExecutor(workers) as pool:
+            return [h for hashes in pool.map(_hash_files, chunks) for h in hashes]
+
+    def prune(self, directories, max_distance=None, dry_run=False, workers=None):
+        """Delete all but the oldest image of each near-duplicate group in the directories. Returns stats."""
+        max_distance = self.max_distance if max_distance is None else max_distance
+        self.scan(directories, workers)
+        entries = []
+        for directory in directories:
+            if not _in_shards(os.path.join(directory, "tile")):  # packed tiles cannot be deleted one by one
+                entries += self._entries_in(directory, "hash, mtime_ns")
+        entries.sort(key=lambda e: (e[2] or 0, e[0]))
+        kept = HashIndex()
+        duplicates = []
+        for path, h, _ in entries:
+            h &= (1 << 64) - 1
+            if kept.query(h, max_distance):
+                duplicates.append(path)
+            else:
+                kept.add(path, h)
+        freed = 0
+        if not dry_run:
+            for path in duplicates:
+                for file in (path, os.path.splitext(path)[0] + ".txt"):  # and its YOLO label
+                    try:
+                        freed += os.path.getsize(file)
+                        os.remove(file)
+                    except FileNotFoundError:
+                        pass
+            self.remove(duplicates)
+        stats = {"images": len(entries), "duplicates": len(duplicates), "kept": len(entries) - len(duplicates),
+                 "bytes_freed": freed, "dry_run": dry_run}
+        logger.info(f"Dedup prune {directories}: {stats}")
+        return stats, duplicates
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def benchmark(count=300000, queries=2000, max_distance=DEFAULT_DISTANCE, seed=0):
+    """Query speed of HashIndex against a brute-force scan over count random hashes"""
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, 2 ** 64 - 1, count, dtype=np.uint64, endpoint=True)
+    index = HashIndex()
+    start = time.perf_counter()
+    index.add_many(list(range(count)), hashes)
+    build = time.perf_counter() - start
+    # Half the queries are near a stored hash, half are random
+    targets = hashes[rng.integers(0, count, queries)]
+    flips = np.zeros(queries, dtype=np.uint64)
+    for _ in range(max_distance):
+        flips |= np.left_shift(np.uint64(1), rng.integers(0, 64, queries).astype(np.uint64))
+    probes = np.where(np.arange(queries) % 2 == 0, targets ^ flips, rng.integers(0, 2 ** 64 - 1, queries, dtype=np.uint64, endpoint=True))
+
+    start = time.perf_counter()
+    results = [index.query(int(p), max_distance) for p in probes]
+    indexed = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = [np.flatnonzero(_popcount(hashes ^ p) <= max_distance) for p in probes[:200]]
+    brute = (time.perf_counter() - start) / 200 * queries
+    assert all(sorted(k for _, k in r) == list(e) for r, e in zip(results, expected)), "index missed a match"
+    return {"hashes": count, "build_s": round(build, 3), "query_us": round(indexed / queries * 1e6, 1),
+            "brute_force_query_us": round(brute / queries * 1e6, 1),
+            "hit_rate": sum(bool(r) for r in results) / queries}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perceptual-hash dedup index of the capture dataset")
+    parser.add_argument("--index", default=DEDUP_PATH)
+    parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE, help="max differing bits of a duplicate")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: one per CPU)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan = sub.add_parser("scan", help="index new or changed images")
+    scan.add_argument("dirs", nargs="+")
+    prune = sub.add_parser("prune", help="delete near-duplicates, keeping the oldest image of each group")
+    prune.add_argument("dirs", nargs="+")
+    prune.add_argument("--dry-run", action="store_true", help="only list what would be deleted")
+    query = sub.add_parser("query", help="stored images close to an image file")
+    query.add_argument("image")
+    bench = sub.add_parser("bench", help="lookup speed on random hashes")
+    bench.add_argument("--count", type=int, default=300000)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "bench":
+        print(json.dumps(benchmark(args.count, max_distance=args.distance), indent=2))
+        return
+    index = DedupIndex(args.index, args.distance)
+    try:
+        if args.command == "scan":
+            print(json.dumps(index.scan(args.dirs, args.workers), indent=2))
+        elif args.command == "prune":
+            stats, duplicates = index.prune(args.dirs, dry_run=args.dry_run, workers=args.workers)
+            if args.dry_run:
+                print("\n".join(duplicates))
+            print(json.dumps(stats, indent=2))
+        elif args.command == "query":
+            h = hash_file(args.image)
+            if h is None:
+                parser.error(f"cannot read {args.image}")
+            matches = index.matches(h)
+            print(json.dumps({"hash": f"{h:016x}", "matches": [{"path": p, "distance": d} for d, p in matches]},
+                             indent=2))
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
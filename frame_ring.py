@@ -0,0 +1,111 @@
+"""
+Pre-trigger ring buffer of recent camera frames, and burst saving.
+
+An intermittent defect is usually gone by the time someone presses Capture.
+FrameRing subscribes to the shared camera and copies every frame into one
+preallocated (capacity, H, W, C) array, slot after slot, so the last few
+seconds of footage are always in memory without a single allocation per
+frame (the array is only replaced if the camera resolution changes).
+
+save_burst() writes the `before` frames up to a moment (a button press, or
+the frame nearest a PLC reject) and the `after` frames that follow it into a
+new timestamped folder, through the asynchronous SnapshotWriter. Each frame
+is copied out of the ring as soon as it is available, so the ring only needs
+a little more room than the burst itself. The folder also gets a
+timestamps.csv, so replay.py can play the burst back with its original
+timing.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from inference_engine import TIMESTAMPS_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRing:
+    """The last `capacity` camera frames in a preallocated array; push() is the camera callback"""
+
+    def __init__(self, capacity=60):
+        self.capacity = capacity
+        self.seq = 0                    # frames pushed so far; frame seq lives in slot seq % capacity
+        self._frames = None             # (capacity, H, W, C), allocated on the first frame
+        self._seqs = np.zeros(capacity, dtype=np.int64)
+        self._times = np.zeros(capacity, dtype=np.float64)  # wall clock, seconds
+        self.cond = threading.Condition()
+
+    def push(self, camera_seq, frame):
+        """Copy a frame into the next slot (camera grab thread)"""
+        now = time.time()
+        with self.cond:
+            if self._frames is None or self._frames.shape[1:] != frame.shape:
+                if self._frames is not None:
+                    logger.warning(f"Frame ring: resolution changed to {frame.shape}, dropping {self.capacity} frames")
+                self._frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+                self._seqs[:] = 0
+            self.seq += 1
+            slot = self.seq % self.capacity
+            np.copyto(self._frames[slot], frame)
+            self._seqs[slot] = self.seq
+            self._times[slot] = now
+            self.cond.notify_all()
+
+    def get(self, seq):
+        """(copy of frame seq, its time) or (None, None) if it was overwritten or has not arrived"""
+        with self.cond:
+            slot = seq % self.capacity
+            if seq < 1 or self._seqs[slot] != seq:
+                return None, None
+            return self._frames[slot].copy(), float(self._times[slot])
+
+    def seq_at(self, timestamp):
+        """Seq of the last frame pushed at or before timestamp (the oldest one if all are later), 0 if empty"""
+        with self.cond:
+            valid = self._seqs > 0
+            if not valid.any():
+                return 0
+            earlier = valid & (self._times <= timestamp)
+            if not earlier.any():
+                return int(self._seqs[valid].min())
+            return int(self._seqs[earlier].max())
+
+    def wait_for(self, seq, timeout):
+        """Wait until frame seq has been pushed; False on timeout"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.seq >= seq, timeout)
+
+
+def save_burst(ring, writer, directory, before, after, center=None, batch=None, timeout=2.0):
+    """Write frames center-before+1 .. center+after (center: the newest frame) into directory.
+
+    Runs on the calling thread and waits for the `after` frames (up to `timeout` seconds for each).
+    Files are named <index>_<offset from center>, and timestamps.csv records their capture times.
+    Returns (written paths, frames missing from the ring).
+    """
+    center = ring.seq if center is None else center
+    rows, paths, missing = [], [], 0
+    for index, seq in enumerate(range(center - before + 1, center + after + 1)):
+        if seq > ring.seq and not ring.wait_for(seq, timeout):
+            missing += center + after + 1 - seq  # the camera stopped
+            break
+        frame, timestamp = ring.get(seq)
+        if frame is None:
+            missing += 1
+            continue
+        # The copy already belongs to us; block so the writer's queue bounds memory
+        path = writer.submit(os.path.join(directory, f"{index:03d}_{seq - center:+d}"), frame, batch=batch, block=True)
+        if path is not None:
+            paths.append(path)
+            rows.append(f"{os.path.basename(path)},{timestamp * 1000.0:.3f}\n")
+    if rows:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, TIMESTAMPS_FILE), "w") as f:
+            f.write("name,timestamp_ms\n" + "".join(rows))
+    if missing:
+        logger.warning(f"Burst {directory}: {missing} frames were not in the ring")
+    return paths, missing
@@ -0,0 +1,120 @@
+"""
+Latency-aware frame pacing for the video views.
+
+A fixed 30 ms QTimer fires whether or not the previous frame has been handled,
+so under load work piles up and the picture lags behind the camera.
+FrameScheduler keeps a moving average of how long each stage takes and only
+admits a new frame when the slowest stage (or the sum of the stages, for a
+single-threaded loop) can keep up, optionally capped at a target FPS. Frames
+that arrive too early are dropped, so the newest frame is always the one worked
+on. The effective FPS and dropped-frame count are exposed for the UI.
+"""
+
+import collections
+import threading
+import time
+
+import metrics
+
+
+class FrameScheduler:
+    """Admit frames at the rate the measured stages can sustain
+
+    target_fps=0 runs as fast as the stages allow. serial=True means all stages
+    run one after another on one thread (e.g. a GUI-thread preview), so their
+    latencies add up; otherwise the stages are pipelined and the slowest one sets the pace.
+    """
+
+    def __init__(self, target_fps=0, serial=False, alpha=0.2, window=2.0, name="view"):
+        self.name = name                # "view" label of the exported metrics
+        self.min_interval = 1.0 / target_fps if target_fps else 0.0
+        self.serial = serial
+        self.alpha = alpha              # weight of the newest sample in the moving averages
+        self.window = window            # seconds of history for the effective FPS
+        self.latency = {}               # stage -> smoothed seconds per frame
+        self.dropped = 0
+        self.shown = 0
+        self._next_due = 0.0
+        self._done = collections.deque()
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        """Add one latency sample for a stage"""
+        metrics.STAGE_SECONDS.observe(seconds, self.name, stage)
+        with self.lock:
+            previous = self.latency.get(stage)
+            self.latency[stage] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def latencies(self):
+        """Copy of the smoothed seconds per stage"""
+        with self.lock:
+            return dict(self.latency)
+
+    def interval(self):
+        """Seconds between admitted frames"""
+        with self.lock:
+            return self._interval()
+
+    def _interval(self):
+        # Caller holds the lock; record() may add stages from other threads
+        stages = self.latency.values()
+        sustainable = (sum(stages) if self.serial else max(stages, default=0.0))
+        return max(self.min_interval, sustainable)
+
+    def delay(self, now=None):
+        """Seconds until the next frame would be admitted"""
+        now = time.perf_counter() if now is None else now
+        return max(0.0, self._next_due - now)
+
+    def admit(self, now=None):
+        """True if a frame arriving now should be processed; otherwise it is counted as dropped"""
+        now = time.perf_counter() if now is None else now
+        with self.lock:
+            if now < self._next_due:
+                self.dropped += 1
+                metrics.FRAMES.inc(self.name, "dropped")
+                return False
+            interval = self._interval()
+            # Keep the average rate without letting an idle period turn into a burst
+            self._next_due = max(self._next_due, now - interval) + interval
+            return True
+
+    def drop(self, count=1):
+        """Count frames discarded elsewhere (stale queue entries, busy display buffers, ...)"""
+        metrics.FRAMES.inc(self.name, "dropped", amount=count)
+        with self.lock:
+            self.dropped += count
+
+    def frame_done(self, now=None):
+        """Mark a frame as shown; feeds the effective FPS"""
+        now = time.perf_counter() if now is None else now
+        metrics.FRAMES.inc(self.name, "shown")
+        with self.lock:
+            self.shown += 1
+            self._done.append(now)
+            while self._done and now - self._done[0] > self.window:
+                self._done.popleft()
+
+    def fps(self):
+        with self.lock:
+            if len(self._done) < 2:
+                return 0.0
+            span = self._done[-1] - self._done[0]
+            return (len(self._done) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        with self.lock:
+            latency = dict(self.latency)
+            interval = self._interval()
+        return {
+            "fps": self.fps(),
+            "shown": self.shown,
+            "dropped": self.dropped,
+            "interval_ms": interval * 1000,
+            "latency_ms": {stage: seconds * 1000 for stage, seconds in latency.items()},
+        }
+
+    def summary(self):
+        """One-line status for the UI"""
+        stages = " ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in self.latencies().items())
+        return f"{self.fps():.1f} FPS | dropped {self.dropped} | {stages}"
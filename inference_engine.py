@@ -0,0 +1,327 @@
+"""
+Headless batch/stream inference engine (no PyQt, no display needed).
+
+Streams frames from a video file, an image directory or a camera index
+through a generator pipeline and writes detections as JSON Lines or CSV.
+
+Usage:
+    python inference_engine.py --source archive/line3.mp4 --out line3.jsonl
+    python inference_engine.py --source data/ --out data.csv --format csv
+    python inference_engine.py --source 0 --max-frames 500 --out cam.jsonl
+    python inference_engine.py --source data/ --backend onnx --weights weights/best_int8.onnx
+    python inference_engine.py --source data/ --tile 640 --overlap 0.2 --merge wbf
+    python inference_engine.py --source line3.mp4 --track --detect-every 3 --verdicts boards.jsonl
+    python inference_engine.py --source cropped/ --cache data/results_cache.sqlite --out crops.jsonl
+    python inference_engine.py --source line3.mp4 --track --store inspections/inspections.sqlite
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, IMAGE_EXTENSIONS, MAX_NMS_CANDIDATES, WEIGHTS_PATH, load_backend, resolve_model_path
+from motion_gate import MotionGate
+from result_cache import CANDIDATE_CONF, CachedBackend, ResultCache, model_key
+from results_store import ResultsStore
+from tiling import MERGERS, TiledPredictor
+from tracker import BoardInspector
+
+logger = logging.getLogger(__name__)
+
+# Sidecar with the capture time of each image in a recorded frame directory
+TIMESTAMPS_FILE = "timestamps.csv"
+
+
+# ------------------ Frame sources ------------------
+def iter_frames(source, max_frames=None):
+    """Yield (frame_id, timestamp_ms, name, frame) from a camera index, video file or image directory"""
+    if isinstance(source, int) or str(source).isdigit():
+        frames = _iter_capture(int(source))
+    elif os.path.isdir(source):
+        frames = _iter_directory(source)
+    else:
+        frames = _iter_capture(source)
+
+    for frame_id, (timestamp_ms, name, frame) in enumerate(frames):
+        if max_frames is not None and frame_id >= max_frames:
+            break
+        yield frame_id, timestamp_ms, name, frame
+
+
+def _iter_capture(source):
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video source {source!r}")
+    try:
+        index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield cap.get(cv2.CAP_PROP_POS_MSEC), f"{source}#{index}", frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def _iter_directory(path):
+    files = sorted(
+        entry.path for entry in os.scandir(path)
+        if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    timestamps = read_timestamps(path)
+    for file in files:
+        img = cv2.imread(file)
+        if img is None:
+            logger.warning(f"Skipping unreadable image {file}")
+            continue
+        timestamp_ms = timestamps.get(os.path.basename(file))
+        yield os.path.getmtime(file) * 1000.0 if timestamp_ms is None else timestamp_ms, file, img
+
+
+def read_timestamps(directory):
+    """{file name: timestamp_ms} from a recording's timestamps.csv ('name,timestamp_ms' rows), if present"""
+    path = os.path.join(directory, TIMESTAMPS_FILE)
+    if not os.path.exists(path):
+        return {}
+    timestamps = {}
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) >= 2 and row[0] != "name":
+                timestamps[row[0]] = float(row[1])
+    return timestamps
+
+
+def prefetch(iterable, size=8):
+    """Run an iterator on a background thread so decoding overlaps inference"""
+    q = queue.Queue(maxsize=size)
+    done = object()
+
+    def producer():
+        try:
+            for item in iterable:
+                q.put(item)
+        except Exception as e:
+            q.put(e)
+        q.put(done)
+
+    threading.Thread(target=producer, name="prefetch", daemon=True).start()
+    while True:
+        item = q.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ------------------ Inference ------------------
+def run_inference(backend, frames, batch_size=8, gate=None, detect_every=1, inspector=None):
+    """Yield (frame_id, timestamp_ms, name, detections) for every frame in frames
+
+    Only every detect_every-th frame is inferred, and with a MotionGate only if it changed.
+    Frames that are not inferred repeat the last detections, or with a BoardInspector
+    get track boxes propagated by the tracker (detections then carry a 7th ID column).
+    """
+    last = np.zeros((0, 6), dtype=np.float32)
+    for batch in batched(frames, batch_size):
+        run = [
+            item[0] % detect_every == 0 and (gate is None or gate.should_run(item[3]))
+            for item in batch
+        ]
+        to_infer = [item[3] for item, r in zip(batch, run) if r]
+        detections = iter(backend.predict(to_infer) if to_infer else [])
+        for (frame_id, timestamp_ms, name, _), r in zip(batch, run):
+            dets = next(detections) if r else None
+            if inspector is not None:
+                yield frame_id, timestamp_ms, name, inspector.step(dets)
+                continue
+            if r:
+                last = dets
+            yield frame_id, timestamp_ms, name, last
+
+
+# ------------------ Writers ------------------
+class JsonlWriter:
+    """One JSON object per frame"""
+
+    def __init__(self, path, class_names):
+        self.file = open(path, "w") if path != "-" else sys.stdout
+        self.class_names = class_names
+
+    def write(self, frame_id, timestamp_ms, name, detections):
+        record = {
+            "frame": frame_id,
+            "timestamp_ms": round(timestamp_ms, 3),
+            "source": name,
+            "detections": [],
+        }
+        for det in detections:
+            x1, y1, x2, y2, conf, cls = det[:6]
+            item = {
+                "class": self.class_names.get(int(cls), str(int(cls))),
+                "conf": round(float(conf), 4),
+                "box": [round(float(v), 1) for v in (x1, y1, x2, y2)],
+            }
+            if len(det) > 6:
+                item["id"] = int(det[6])
+            record["detections"].append(item)
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class CsvWriter:
+    """One CSV row per detection"""
+
+    HEADER = ["frame", "timestamp_ms", "source", "id", "class", "conf", "x1", "y1", "x2", "y2"]
+
+    def __init__(self, path, class_names):
+        self.file = open(path, "w", newline="") if path != "-" else sys.stdout
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.HEADER)
+        self.class_names = class_names
+
+    def write(self, frame_id, timestamp_ms, name, detections):
+        for det in detections:
+            x1, y1, x2, y2, conf, cls = det[:6]
+            self.writer.writerow([
+                frame_id, f"{timestamp_ms:.3f}", name, int(det[6]) if len(det) > 6 else "",
+                self.class_names.get(int(cls), str(int(cls))), f"{conf:.4f}",
+                f"{x1:.1f}", f"{y1:.1f}", f"{x2:.1f}", f"{y2:.1f}",
+            ])
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+WRITERS = {"jsonl": JsonlWriter, "csv": CsvWriter}
+
+
+def parse_roi(text):
+    """'x,y,w,h' -> (x, y, w, h), or None for an empty string"""
+    if not text:
+        return None
+    x, y, w, h = (int(v) for v in text.split(","))
+    return x, y, w, h
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless PCB detection over video, images or a camera")
+    parser.add_argument("--source", required=True, help="video file, image directory or camera index")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="torch")
+    parser.add_argument("--weights", default=None, help=f"model file (default {WEIGHTS_PATH} or its .onnx export)")
+    parser.add_argument("--out", default="-", help="output file ('-' for stdout)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="jsonl")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.45, help="NMS IoU threshold")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--tile", type=int, default=0, help="tile size for sliced inference (0 = off)")
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--merge", choices=sorted(MERGERS), default="nms")
+    parser.add_argument("--gate", action="store_true", help="skip frames that did not change since the last inferred one")
+    parser.add_argument("--gate-roi", default=None, help="x,y,w,h region watched by the motion gate")
+    parser.add_argument("--track", action="store_true", help="track boards/defects and emit one verdict per board")
+    parser.add_argument("--detect-every", type=int, default=1, help="run the model every N frames")
+    parser.add_argument("--verdicts", default=None, help="JSON Lines file for per-board verdicts (with --track)")
+    parser.add_argument("--cache", default=None, help="SQLite result cache; identical frames are not re-inferred")
+    parser.add_argument("--cache-size-mb", type=float, default=256)
+    parser.add_argument("--store", default=None, help="SQLite inspection results store for the verdicts (with --track)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # Untiled, the cache keeps the pre-NMS candidates and --conf / --iou are applied on read
+    candidates = bool(args.cache) and not args.tile
+    if candidates:
+        floor = min(args.conf, CANDIDATE_CONF)
+        backend = load_backend(args.backend, args.weights, imgsz=args.imgsz, conf=floor, iou=1.0,
+                               max_det=MAX_NMS_CANDIDATES)
+    else:
+        backend = load_backend(args.backend, args.weights, imgsz=args.imgsz, conf=args.conf, iou=args.iou)
+    if args.tile:
+        backend = TiledPredictor(backend, args.tile, args.overlap, args.merge)
+    cache = None
+    if args.cache:
+        model_path = resolve_model_path(args.backend, args.weights)
+        if candidates:
+            key = model_key(model_path, backend=args.backend, imgsz=args.imgsz, candidate_conf=floor)
+        else:
+            # Tiles are merged after per-tile NMS, so every post-processing parameter is part of the key
+            key = model_key(model_path, backend=args.backend, imgsz=args.imgsz, conf=args.conf, iou=args.iou,
+                            tile=args.tile, overlap=args.overlap, merge=args.merge)
+        cache = ResultCache(args.cache, key, max_bytes=int(args.cache_size_mb * 1024 * 1024))
+        backend = CachedBackend(backend, cache, args.conf, args.iou) if candidates else CachedBackend(backend, cache)
+    writer = WRITERS[args.format](args.out, backend.names)
+
+    gate = None
+    if args.gate:
+        gate = MotionGate(roi=parse_roi(args.gate_roi))
+    inspector = verdict_file = store = None
+    if args.track:
+        verdict_file = open(args.verdicts, "w") if args.verdicts else None
+        if args.store:
+            store = ResultsStore(args.store)
+            store.set_names(backend.names)
+
+        def on_verdict(verdict):
+            if verdict_file:
+                verdict_file.write(json.dumps(verdict) + "\n")
+            if store:
+                store.record_verdict(verdict, source=str(args.source), block=True)
+
+        inspector = BoardInspector(backend.names, on_verdict=on_verdict)
+    frames = prefetch(iter_frames(args.source, args.max_frames), size=args.batch * 2)
+    count = 0
+    start = time.perf_counter()
+    try:
+        for frame_id, timestamp_ms, name, detections in run_inference(
+            backend, frames, batch_size=args.batch, gate=gate,
+            detect_every=max(1, args.detect_every), inspector=inspector,
+        ):
+            writer.write(frame_id, timestamp_ms, name, detections)
+            count += 1
+        if inspector is not None:
+            inspector.flush()
+    finally:
+        writer.close()
+        if verdict_file:
+            verdict_file.close()
+        if store:
+            store.close()
+        if cache is not None:
+            logger.info(f"Result cache: {cache.stats()}")
+            cache.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Processed {count} frames in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} FPS)")
+    if gate is not None:
+        logger.info(f"Motion gate: {gate.stats()}")
+
+
+if __name__ == "__main__":
+    main()
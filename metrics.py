@@ -0,0 +1,191 @@
+"""
+Counters, gauges and latency histograms with a Prometheus text endpoint.
+
+Dependency-free: metrics live in a module-level registry and are served as
+Prometheus text on http://127.0.0.1:<port>/metrics by a daemon thread.
+Until enable() is called every inc/set/observe returns after one flag check,
+so instrumented code costs next to nothing with metrics turned off. Gauges can
+be backed by a function that is only evaluated when the endpoint is scraped
+(used for queue depths).
+
+Usage:
+    PCB_METRICS_PORT=9108 python application.py
+    curl http://127.0.0.1:9108/metrics
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, 1 ms .. 5 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_enabled = False
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        with _registry_lock:
+            _registry[name] = self
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        if not _enabled:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.functions = {}
+
+    def set(self, value, *labels):
+        if not _enabled:
+            return
+        with self.lock:
+            self.values[labels] = value
+
+    def set_function(self, fn, *labels):
+        """Evaluate fn() at scrape time instead of updating the gauge in the hot path"""
+        with self.lock:
+            self.functions[labels] = fn
+
+    def remove_function(self, *labels):
+        with self.lock:
+            self.functions.pop(labels, None)
+
+    def render(self):
+        with self.lock:
+            functions = list(self.functions.items())
+        for labels, fn in functions:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            with self.lock:
+                self.values[labels] = value
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not _enabled:
+            return
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, n in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += n
+                    le = _format_labels(self.labelnames, labels, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def render_all():
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_all().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep scrapes out of the application log
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Enable metrics and serve /metrics on a daemon thread; returns the server"""
+    enable()
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+# ---- Application metrics ----
+STAGE_SECONDS = Histogram("pcb_stage_seconds", "Per-frame latency of each stage", ["view", "stage"])
+FRAMES = Counter("pcb_frames_total", "Frames shown or dropped per view", ["view", "outcome"])
+CAMERA_FRAMES = Counter("pcb_camera_frames_total", "Frames grabbed from each camera source", ["source"])
+CAMERA_ERRORS = Counter("pcb_camera_errors_total", "Camera read failures", ["source"])
+QUEUE_DEPTH = Gauge("pcb_queue_depth", "Items waiting between pipeline stages", ["queue"])
+VIEW_FPS = Gauge("pcb_view_fps", "Effective displayed frames per second", ["view"])
+PLC_SECONDS = Histogram("pcb_plc_seconds", "Latency of PLC calls", ["op"])
+PLC_ERRORS = Counter("pcb_plc_errors_total", "Failed PLC calls", ["op"])
+TRIGGER_SECONDS = Histogram("pcb_trigger_seconds", "PLC trigger edge to verdict write")
+VERDICTS = Counter("pcb_verdicts_total", "Board verdicts", ["verdict"])
@@ -0,0 +1,85 @@
+"""
+Background model loading with warm-up.
+
+Loading weights/best.pt and running the first inference (graph setup, memory
+allocation, kernel selection) takes seconds, so it must not happen at import
+time or on the GUI thread. ModelLoader runs a factory on a background thread,
+warms the model up with a dummy frame and then notifies its callbacks.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def warmup_backend(backend, imgsz=640, runs=2):
+    """Run a few dummy frames at the configured input size through backend.predict"""
+    frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(runs):
+        backend.predict([frame])
+
+
+class ModelLoader:
+    """Load a model on a background thread and report when it is ready"""
+
+    def __init__(self, factory, warmup=None, name="model"):
+        self.factory = factory          # () -> model
+        self.warmup = warmup            # (model) -> None, optional
+        self.name = name
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def add_ready_callback(self, callback):
+        """callback(model, error) runs on the loader thread, or right away if loading already finished"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self.model, self.error)
+
+    def is_ready(self):
+        return self._done.is_set() and self.error is None
+
+    def get(self, timeout=None):
+        """Return the model, or None if it is not ready within timeout. Re-raises a load failure."""
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            model = self.factory()
+            self.load_seconds = time.perf_counter() - start
+            if self.warmup is not None:
+                start = time.perf_counter()
+                self.warmup(model)
+                self.warmup_seconds = time.perf_counter() - start
+            self.model = model
+            logger.info(f"{self.name} ready (load {self.load_seconds:.2f}s, warm-up {self.warmup_seconds or 0:.2f}s)")
+        except Exception as e:
+            logger.exception(f"Loading {self.name} failed")
+            self.error = e
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self.model, self.error)
@@ -0,0 +1,77 @@
+"""
+Cheap change detector that decides whether a frame is worth running through the model.
+
+Each frame is shrunk to a small grayscale thumbnail (optionally restricted to
+the conveyor ROI) and compared with the thumbnail of the last frame that was
+actually inferred. If only a tiny fraction of pixels changed, the previous
+detections are still valid and inference is skipped.
+"""
+
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MotionGate:
+    """Skip inference while the conveyor ROI looks the same as at the last inferred frame"""
+
+    def __init__(self, roi=None, thumb_width=160, pixel_threshold=25, min_changed_fraction=0.01, max_skip=150):
+        self.roi = roi                                      # (x, y, w, h) in frame pixels, None = whole frame
+        self.thumb_width = thumb_width
+        self.pixel_threshold = pixel_threshold              # grey-level difference counted as "changed"
+        self.min_changed_fraction = min_changed_fraction    # fraction of changed pixels that triggers inference
+        self.max_skip = max_skip                            # force a refresh after this many skipped frames
+        self.reference = None
+        self.skipped_in_row = 0
+        self.runs = 0
+        self.skips = 0
+        self.last_score = 0.0
+
+    def should_run(self, frame):
+        """Return True if frame differs enough from the last inferred frame"""
+        thumb = self._thumbnail(frame)
+        if self.reference is None or self.reference.shape != thumb.shape or self.skipped_in_row >= self.max_skip:
+            return self._run(thumb, 1.0)
+
+        diff = cv2.absdiff(thumb, self.reference)
+        self.last_score = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        if self.last_score >= self.min_changed_fraction:
+            return self._run(thumb, self.last_score)
+
+        self.skipped_in_row += 1
+        self.skips += 1
+        return False
+
+    def reset(self):
+        self.reference = None
+        self.skipped_in_row = 0
+
+    def stats(self):
+        total = self.runs + self.skips
+        return {
+            "runs": self.runs,
+            "skips": self.skips,
+            "skip_ratio": self.skips / total if total else 0.0,
+            "last_score": self.last_score,
+        }
+
+    def _run(self, thumb, score):
+        self.reference = thumb
+        self.skipped_in_row = 0
+        self.runs += 1
+        self.last_score = score
+        return True
+
+    def _thumbnail(self, frame):
+        if self.roi is not None:
+            x, y, w, h = self.roi
+            frame = frame[y:y + h, x:x + w]
+        h, w = frame.shape[:2]
+        size = (self.thumb_width, max(1, round(h * self.thumb_width / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        # Blur away sensor noise so it does not count as change
+        return cv2.GaussianBlur(gray, (5, 5), 0)
@@ -0,0 +1,168 @@
+"""
+Fast overlay renderer for the video labels.
+
+Replaces results[0].plot() + cvtColor + QImage copies with a small pool of
+display buffers at label resolution: the frame is resized straight into a free
+buffer, boxes and labels are drawn into it, and a QImage is built on top of it
+in BGR888 format, so no colour conversion or extra copy is needed. A buffer is
+handed back with release() once the GUI has turned it into a QPixmap; if every
+buffer is still in flight the frame is dropped instead of queueing up.
+
+Usage:
+    python overlay.py --frames 300    # benchmark against the old plot/cvtColor path
+"""
+
+import argparse
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage
+
+# BGR colours cycled per class id
+BOX_COLORS = [(56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207), (10, 249, 72)]
+
+# Qt >= 5.14 can wrap BGR data directly; older Qt gets an in-place BGR->RGB swap
+HAS_BGR888 = hasattr(QImage, "Format_BGR888")
+
+
+class OverlayRenderer:
+    """Draw detections into reused display buffers and wrap them as QImages"""
+
+    def __init__(self, width=640, height=480, buffers=3, keep_aspect=True):
+        self.keep_aspect = keep_aspect
+        self.buffers = buffers
+        self.lock = threading.Lock()
+        self.set_target_size(width, height)
+
+    def set_target_size(self, width, height):
+        with self.lock:
+            self.target = (max(1, int(width)), max(1, int(height)))
+            self._reset_pool()
+
+    def release(self, token):
+        """Return a buffer to the pool once its QImage has been consumed"""
+        generation, index = divmod(token, 256)
+        with self.lock:
+            # Tokens from before a resize refer to buffers that no longer exist
+            if generation == self._generation and index not in self._free:
+                self._free.append(index)
+
+    def render(self, frame, detections=(), names=None, lines=()):
+        """Return (QImage, token), or (None, -1) if every buffer is still in use.
+
+        The QImage points into a pooled buffer; pass token to release() after converting it to a QPixmap.
+        """
+        fh, fw = frame.shape[:2]
+        tw, th = self.target
+        if self.keep_aspect:
+            scale = min(tw / fw, th / fh)
+            tw, th = max(1, round(fw * scale)), max(1, round(fh * scale))
+
+        index, buf, generation = self._acquire(tw, th)
+        if buf is None:
+            return None, -1
+
+        cv2.resize(frame, (tw, th), dst=buf, interpolation=cv2.INTER_AREA if tw < fw else cv2.INTER_LINEAR)
+        sx, sy = tw / fw, th / fh
+        names = names or {}
+        for det in detections:
+            cls = int(det[5])
+            color = BOX_COLORS[cls % len(BOX_COLORS)]
+            p1 = (int(det[0] * sx), int(det[1] * sy))
+            p2 = (int(det[2] * sx), int(det[3] * sy))
+            cv2.rectangle(buf, p1, p2, color, 2)
+            label = f"{names.get(cls, cls)} {det[4]:.2f}"
+            if len(det) > 6:
+                label = f"#{int(det[6])} {label}"
+            cv2.putText(buf, label, (p1[0], max(p1[1] - 5, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+        for i, line in enumerate(lines):
+            cv2.putText(buf, line, (8, 20 + 20 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 255, 255), 1, cv2.LINE_AA)
+
+        if HAS_BGR888:
+            image = QImage(buf.data, tw, th, buf.strides[0], QImage.Format_BGR888)
+        else:
+            cv2.cvtColor(buf, cv2.COLOR_BGR2RGB, dst=buf)
+            image = QImage(buf.data, tw, th, buf.strides[0], QImage.Format_RGB888)
+        return image, generation * 256 + index
+
+    def _reset_pool(self):
+        self._pool = []
+        self._free = []
+        self._generation = getattr(self, "_generation", -1) + 1
+
+    def _acquire(self, w, h):
+        """(index, buffer, generation) of a free buffer, taken together so a concurrent resize cannot mix them up"""
+        with self.lock:
+            if self._pool and self._pool[0].shape[:2] != (h, w):
+                # Frame aspect changed: start a new pool, buffers still shown are left to the GC
+                self._reset_pool()
+            if self._free:
+                index = self._free.pop()
+            elif len(self._pool) < self.buffers:
+                self._pool.append(np.empty((h, w, 3), dtype=np.uint8))
+                index = len(self._pool) - 1
+            else:
+                return -1, None, self._generation
+            return index, self._pool[index], self._generation
+
+
+def _legacy_render(frame, detections, names):
+    """The previous path: annotated copy, BGR->RGB copy, QImage deep copy"""
+    annotated = frame.copy()
+    for det in detections:
+        cls = int(det[5])
+        color = BOX_COLORS[cls % len(BOX_COLORS)]
+        p1, p2 = (int(det[0]), int(det[1])), (int(det[2]), int(det[3]))
+        cv2.rectangle(annotated, p1, p2, color, 2)
+        cv2.putText(annotated, f"{names.get(cls, cls)} {det[4]:.2f}", (p1[0], max(p1[1] - 5, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+    h, w, ch = rgb.shape
+    return QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888).copy()
+
+
+def benchmark(frames=300, width=1280, height=720, label=(640, 480)):
+    """ms/frame and peak numpy/Python allocation for the legacy path vs OverlayRenderer"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    detections = np.array([[100, 100, 300, 260, 0.91, 0], [500, 320, 560, 380, 0.62, 1]], dtype=np.float32)
+    names = {0: "pcb", 1: "defect"}
+    renderer = OverlayRenderer(*label)
+
+    def run_new():
+        image, token = renderer.render(frame, detections, names)
+        renderer.release(token)
+        return image
+
+    report = {}
+    for mode, fn in (("legacy", lambda: _legacy_render(frame, detections, names)), ("overlay", run_new)):
+        fn()  # warm-up
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(frames):
+            fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[mode] = {"ms_per_frame": elapsed * 1000 / frames, "peak_bytes": peak}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the overlay renderer against plot()/cvtColor")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.frames, args.width, args.height)
+    print(f"{'mode':<8} {'ms/frame':>9} {'peak alloc (KiB)':>17}")
+    for mode, r in report.items():
+        print(f"{mode:<8} {r['ms_per_frame']:>9.2f} {r['peak_bytes'] / 1024:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Threaded capture -> inference -> render pipeline for the detection tab.
+
+Each stage runs on its own thread and hands work to the next one through a
+bounded drop-oldest queue, so a slow model never makes the camera or the GUI
+wait: stale frames are discarded and the pipeline always works on the newest
+one. Capture is a CameraManager subscription, so the camera's grab thread is
+the first stage; a FrameScheduler admits camera frames only as fast as the
+measured stages can handle them. Finished frames are handed back to Qt through a signal.
+
+With lossless=True (replay) nothing is dropped before tracking: the camera
+thread waits for room in the frame queue, so every frame is inferred and
+tracked in order and the results are reproducible. Only display frames can
+still be skipped.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QImage
+
+import metrics
+from frame_scheduler import FrameScheduler
+from overlay import OverlayRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class DropOldestQueue:
+    """Bounded FIFO that discards the oldest item instead of blocking the producer"""
+
+    def __init__(self, maxsize=1):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        """Append item; returns True if the oldest item had to be discarded"""
+        with self._cond:
+            full = len(self._items) == self._items.maxlen
+            if full:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+            return full
+
+    def put_wait(self, item, timeout=None):
+        """Append item once a consumer has made room; returns False if none came within timeout"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._items) < self._items.maxlen, timeout):
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None if nothing arrived within timeout"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()  # wake a waiting put_wait()
+            return item
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DetectionPipeline(QObject):
+    """Capture thread + inference worker + render step, joined by drop-oldest queues
+
+    backend is either an in-process backend (predict) or a started ProcessPoolInference
+    (submit/get), in which case results are re-ordered by frame sequence before tracking.
+    """
+
+    frame_ready = pyqtSignal(QImage, int)   # image, token to hand back to renderer.release()
+    verdict = pyqtSignal(dict)
+    error = pyqtSignal(str)
+
+    def __init__(self, backend, camera, source=0, queue_size=1, gate=None, inspector=None, detect_every=1,
+                 scheduler=None, lossless=False, on_result=None, parent=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.scheduler = scheduler or FrameScheduler(name="detection")  # the GUI records "display" and frame_done()
+        self.show_metrics = False  # draw FPS / inference ms / queue depth onto the frames
+        self.camera = camera
+        self.gate = gate  # optional MotionGate; skipped frames reuse the last detections
+        self.inspector = inspector  # optional BoardInspector; propagates tracks between inference frames
+        self.detect_every = max(1, detect_every)
+        self.lossless = lossless
+        self.on_result = on_result  # (seq, detections) for every tracked frame, on the inference thread
+        if inspector is not None:
+            inspector.on_verdict = self._on_verdict
+        self.last_detections = np.zeros((0, 6), dtype=np.float32)
+        self.source = source
+        self.subscription = None
+        self.frames = DropOldestQueue(queue_size)
+        self.results = DropOldestQueue(queue_size)
+        self.renderer = OverlayRenderer()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Subscribe to the source and start all stages. Returns False if the source cannot be opened."""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._inference_loop, name="inference", daemon=True),
+            threading.Thread(target=self._render_loop, name="render", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        self.subscription = self.camera.subscribe(self.source, self._on_frame, self.error.emit)
+        if self.subscription is None:
+            self.stop()
+            return False
+        # Evaluated only when /metrics is scraped
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.frames), "frames")
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.results), "results")
+        metrics.VIEW_FPS.set_function(self.scheduler.fps, self.scheduler.name)
+        logger.info(f"Detection pipeline started on source {self.source}")
+        return True
+
+    def stop(self):
+        if self.subscription:
+            self.subscription.close()
+            self.subscription = None
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2)
+        self._threads = []
+        metrics.QUEUE_DEPTH.remove_function("frames")
+        metrics.QUEUE_DEPTH.remove_function("results")
+        metrics.VIEW_FPS.remove_function(self.scheduler.name)
+        if self.inspector is not None:
+            self.inspector.flush()
+        self.frames.clear()
+        self.results.clear()
+        logger.info(f"Detection pipeline stopped: {self.scheduler.stats()}")
+        if self.gate is not None:
+            logger.info(f"Motion gate: {self.gate.stats()}")
+
+    def is_running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def metrics_lines(self):
+        """Text for the on-screen metrics overlay"""
+        latency = self.scheduler.latencies()
+        return [
+            f"{self.scheduler.fps():.1f} FPS  dropped {self.scheduler.dropped}",
+            f"inference {latency.get('inference', 0) * 1000:.1f} ms  render {latency.get('render', 0) * 1000:.1f} ms",
+            f"queue frames {len(self.frames)}  results {len(self.results)}",
+        ]
+
+    def _on_verdict(self, verdict):
+        metrics.VERDICTS.inc(verdict["verdict"])
+        self.verdict.emit(verdict)
+
+    # ---- Stages ----
+    def _on_frame(self, seq, frame):
+        # Runs on the camera grab thread; frame is a read-only view shared with other subscribers
+        if self.lossless:
+            while not self._stop.is_set() and not self.frames.put_wait((seq, frame), timeout=0.1):
+                pass
+            return
+        if self.scheduler.admit() and self.frames.put((seq, frame)):
+            self.scheduler.drop()
+
+    def _inference_loop(self):
+        pooled = hasattr(self.backend, "submit")  # ProcessPoolInference: dispatch here, collect in order
+        run_token = object()  # tells this run's results from late ones of a previous run
+        if pooled:
+            collector = threading.Thread(target=self._collect_loop, args=(run_token,), name="collect", daemon=True)
+            collector.start()
+        frame_index = 0
+        while not self._stop.is_set():
+            item = self.frames.get(timeout=0.1)
+            if item is None:
+                continue
+            camera_seq, frame = item
+            start = time.perf_counter()
+            run = frame_index % self.detect_every == 0
+            frame_index += 1
+            if run and self.gate is not None:
+                run = self.gate.should_run(frame)
+
+            if pooled:
+                # Frames that are not inferred still go through the pool so tracking stays in order.
+                # The frame travels with its seq, so the collector has it however soon the result is out.
+                payload = (run_token, camera_seq, frame, start if run else None)
+                if self.backend.submit(frame, infer=run, block=self.lossless, payload=payload) is None:
+                    self.scheduler.drop()
+                continue
+
+            detections = None
+            if run:
+                try:
+                    detections = self.backend.predict([frame])[0]
+                except Exception as e:
+                    logger.exception("Inference failed")
+                    self.error.emit(str(e))
+                    continue
+            # Skipped frames cost ~0, so this averages to the per-frame cost with gating/detect_every
+            self.scheduler.record("inference", time.perf_counter() - start)
+            self._publish(camera_seq, frame, detections)
+        if pooled:
+            collector.join(timeout=2)
+
+    def _collect_loop(self, run_token):
+        while not self._stop.is_set():
+            item = self.backend.get(timeout=0.1)
+            if item is None:
+                continue
+            _, detections, payload = item
+            if payload is None or payload[0] is not run_token:  # a late result from a previous run of the pipeline
+                continue
+            _, camera_seq, frame, submitted = payload
+            # N workers in parallel: the sustainable per-frame cost is latency / N
+            latency = time.perf_counter() - submitted if submitted is not None else 0.0
+            self.scheduler.record("inference", latency / max(1, getattr(self.backend, "workers", 1)))
+            self._publish(camera_seq, frame, detections)
+
+    def _publish(self, seq, frame, detections):
+        """Hand a frame to the render stage; detections is None when inference was skipped"""
+        if detections is not None:
+            self.last_detections = detections
+        if self.inspector is not None:
+            detections = self.inspector.step(detections)
+        else:
+            detections = self.last_detections
+        if self.on_result:
+            self.on_result(seq, detections)
+        if self.results.put((frame, detections)):
+            self.scheduler.drop()
+
+    def _render_loop(self):
+        while not self._stop.is_set():
+            item = self.results.get(timeout=0.1)
+            if item is None:
+                continue
+            frame, detections = item
+            start = time.perf_counter()
+            lines = self.metrics_lines() if self.show_metrics else ()
+            image, token = self.renderer.render(frame, detections, self.backend.names, lines)
+            self.scheduler.record("render", time.perf_counter() - start)
+            if image is None:  # the GUI still holds every display buffer, drop this frame
+                self.scheduler.drop()
+                continue
+            self.frame_ready.emit(image, token)
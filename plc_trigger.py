@@ -0,0 +1,308 @@
+"""
+PLC-triggered inspection: infer once per board instead of free-running.
+
+The line PLC sets a bit (or increments a counter) when a PCB reaches the
+inspection station. PlcTrigger polls that address through the S7 client
+(s7_client.py), debounces it and reports each rising edge. TriggeredInspection then
+grabs the first camera frame captured after the edge, runs the model once and
+writes the verdict code back to the PLC, timing every step from the edge to
+the verdict write.
+
+Usage:
+    python plc_trigger.py --ip 192.168.0.1 --trigger M10.0 --verdict DB1.2 --source 0 --count 50
+    python plc_trigger.py --ip 192.168.0.1 --trigger DB1.0 --mode counter --verdict DB1.2 --backend onnx
+"""
+
+import argparse
+import logging
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from s7_client import ISO_TCP_PORT, S7Client
+from tracker import BOARD_CLASS_NAMES
+
+# Int16 written to the verdict address
+VERDICT_CODES = {"OK": 1, "NG": 2}
+
+logger = logging.getLogger(__name__)
+
+
+def connect_s7(ip, port=ISO_TCP_PORT):
+    """Connect an S7Client to an S7-1200 (rack 0, slot 1)"""
+    plc = S7Client(str(ip), port)
+    result = plc.ConnectServer()
+    if not result.IsSuccess:
+        plc.ConnectClose()
+        raise ConnectionError(f"Cannot connect to PLC at {ip}: {result.Message}")
+    return plc
+
+
+def write_int16(plc, address, value):
+    """Write one Int16; returns True on success"""
+    start = time.perf_counter()
+    ok = bool(plc.Write(str(address), value).IsSuccess)
+    metrics.PLC_SECONDS.observe(time.perf_counter() - start, "write")
+    if not ok:
+        metrics.PLC_ERRORS.inc("write")
+    return ok
+
+
+def percentile_summary(values):
+    if not values:
+        return {}
+    arr = np.asarray(values) * 1000
+    return {"n": len(arr), "p50_ms": float(np.percentile(arr, 50)), "p95_ms": float(np.percentile(arr, 95)),
+            "max_ms": float(arr.max())}
+
+
+class EdgeDetector:
+    """Debounced rising-edge detector for a PLC bit, or change detector for a counter
+
+    A new value only counts once it has been read unchanged for `debounce` seconds.
+    """
+
+    def __init__(self, debounce=0.02, counter=False):
+        self.debounce = debounce
+        self.counter = counter
+        self.state = None
+        self._candidate = None
+        self._since = 0.0
+
+    def update(self, value, now):
+        """Feed one reading; returns the time the edge was first seen, or None"""
+        if self.state is None:
+            # The first reading is the baseline, not an edge
+            self.state = self._candidate = value
+            return None
+        if value != self._candidate:
+            self._candidate, self._since = value, now
+        if self._candidate == self.state or now - self._since < self.debounce:
+            return None
+        previous, self.state = self.state, self._candidate
+        if self.counter or (self.state and not previous):
+            return self._since
+        return None
+
+
+class PlcTrigger:
+    """Poll a PLC address on a thread and call on_edge(edge_time) for each debounced edge"""
+
+    def __init__(self, plc, address, mode="bit", poll_interval=0.01, debounce=0.02, on_edge=None):
+        if mode not in ("bit", "counter"):
+            raise ValueError(f"Unknown trigger mode '{mode}', expected 'bit' or 'counter'")
+        self.plc = plc
+        self.address = str(address)
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.detector = EdgeDetector(debounce, counter=mode == "counter")
+        self.on_edge = on_edge
+        self.read_errors = 0
+        self.edges = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name="plc-trigger", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching PLC {self.mode} {self.address} every {self.poll_interval * 1000:.0f} ms")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def read(self):
+        start = time.perf_counter()
+        result = self.plc.ReadBool(self.address) if self.mode == "bit" else self.plc.ReadInt16(self.address)
+        metrics.PLC_SECONDS.observe(time.perf_counter() - start, "read")
+        if not result.IsSuccess:
+            metrics.PLC_ERRORS.inc("read")
+            raise IOError(f"Reading {self.address} failed: {result.Message}")
+        return result.Content
+
+    def _poll_loop(self):
+        next_poll = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                value = self.read()
+            except Exception as e:
+                self.read_errors += 1
+                if self.read_errors % 100 == 1:
+                    logger.warning(f"PLC trigger read error ({self.read_errors} so far): {e}")
+            else:
+                edge = self.detector.update(value, time.perf_counter())
+                if edge is not None:
+                    self.edges += 1
+                    if self.on_edge:
+                        try:
+                            self.on_edge(edge)
+                        except Exception:
+                            # Keep polling: a dead poll thread would leave trigger mode deaf to the PLC
+                            logger.exception("PLC trigger handler failed")
+            # Fixed-rate polling: a slow read shortens the next sleep instead of shifting the schedule
+            next_poll = max(next_poll + self.poll_interval, time.perf_counter())
+            self._stop.wait(max(0.0, next_poll - time.perf_counter()))
+
+
+class TriggeredInspection:
+    """One frame, one inference and one verdict write per PLC trigger"""
+
+    def __init__(self, plc, backend, camera, source=0, trigger_address="M10.0", verdict_address=None,
+                 mode="bit", poll_interval=0.01, debounce=0.02, frame_timeout=1.0, on_result=None):
+        self.plc = plc
+        self.backend = backend
+        self.camera = camera
+        self.source = source
+        self.verdict_address = verdict_address
+        self.frame_timeout = frame_timeout
+        self.on_result = on_result  # (result dict) on the inspection thread
+        self.board_cls = {cls for cls, name in backend.names.items() if name.lower() in BOARD_CLASS_NAMES}
+        self.trigger = PlcTrigger(plc, trigger_address, mode, poll_interval, debounce, on_edge=self._on_edge)
+        self.timings = {"edge_to_frame": [], "inference": [], "write": [], "total": []}
+        self.count = 0
+        self.missed = 0
+        self.failed = 0
+        self.subscription = None
+        self._frame_cond = threading.Condition()
+        self._frame = (0, None, 0.0)
+
+    def start(self):
+        """Subscribe to the camera and start polling. Returns False if the camera cannot be opened."""
+        self.subscription = self.camera.subscribe(self.source, self._on_frame)
+        if self.subscription is None:
+            return False
+        self.trigger.start()
+        return True
+
+    def stop(self):
+        self.trigger.stop()
+        if self.subscription:
+            self.subscription.close()
+            self.subscription = None
+        logger.info(f"Triggered inspection stopped: {self.count} boards, {self.missed} missed, {self.failed} failed, latency {self.latency_report()}")
+
+    def latency_report(self):
+        """p50/p95/max per step, from the debounced edge to the verdict write"""
+        return {step: percentile_summary(values) for step, values in self.timings.items()}
+
+    def _on_frame(self, seq, frame):
+        with self._frame_cond:
+            self._frame = (seq, frame, time.perf_counter())
+            self._frame_cond.notify_all()
+
+    def _next_frame_after(self, t):
+        """First frame the camera delivered after time t"""
+        deadline = time.perf_counter() + self.frame_timeout
+        with self._frame_cond:
+            while self._frame[2] <= t:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._frame_cond.wait(remaining)
+            return self._frame[1]
+
+    def _on_edge(self, edge_time):
+        # Runs on the poll thread, so the trigger is not read again until this board has its verdict
+        frame = self._next_frame_after(edge_time)
+        if frame is None:
+            self.missed += 1
+            logger.warning("Trigger received but no camera frame arrived")
+            self._reject()
+            return
+        t_frame = time.perf_counter()
+        try:
+            detections = self.backend.predict([frame])[0]
+        except Exception:
+            self.failed += 1
+            logger.exception("Inference failed on a triggered frame")
+            self._reject()
+            return
+        t_infer = time.perf_counter()
+        defects = {}
+        for det in detections:
+            cls = int(det[5])
+            if cls not in self.board_cls:
+                name = self.backend.names.get(cls, str(cls))
+                defects[name] = defects.get(name, 0) + 1
+        verdict = "NG" if defects else "OK"
+        written = True
+        if self.verdict_address:
+            written = write_int16(self.plc, self.verdict_address, VERDICT_CODES[verdict])
+            if not written:
+                logger.warning(f"Writing verdict to {self.verdict_address} failed")
+        t_done = time.perf_counter()
+
+        self.count += 1
+        metrics.TRIGGER_SECONDS.observe(t_done - edge_time)
+        metrics.VERDICTS.inc(verdict)
+        for step, seconds in (("edge_to_frame", t_frame - edge_time), ("inference", t_infer - t_frame),
+                              ("write", t_done - t_infer), ("total", t_done - edge_time)):
+            self.timings[step].append(seconds)
+        result = {
+            "board": self.count,
+            "verdict": verdict,
+            "defects": defects,
+            "written": written,
+            "latency_ms": (t_done - edge_time) * 1000,
+            "triggered_at": time.time() - (t_done - edge_time),  # wall clock of the edge
+            "frame": frame,
+            "detections": detections,
+        }
+        logger.info(f"Trigger {self.count}: {verdict} {defects} in {result['latency_ms']:.0f} ms")
+        if self.on_result:
+            self.on_result(result)
+
+    def _reject(self):
+        """Answer a trigger that got no verdict with NG, so the PLC does not wait for one and the board is not passed"""
+        metrics.VERDICTS.inc("NG")
+        if self.verdict_address and not write_int16(self.plc, self.verdict_address, VERDICT_CODES["NG"]):
+            logger.warning(f"Writing verdict to {self.verdict_address} failed")
+
+
+def main(argv=None):
+    import json
+
+    from backends import BACKENDS, load_backend
+    from camera_manager import CameraManager
+
+    parser = argparse.ArgumentParser(description="Inspect one frame per PLC trigger and write the verdict back")
+    parser.add_argument("--ip", required=True)
+    parser.add_argument("--trigger", required=True, help="PLC address of the trigger bit or counter, e.g. M10.0")
+    parser.add_argument("--mode", choices=["bit", "counter"], default="bit")
+    parser.add_argument("--verdict", default=None, help="PLC address for the Int16 verdict code (1 = OK, 2 = NG)")
+    parser.add_argument("--poll-ms", type=float, default=10)
+    parser.add_argument("--debounce-ms", type=float, default=20)
+    parser.add_argument("--source", default="0", help="camera index or video file")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="torch")
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--count", type=int, default=0, help="stop after this many boards (0 = until Ctrl+C)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    backend = load_backend(args.backend, args.weights)
+    plc = connect_s7(args.ip)
+    source = int(args.source) if args.source.isdigit() else args.source
+    inspection = TriggeredInspection(
+        plc, backend, CameraManager(), source, args.trigger, args.verdict, args.mode,
+        poll_interval=args.poll_ms / 1000, debounce=args.debounce_ms / 1000,
+    )
+    if not inspection.start():
+        raise SystemExit(f"Cannot open camera {args.source}")
+    try:
+        while not args.count or inspection.count < args.count:
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        inspection.stop()
+    print(json.dumps(inspection.latency_report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
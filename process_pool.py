@@ -0,0 +1,304 @@
+"""
+Multi-process inference over a shared-memory frame ring.
+
+One Python process cannot keep a 16-core CPU busy with YOLO, so N worker
+processes each load the backend and read frames straight out of a
+multiprocessing.shared_memory ring written by the capture stage. Only slot
+indices go through the work queue and only compact (N, 6) detection arrays
+come back, so frames are never pickled. Results are put back in submission
+order before they are handed on. If a worker process dies, the frames it
+was holding are finished as failed so the ordering never stalls.
+
+Usage:
+    python process_pool.py --source data/ --max-workers 8    # scaling benchmark for 1..N workers
+"""
+
+import argparse
+import collections
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backends import BACKENDS
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(shm_name, slot_bytes, work_q, result_q, backend_name, model_path, backend_kwargs, threads):
+    # Limit intra-op threads so N workers share the cores instead of oversubscribing them
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    from backends import load_backend
+    from model_loader import warmup_backend
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        if backend_name == "torch":
+            import torch
+            torch.set_num_threads(threads)
+        elif backend_name == "onnx":
+            backend_kwargs = dict(backend_kwargs, threads=threads)
+        backend = load_backend(backend_name, model_path, **backend_kwargs)
+        # Warm up before reporting ready so the first real frame does not pay for graph setup
+        warmup_backend(backend, backend_kwargs.get("imgsz", 640))
+        result_q.put(("ready", os.getpid(), backend.names))
+
+        while True:
+            job = work_q.get()
+            if job is None:
+                break
+            slot, seq, shape = job
+            result_q.put(("taken", os.getpid(), seq))
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            try:
+                detections = backend.predict([frame])[0]
+                error = None
+            except Exception as e:
+                detections, error = np.zeros((0, 6), dtype=np.float32), str(e)
+            del frame
+            result_q.put(("result", os.getpid(), seq, detections, error))
+    except Exception as e:
+        result_q.put(("failed", os.getpid(), str(e)))
+    finally:
+        shm.close()
+
+
+class ProcessPoolInference:
+    """N inference processes fed from a shared-memory ring; results come back in frame order"""
+
+    def __init__(self, backend_name="torch", model_path=None, workers=4, slots=None,
+                 max_frame_shape=(1080, 1920, 3), threads_per_worker=None, **backend_kwargs):
+        if backend_name not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend_name}', expected one of {sorted(BACKENDS)}")
+        self.backend_name = backend_name
+        self.model_path = model_path
+        self.backend_kwargs = backend_kwargs
+        self.workers = workers
+        self.slots = slots or workers * 2
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.names = {}
+        self.submitted = 0
+        self.dropped = 0
+        self._ctx = mp.get_context("spawn")
+        self._shm = None
+        self._procs = []
+        self._free = collections.deque()
+        self._lock = threading.Condition()
+        self._done = {}
+        self._next_seq = 0
+        self._payloads = {}             # seq -> payload handed back by get()
+        self._outstanding = {}          # seq -> ring slot, for frames queued to the workers
+        self._taken = {}                # worker pid -> seq it is predicting
+        self.ordered = queue.Queue()
+        self._collector = None
+        self._closing = False
+
+    def start(self, timeout=300):
+        """Spawn the workers and wait until every one has loaded the model"""
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self._free = collections.deque(range(self.slots))
+        self._work_q = self._ctx.Queue()
+        self._result_q = self._ctx.Queue()
+        for _ in range(self.workers):
+            p = self._ctx.Process(
+                target=_worker_main,
+                args=(self._shm.name, self.slot_bytes, self._work_q, self._result_q, self.backend_name,
+                      self.model_path, self.backend_kwargs, self.threads),
+                daemon=True,
+            )
+            p.start()
+            self._procs.append(p)
+
+        ready = 0
+        while ready < self.workers:
+            msg = self._result_q.get(timeout=timeout)
+            if msg[0] == "failed":
+                self.close()
+                raise RuntimeError(f"Inference worker {msg[1]} failed to start: {msg[2]}")
+            ready += 1
+            self.names = msg[2]
+        self._collector = threading.Thread(target=self._collect_loop, name="pool-collector", daemon=True)
+        self._collector.start()
+        logger.info(f"Started {self.workers} inference workers x {self.threads} threads, {self.slots} ring slots")
+        return self
+
+    def submit(self, frame, infer=True, block=False, payload=None):
+        """Queue a frame. Returns its sequence number, or None if the ring is full and block is False.
+
+        payload comes back out of get() with the frame's detections. Frames submitted with
+        infer=False take no slot and come out of get() with detections None, in order with the
+        inferred ones.
+        """
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame {frame.shape} does not fit a {self.slot_bytes}-byte ring slot")
+        with self._lock:
+            if infer:
+                while not self._free:
+                    if not block:
+                        self.dropped += 1
+                        return None
+                    self._lock.wait()
+                slot = self._free.popleft()
+            seq = self.submitted
+            self.submitted += 1
+            self._payloads[seq] = payload
+            if not infer:
+                self._finish(seq, None)
+                return seq
+            if not self._procs:
+                self._free.append(slot)
+                self._fail(seq, "no inference workers are running")
+                return seq
+            self._outstanding[seq] = slot
+
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+        view[...] = frame
+        del view
+        self._work_q.put((slot, seq, frame.shape))
+        return seq
+
+    def get(self, timeout=None):
+        """Next (seq, detections, payload) in submission order, or None on timeout"""
+        try:
+            return self.ordered.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def predict(self, images):
+        """Blocking drop-in for the backend interface (used by the headless tools)"""
+        seqs = [self.submit(img, block=True) for img in images]
+        results = {}
+        while len(results) < len(seqs):
+            seq, detections, _ = self.ordered.get()
+            results[seq] = detections
+        return [results[s] for s in seqs]
+
+    def close(self):
+        self._closing = True
+        for _ in self._procs:
+            self._work_q.put(None)
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._procs = []
+        if self._shm:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _collect_loop(self):
+        last_check = time.monotonic()
+        while self._shm is not None:
+            try:
+                msg = self._result_q.get(timeout=0.2)
+            except (queue.Empty, OSError, EOFError):
+                msg = None
+            if time.monotonic() - last_check >= 0.5:
+                last_check = time.monotonic()
+                self._reap_workers()
+            if msg is None:
+                continue
+            if msg[0] == "taken":
+                with self._lock:
+                    if msg[2] in self._outstanding:
+                        self._taken[msg[1]] = msg[2]
+                continue
+            if msg[0] != "result":
+                continue
+            _, pid, seq, detections, error = msg
+            if error:
+                logger.warning(f"Inference failed on frame {seq}: {error}")
+            with self._lock:
+                self._taken.pop(pid, None)
+                if seq in self._outstanding:  # not already failed by _reap_workers
+                    self._free.append(self._outstanding.pop(seq))
+                    self._finish(seq, detections)
+                    self._lock.notify()
+
+    def _reap_workers(self):
+        """Fail the frames held by workers that died; all outstanding frames once none is left"""
+        dead = [p for p in self._procs if not p.is_alive()]
+        if not dead or self._closing:
+            return
+        with self._lock:
+            for p in dead:
+                logger.error(f"Inference worker {p.pid} died (exit code {p.exitcode})")
+                self._procs.remove(p)
+                seq = self._taken.pop(p.pid, None)
+                if seq in self._outstanding:
+                    self._free.append(self._outstanding.pop(seq))
+                    self._fail(seq, f"worker {p.pid} died")
+            if not self._procs:
+                # Nobody is left to take the queued frames
+                for seq in sorted(self._outstanding):
+                    self._free.append(self._outstanding.pop(seq))
+                    self._fail(seq, "no inference workers are running")
+            self._lock.notify_all()
+
+    def _fail(self, seq, reason):
+        # Caller holds the lock
+        logger.warning(f"Inference failed on frame {seq}: {reason}")
+        self._finish(seq, np.zeros((0, 6), dtype=np.float32))
+
+    def _finish(self, seq, detections):
+        # Caller holds the lock; release results strictly in sequence order
+        self._done[seq] = detections
+        while self._next_seq in self._done:
+            done = self._next_seq
+            self.ordered.put((done, self._done.pop(done), self._payloads.pop(done, None)))
+            self._next_seq += 1
+
+
+def benchmark(images, backend_name, model_path, max_workers, repeat=2):
+    """Throughput of the pool for 1, 2, 4, ... max_workers processes"""
+    counts = sorted({1, *[2 ** i for i in range(1, max_workers.bit_length())], max_workers})
+    shape = max((img.shape for img in images), key=lambda s: s[0] * s[1])
+    report = []
+    for n in counts:
+        pool = ProcessPoolInference(backend_name, model_path, workers=n, max_frame_shape=shape).start()
+        try:
+            pool.predict(images[:n])  # warm-up every worker
+            start = time.perf_counter()
+            total = 0
+            for _ in range(repeat):
+                for img in images:
+                    pool.submit(img, block=True)
+                    total += 1
+            for _ in range(total):
+                pool.ordered.get()
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.close()
+        report.append({"workers": n, "threads_per_worker": pool.threads, "fps": total / elapsed})
+    return report
+
+
+def main(argv=None):
+    from inference_engine import iter_frames
+
+    parser = argparse.ArgumentParser(description="Scaling benchmark for process-pool inference")
+    parser.add_argument("--source", required=True, help="video file, image directory or camera index")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="torch")
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--frames", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    images = [frame for _, _, _, frame in iter_frames(args.source, args.frames)]
+    report = benchmark(images, args.backend, args.weights, args.max_workers)
+    base = report[0]["fps"]
+    print(f"{'workers':>7} {'threads':>7} {'FPS':>8} {'speedup':>8}")
+    for r in report:
+        print(f"{r['workers']:>7} {r['threads_per_worker']:>7} {r['fps']:>8.2f} {r['fps'] / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
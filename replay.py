@@ -0,0 +1,269 @@
+"""
+Deterministic replay of recorded line footage through the detection pipeline.
+
+Reproducing a false reject means pushing exactly the recorded frames through
+the same DetectionPipeline the GUI uses. ReplayCamera is a drop-in
+CameraManager that plays a video file or a frame directory (with its
+timestamps.csv, or file times) instead of a live device:
+
+    speed=1    original timing, from the recorded timestamps
+    speed=4    four times faster
+    speed=0    unthrottled: as fast as the pipeline consumes frames
+
+The pipeline runs lossless during replay, so every frame is inferred and
+tracked in order and two runs over the same recording give the same result
+log. StubPLC stands in for the S7-1200 and remembers every write. The log is
+JSON Lines with one record per frame plus one per board verdict and PLC
+write, without wall-clock times, so runs can be compared with diff. An
+unthrottled run reports the throughput ceiling of the pipeline.
+
+Usage:
+    python replay.py --source recordings/line3_0815.avi --log run_a.jsonl
+    python replay.py --source recordings/frames/ --speed 1 --verdict-address DB1.2 --log run_b.jsonl
+    diff run_a.jsonl run_b.jsonl
+
+In the GUI, PCB_REPLAY_SPEED=0 PCB_CAMERA=recording.avi replays instead of
+opening the camera, and PCB_PLC_STUB=1 connects to a StubPLC.
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+from camera_manager import CameraManager, CameraSource
+from inference_engine import iter_frames
+from s7_client import OperateResult
+
+logger = logging.getLogger(__name__)
+
+
+class ReplaySource(CameraSource):
+    """Plays a recording on the grab thread, paced by its timestamps"""
+
+    def __init__(self, source, speed=0.0, max_buffers=8):
+        super().__init__(source, max_buffers)
+        self.speed = speed
+        self.frames = []            # (timestamp_ms, name) per delivered frame; seq - 1 indexes it
+        self.finished = threading.Event()
+        self._iterator = None
+
+    def open(self):
+        try:
+            self._iterator = iter_frames(self.source)
+            first = next(self._iterator)
+        except (IOError, StopIteration) as e:
+            logger.error(f"Cannot replay {self.source!r}: {e or 'no frames'}")
+            return False
+        self.frames = []
+        self.seq = 0
+        self.finished.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._grab_loop, args=(first,), name="replay", daemon=True)
+        self._thread.start()
+        logger.info(f"Replaying {self.source} at {'unthrottled' if not self.speed else f'{self.speed:g}x'} speed")
+        return True
+
+    def close(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+        self._iterator = None
+        self._latest = None
+        logger.info(f"Replay of {self.source} closed after {self.seq} frames")
+
+    def _grab_loop(self, first):
+        # CameraManager attaches the subscriber after open(); no frame may be played to nobody
+        while not self.subscribers and not self._stop.wait(0.001):
+            pass
+        start_ts = first[1]
+        start = time.perf_counter()
+        item = first
+        while item is not None and not self._stop.is_set():
+            _, timestamp_ms, name, frame = item
+            if self.speed:
+                due = start + (timestamp_ms - start_ts) / 1000.0 / self.speed
+                if self._stop.wait(max(0.0, due - time.perf_counter())):
+                    break
+            metrics.CAMERA_FRAMES.inc(str(self.source))
+            with self.lock:
+                self._latest = frame
+                self.frames.append((timestamp_ms, name))
+                self.seq += 1
+                seq = self.seq
+            view = frame[...]
+            view.flags.writeable = False
+            for sub in list(self.subscribers):
+                if sub.callback:
+                    sub.callback(seq, view)
+            del view, frame
+            item = next(self._iterator, None)
+        if item is None:
+            logger.info(f"Replay of {self.source} finished: {self.seq} frames")
+        self.finished.set()
+
+    def frame_info(self, seq):
+        """(timestamp_ms, name) of a delivered frame"""
+        return self.frames[seq - 1]
+
+
+class ReplayCamera(CameraManager):
+    """CameraManager whose sources are recordings instead of devices"""
+
+    def __init__(self, speed=0.0, max_buffers=8):
+        super().__init__(max_buffers)
+        self.speed = speed
+
+    def create_source(self, source):
+        return ReplaySource(source, self.speed, self.max_buffers)
+
+
+class StubPLC:
+    """In-memory stand-in for S7Client: reads return what was written (default 0/False)"""
+
+    def __init__(self, on_write=None):
+        self.memory = {}
+        self.writes = []            # (address, value) in order
+        self.on_write = on_write    # (address, value) after every write
+        self.connected = True
+
+    def ConnectServer(self):
+        self.connected = True
+        return OperateResult()
+
+    def ConnectClose(self):
+        self.connected = False
+        return OperateResult()
+
+    def ReadBool(self, address):
+        return OperateResult(bool(self.memory.get(str(address), False)))
+
+    def ReadInt16(self, address):
+        return OperateResult(int(self.memory.get(str(address), 0)))
+
+    def ReadFloat(self, address):
+        return OperateResult(float(self.memory.get(str(address), 0.0)))
+
+    def Write(self, address, value):
+        address = str(address)
+        self.memory[address] = value
+        self.writes.append((address, value))
+        if self.on_write:
+            self.on_write(address, value)
+        return OperateResult()
+
+
+class ResultLog:
+    """Diffable JSON Lines log of frames, verdicts and PLC writes"""
+
+    def __init__(self, path, names):
+        self.file = open(path, "w")
+        self.names = names
+        self.lock = threading.Lock()
+
+    def _write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def frame(self, frame_id, timestamp_ms, name, detections):
+        items = []
+        for det in detections:
+            item = {"class": self.names.get(int(det[5]), str(int(det[5]))), "conf": round(float(det[4]), 4),
+                    "box": [round(float(v), 1) for v in det[:4]]}
+            if len(det) > 6:
+                item["id"] = int(det[6])
+            items.append(item)
+        self._write({"frame": frame_id, "timestamp_ms": round(timestamp_ms, 3), "source": name, "detections": items})
+
+    def verdict(self, verdict):
+        self._write({"verdict": verdict})
+
+    def plc_write(self, address, value):
+        self._write({"plc_write": {"address": address, "value": value}})
+
+    def close(self):
+        self.file.close()
+
+
+def run_replay(source, backend, log_path, speed=0.0, gate=None, inspector=None, detect_every=1,
+               plc=None, verdict_address=None):
+    """Replay source through a lossless DetectionPipeline; returns a summary dict"""
+    from PyQt5.QtCore import Qt
+
+    from pipeline import DetectionPipeline
+    from plc_trigger import VERDICT_CODES, write_int16
+
+    camera = ReplayCamera(speed)
+    log = ResultLog(log_path, backend.names)
+    plc = plc or StubPLC()
+    plc.on_write = log.plc_write
+    processed = [0, time.perf_counter()]  # last frame through tracking, when it got there
+
+    def on_result(seq, detections):
+        log.frame(seq - 1, *camera.sources[source].frame_info(seq), detections)
+        processed[:] = seq, time.perf_counter()
+
+    pipeline = DetectionPipeline(backend, camera, source, gate=gate, inspector=inspector,
+                                 detect_every=detect_every, lossless=True, on_result=on_result)
+
+    def on_verdict(verdict):
+        log.verdict(verdict)
+        if verdict_address:
+            write_int16(plc, verdict_address, VERDICT_CODES[verdict["verdict"]])
+
+    # Direct connections: called on the pipeline threads, no Qt event loop needed
+    pipeline.verdict.connect(on_verdict, Qt.DirectConnection)
+    pipeline.frame_ready.connect(lambda image, token: pipeline.renderer.release(token), Qt.DirectConnection)
+    start = time.perf_counter()
+    if not pipeline.start():
+        log.close()
+        raise IOError(f"Cannot replay {source!r}")
+    replay = camera.sources[source]
+    try:
+        replay.finished.wait()
+        # Let the pipeline drain the frames already handed to it (a failed inference never arrives)
+        while processed[0] < replay.seq and time.perf_counter() - processed[1] < 5.0:
+            time.sleep(0.01)
+    finally:
+        elapsed = time.perf_counter() - start
+        pipeline.stop()  # flushes the tracker, so the last boards get their verdicts
+        camera.close()
+        log.close()
+    return {"frames": processed[0], "seconds": elapsed, "fps": processed[0] / elapsed if elapsed > 0 else 0.0,
+            "plc_writes": len(plc.writes), "latency_ms": pipeline.scheduler.stats()["latency_ms"]}
+
+
+def main(argv=None):
+    from backends import BACKENDS, load_backend
+    from inference_engine import parse_roi
+    from motion_gate import MotionGate
+    from tracker import BoardInspector
+
+    parser = argparse.ArgumentParser(description="Replay a recording through the detection pipeline")
+    parser.add_argument("--source", required=True, help="video file or frame directory")
+    parser.add_argument("--log", required=True, help="JSON Lines result log")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = original timing, 0 = unthrottled")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=os.environ.get("PCB_BACKEND", "torch"))
+    parser.add_argument("--weights", default=os.environ.get("PCB_MODEL_PATH") or None)
+    parser.add_argument("--no-track", action="store_true", help="log raw detections without board verdicts")
+    parser.add_argument("--detect-every", type=int, default=int(os.environ.get("PCB_DETECT_EVERY", "1")))
+    parser.add_argument("--gate", action="store_true", help="use the motion gate, as PCB_MOTION_GATE=1 does")
+    parser.add_argument("--gate-roi", default=os.environ.get("PCB_GATE_ROI", ""))
+    parser.add_argument("--verdict-address", default=None, help="write each verdict code to the stub PLC here")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    backend = load_backend(args.backend, args.weights)
+    gate = MotionGate(roi=parse_roi(args.gate_roi)) if args.gate else None
+    inspector = None if args.no_track else BoardInspector(backend.names)
+    summary = run_replay(args.source, backend, args.log, args.speed, gate, inspector, args.detect_every,
+                         verdict_address=args.verdict_address)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Persistent inference result cache keyed by image content.
+
+Re-running detection over data/ captures or cropped/ tiles after a
+post-processing change re-infers identical images. ResultCache stores (N, 6)
+detections in SQLite under (model key, frame hash), bounded by size with
+least-recently-used eviction.
+
+CachedBackend with conf/iou stores the model's candidates before NMS (the
+CANDIDATES_PER_CLASS most confident boxes of each class above CANDIDATE_CONF)
+and applies the confidence threshold and NMS on read, so changing --conf or
+--iou re-uses the cache. NMS on read stops once max_det boxes are kept. The model key hashes the
+weights file with the parameters that change the candidates (imgsz, tiling,
+the candidate floor); new weights or another imgsz stop matching old entries,
+which then age out. Without conf/iou the detections are cached as the backend
+returns them, and every post-processing parameter must be in the key.
+
+Usage:
+    python result_cache.py stats --cache data/results_cache.sqlite
+    python result_cache.py clear --cache data/results_cache.sqlite
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from backends import MAX_DETECTIONS, nms
+
+CACHE_PATH = "data/results_cache.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Lowest confidence kept in the cached candidates; a lower --conf needs its own cache entries
+CANDIDATE_CONF = 0.05
+# NMS is per class and keeps at most MAX_DETECTIONS boxes, so a class's weakest candidates rarely matter
+CANDIDATES_PER_CLASS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 of a file's contents"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def frame_digest(frame):
+    """Content hash of a decoded frame (pixels and shape)"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(frame.shape).encode())
+    h.update(np.ascontiguousarray(frame).data)
+    return h.hexdigest()
+
+
+def model_key(model_path, **params):
+    """Hash of the weights file plus every parameter that changes the detections"""
+    h = hashlib.sha256(file_digest(model_path).encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:32]
+
+
+class ResultCache:
+    """SQLite store of detections per (model key, frame hash) with LRU size bound"""
+
+    def __init__(self, path=CACHE_PATH, model=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.model = model
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " model TEXT NOT NULL, frame TEXT NOT NULL, cols INTEGER NOT NULL, dets BLOB NOT NULL,"
+            " size INTEGER NOT NULL, used REAL NOT NULL, PRIMARY KEY (model, frame)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def get_many(self, frame_keys):
+        """Return {frame_key: detections} for the keys that are cached"""
+        found = {}
+        if not frame_keys:
+            return found
+        with self.lock:
+            unique = list(dict.fromkeys(frame_keys))
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT frame, cols, dets FROM results WHERE model = ? AND frame IN ({','.join('?' * len(chunk))})",
+                    [self.model, *chunk],
+                ).fetchall()
+                for frame, cols, blob in rows:
+                    found[frame] = np.frombuffer(blob, dtype=np.float32).reshape(-1, cols).copy()
+            if found:
+                now = time.time()
+                self.db.executemany(
+                    "UPDATE results SET used = ? WHERE model = ? AND frame = ?",
+                    [(now, self.model, frame) for frame in found],
+                )
+                self.db.commit()
+            hits = sum(key in found for key in frame_keys)
+            self.hits += hits
+            self.misses += len(frame_keys) - hits
+        return found
+
+    def put_many(self, items):
+        """Store [(frame_key, detections), ...] and evict old entries past max_bytes"""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for frame, dets in items:
+            dets = np.ascontiguousarray(dets, dtype=np.float32)
+            blob = dets.tobytes()
+            rows.append((self.model, frame, dets.shape[1] if dets.ndim == 2 else 6, blob, len(blob) + len(frame), now))
+        with self.lock:
+            # Replaced rows must not be counted twice
+            for frame, _ in items:
+                old = self.db.execute(
+                    "SELECT size FROM results WHERE model = ? AND frame = ?", (self.model, frame)
+                ).fetchone()
+                if old:
+                    self.total_bytes -= old[0]
+            self.db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.total_bytes += sum(row[4] for row in rows)
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self.db.commit()
+
+    def _evict(self, target):
+        # Caller holds the lock; drop least recently used rows until under target
+        evicted = 0
+        while self.total_bytes > target:
+            rows = self.db.execute("SELECT model, frame, size FROM results ORDER BY used LIMIT 256").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            victims = []
+            for model, frame, size in rows:
+                if self.total_bytes <= target:
+                    break
+                victims.append((model, frame))
+                self.total_bytes -= size
+            self.db.executemany("DELETE FROM results WHERE model = ? AND frame = ?", victims)
+            evicted += len(victims)
+        logger.debug(f"Result cache evicted {evicted} entries ({self.total_bytes} bytes left)")
+
+    def stats(self):
+        entries, models = self.db.execute("SELECT COUNT(*), COUNT(DISTINCT model) FROM results").fetchone()
+        return {"entries": entries, "models": models, "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM results")
+            self.db.commit()
+            self.total_bytes = 0
+
+    def close(self):
+        self.db.close()
+
+
+def cap_candidates(candidates, per_class=CANDIDATES_PER_CLASS):
+    """The per_class most confident candidates of each class, highest confidence first"""
+    candidates = candidates[candidates[:, 4].argsort()[::-1]]
+    if len(candidates) <= per_class:
+        return candidates
+    cls = candidates[:, 5]
+    # Rank of each candidate within its class (stable sort keeps the confidence order per class)
+    by_class = np.argsort(cls, kind="stable")
+    sorted_cls = cls[by_class]
+    starts = np.searchsorted(sorted_cls, sorted_cls, side="left")
+    rank = np.empty(len(candidates), dtype=np.int64)
+    rank[by_class] = np.arange(len(candidates)) - starts
+    return candidates[rank < per_class]
+
+
+def select(candidates, conf, iou, max_det=MAX_DETECTIONS):
+    """Detections from cached pre-NMS candidates: confidence threshold, class-aware NMS, top max_det"""
+    return nms(candidates[candidates[:, 4] >= conf], iou, max_det)
+
+
+class CachedBackend:
+    """Backend wrapper that only runs the model on frames missing from the cache
+
+    With conf and iou, backend must return pre-NMS candidates (iou=1.0, conf <= CANDIDATE_CONF,
+    uncapped max_det); they are capped per class before storing, and the threshold and NMS are applied
+    on every read.
+    """
+
+    def __init__(self, backend, cache, conf=None, iou=None):
+        self.backend = backend
+        self.cache = cache
+        self.names = backend.names
+        self.conf = conf
+        self.iou = iou
+
+    def predict(self, images):
+        keys = [frame_digest(img) for img in images]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            fresh = self.backend.predict([images[i] for i in missing])
+            if self.conf is not None:
+                fresh = [cap_candidates(dets) for dets in fresh]
+            self.cache.put_many([(keys[i], dets) for i, dets in zip(missing, fresh)])
+            cached.update((keys[i], dets) for i, dets in zip(missing, fresh))
+        if self.conf is None:
+            return [cached[key] for key in keys]
+        return [select(cached[key], self.conf, self.iou) for key in keys]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the inference result cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--cache", default=CACHE_PATH)
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.cache)
+    if args.command == "clear":
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+Inspection results store: every verdict and its defects, for traceability and yield.
+
+Verdicts used to be drawn and forgotten. ResultsStore keeps them in SQLite
+(WAL mode, so readers never block the writer): one row per inspected board and
+one row per detected defect with its track ID, class, confidence and box, plus
+the snapshot path when an image was saved. record() only puts the verdict on a
+queue; a background thread inserts them in batches, one transaction per batch.
+
+Per-shift defect counts are kept in small rollup tables that the same
+transaction updates, so the shift report reads a few rows per shift no matter
+how many detections are stored. Arbitrary time windows are answered from the
+(ts, cls) index, which scans only the rows inside the window. One process
+writes a database at a time.
+
+Usage:
+    python results_store.py shifts --db inspections/inspections.sqlite --days 7
+    python results_store.py counts --db inspections/inspections.sqlite --since "2025-01-06 06:00" --until "2025-01-06 14:00"
+    python results_store.py bench --db /tmp/bench.sqlite --rows 10000000
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+RESULTS_PATH = "inspections/inspections.sqlite"
+# Local start hours of the shifts, e.g. "6,14,22" for three 8-hour shifts
+SHIFT_HOURS = tuple(float(h) for h in os.environ.get("PCB_SHIFTS", "6,14,22").split(","))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS inspections ("
+    " id INTEGER PRIMARY KEY, ts REAL NOT NULL, board_id INTEGER, verdict TEXT NOT NULL,"
+    " source TEXT, snapshot TEXT)",
+    "CREATE TABLE IF NOT EXISTS detections ("
+    " inspection_id INTEGER NOT NULL, ts REAL NOT NULL, track_id INTEGER, cls INTEGER NOT NULL,"
+    " conf REAL, x1 REAL, y1 REAL, x2 REAL, y2 REAL)",
+    "CREATE TABLE IF NOT EXISTS classes (cls INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS shift_boards ("
+    " shift INTEGER PRIMARY KEY, boards INTEGER NOT NULL, ng INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS shift_defects ("
+    " shift INTEGER NOT NULL, cls INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (shift, cls)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE INDEX IF NOT EXISTS inspections_ts ON inspections (ts)",
+    "CREATE INDEX IF NOT EXISTS detections_ts ON detections (ts, cls)",
+    "CREATE INDEX IF NOT EXISTS detections_cls ON detections (cls, ts)",
+    "CREATE INDEX IF NOT EXISTS detections_inspection ON detections (inspection_id)",
+)
+
+
+def shift_start(ts, shifts=SHIFT_HOURS):
+    """Epoch seconds of the start of the shift containing ts (local time)"""
+    dt = datetime.fromtimestamp(ts)
+    midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    start = None
+    for hour in sorted(shifts):
+        candidate = midnight + timedelta(hours=hour)
+        if candidate <= dt:
+            start = candidate
+    if start is None:
+        start = midnight - timedelta(days=1) + timedelta(hours=max(shifts))
+    return int(start.timestamp())
+
+
+def next_shift_start(start, shifts=SHIFT_HOURS):
+    """Epoch seconds of the first shift start after `start`"""
+    dt = datetime.fromtimestamp(start)
+    midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    for hour in sorted(shifts):
+        candidate = midnight + timedelta(hours=hour)
+        if candidate > dt:
+            return int(candidate.timestamp())
+    return int((midnight + timedelta(days=1, hours=min(shifts))).timestamp())
+
+
+def shift_label(start, shifts=SHIFT_HOURS):
+    """'2025-01-06 06:00 (shift 1)' for a shift start from shift_start()"""
+    dt = datetime.fromtimestamp(start)
+    hour = dt.hour + dt.minute / 60
+    number = next((i + 1 for i, h in enumerate(sorted(shifts)) if abs(h - hour) < 1e-6), 0)
+    return f"{dt:%Y-%m-%d %H:%M} (shift {number})"
+
+
+def detections_to_items(detections, board_cls=()):
+    """Store items for the non-board rows of an (N, 6) detection array"""
+    items = []
+    for det in detections:
+        cls = int(det[5])
+        if cls in board_cls:
+            continue
+        track_id = int(det[6]) if len(det) > 6 else None
+        items.append({"track_id": track_id, "cls": cls, "conf": float(det[4]), "box": [float(v) for v in det[:4]]})
+    return items
+
+
+class ResultsStore:
+    """SQLite (WAL) store of inspection verdicts with a batching background writer"""
+
+    def __init__(self, path=RESULTS_PATH, batch_size=500, flush_interval=1.0, max_pending=10000, shifts=SHIFT_HOURS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shifts = tuple(sorted(shifts))
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._writer_db = self._connect()
+        for statement in SCHEMA:
+            self._writer_db.execute(statement)
+        self._writer_db.commit()
+        self._next_id = self._writer_db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM inspections").fetchone()[0]
+        self._shift_cache = (0, 0, 0)  # (start, end, shift) of the last looked-up shift
+        self._check_shift_config()
+        self.db = self._connect()  # readers, used by the query methods
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._write_loop, name="results-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _check_shift_config(self):
+        row = self._writer_db.execute("SELECT value FROM meta WHERE key = 'shifts'").fetchone()
+        config = json.dumps(self.shifts)
+        if row and row[0] != config:
+            logger.info(f"Shift hours changed from {row[0]} to {config}, rebuilding shift rollups")
+            self._rebuild_rollups()
+        self._writer_db.execute("INSERT OR REPLACE INTO meta VALUES ('shifts', ?)", (config,))
+        self._writer_db.commit()
+
+    # ---- Recording ----
+    def record(self, verdict, items=(), board_id=None, snapshot=None, source=None, ts=None, block=False):
+        """Queue one inspected board; items are {"track_id", "cls", "conf", "box"} dicts of its defects.
+        Returns False if the writer is too far behind and the record was dropped (block=False)."""
+        rows = [(item.get("track_id"), int(item["cls"]), float(item.get("conf", 0.0)), *map(float, item["box"]))
+                for item in items]
+        record = (time.time() if ts is None else ts, board_id, verdict, source, snapshot, rows)
+        try:
+            self._queue.put(("record", record), block=block)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"Results store is falling behind, {self.dropped} verdicts dropped")
+            return False
+        with self.lock:
+            self.recorded += 1
+        return True
+
+    def record_verdict(self, verdict, snapshot=None, source=None, block=False):
+        """Record a BoardInspector verdict dict"""
+        return self.record(verdict["verdict"], verdict.get("items", ()), verdict.get("board_id"), snapshot, source,
+                           block=block)
+
+    def set_names(self, names):
+        """Class id -> name, used by the reports"""
+        self._queue.put(("names", dict(names)))
+
+    def flush(self, timeout=None):
+        """Wait until everything recorded so far is committed"""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._writer_db.close()
+            self.db.close()
+
+    def _write_loop(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                message = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                message = ("timeout", None)
+            if message is not None and message[0] == "record":
+                batch.append(message[1])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except sqlite3.Error as e:
+                    logger.error(f"Writing {len(batch)} verdicts to {self.path} failed: {e}")
+                batch, deadline = [], None
+            if message is None:
+                return
+            kind, payload = message
+            if kind == "names":
+                with self._writer_db:
+                    self._writer_db.executemany("INSERT OR REPLACE INTO classes VALUES (?, ?)", payload.items())
+            elif kind == "flush":
+                payload.set()
+
+    def _shift_of(self, ts):
+        start, end, shift = self._shift_cache
+        if not start <= ts < end:
+            shift = shift_start(ts, self.shifts)
+            self._shift_cache = (shift, next_shift_start(shift, self.shifts), shift)
+        return shift
+
+    def _write_batch(self, batch):
+        inspections, detections = [], []
+        boards, defects = {}, {}
+        for ts, board_id, verdict, source, snapshot, rows in batch:
+            inspection_id = self._next_id
+            self._next_id += 1
+            inspections.append((inspection_id, ts, board_id, verdict, source, snapshot))
+            shift = self._shift_of(ts)
+            counts = boards.setdefault(shift, [0, 0])
+            counts[0] += 1
+            counts[1] += verdict == "NG"
+            for row in rows:
+                detections.append((inspection_id, ts, *row))
+                defects[shift, row[1]] = defects.get((shift, row[1]), 0) + 1
+        with self._writer_db:  # one transaction per batch
+            self._writer_db.executemany("INSERT INTO inspections VALUES (?, ?, ?, ?, ?, ?)", inspections)
+            self._writer_db.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", detections)
+            self._writer_db.executemany(
+                "INSERT INTO shift_boards VALUES (?, ?, ?) ON CONFLICT (shift) DO UPDATE"
+                " SET boards = boards + excluded.boards, ng = ng + excluded.ng",
+                [(shift, n, ng) for shift, (n, ng) in boards.items()],
+            )
+            self._writer_db.executemany(
+                "INSERT INTO shift_defects VALUES (?, ?, ?) ON CONFLICT (shift, cls) DO UPDATE"
+                " SET count = count + excluded.count",
+                [(shift, cls, n) for (shift, cls), n in defects.items()],
+            )
+        with self.lock:
+            self.written += len(batch)
+
+    def _rebuild_rollups(self):
+        """Recompute the shift tables from the raw rows, one shift window at a time"""
+        db = self._writer_db
+        first, last = db.execute("SELECT MIN(ts), MAX(ts) FROM inspections").fetchone()
+        with db:
+            db.execute("DELETE FROM shift_boards")
+            db.execute("DELETE FROM shift_defects")
+            if first is None:
+                return
+            self._shift_cache = (0, 0, 0)
+            shift = self._shift_of(first)
+            while shift <= last:
+                end = self._shift_cache[1]
+                boards, ng = db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(verdict = 'NG'), 0) FROM inspections WHERE ts >= ? AND ts < ?",
+                    (shift, end),
+                ).fetchone()
+                if boards:
+                    db.execute("INSERT INTO shift_boards VALUES (?, ?, ?)", (shift, boards, ng))
+                db.execute(
+                    "INSERT INTO shift_defects SELECT ?, cls, COUNT(*) FROM detections"
+                    " WHERE ts >= ? AND ts < ? GROUP BY cls",
+                    (shift, shift, end),
+                )
+                shift = self._shift_of(end)
+
+    # ---- Queries ----
+    def class_names(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT cls, name FROM classes").fetchall())
+
+    def shift_report(self, start=None, end=None):
+        """Boards, NG count, yield and defects per class for every shift starting in [start, end)"""
+        start = 0 if start is None else shift_start(start, self.shifts)
+        end = float("inf") if end is None else end
+        names = self.class_names()
+        with self.lock:
+            boards = self.db.execute(
+                "SELECT shift, boards, ng FROM shift_boards WHERE shift >= ? AND shift < ? ORDER BY shift", (start, end)
+            ).fetchall()
+            defects = self.db.execute(
+                "SELECT shift, cls, count FROM shift_defects WHERE shift >= ? AND shift < ?", (start, end)
+            ).fetchall()
+        per_shift = {}
+        for shift, cls, count in defects:
+            per_shift.setdefault(shift, {})[names.get(cls, str(cls))] = count
+        return [
+            {"shift": shift, "label": shift_label(shift, self.shifts), "boards": n, "ng": ng,
+             "yield": (n - ng) / n if n else None, "defects": per_shift.get(shift, {})}
+            for shift, n, ng in boards
+        ]
+
+    def defect_counts(self, start, end, cls=None):
+        """Defects per class name in an arbitrary [start, end) window, from the detections index"""
+        names = self.class_names()
+        sql = "SELECT cls, COUNT(*) FROM detections WHERE ts >= ? AND ts < ?"
+        params = [start, end]
+        if cls is not None:
+            sql = "SELECT cls, COUNT(*) FROM detections WHERE cls = ? AND ts >= ? AND ts < ?"
+            params = [int(cls), start, end]
+        with self.lock:
+            rows = self.db.execute(sql + " GROUP BY cls", params).fetchall()
+        return {names.get(c, str(c)): n for c, n in rows}
+
+    def detections(self, start, end, cls=None, limit=1000):
+        """Individual defects with their board, box and snapshot, newest first"""
+        sql = ("SELECT d.ts, i.board_id, d.track_id, d.cls, d.conf, d.x1, d.y1, d.x2, d.y2, i.snapshot"
+               " FROM detections d JOIN inspections i ON i.id = d.inspection_id WHERE d.ts >= ? AND d.ts < ?")
+        params = [start, end]
+        if cls is not None:
+            sql += " AND d.cls = ?"
+            params.append(int(cls))
+        sql += " ORDER BY d.ts DESC LIMIT ?"
+        params.append(limit)
+        names = self.class_names()
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return [
+            {"ts": ts, "board_id": board_id, "track_id": track_id, "class": names.get(c, str(c)), "conf": conf,
+             "box": [x1, y1, x2, y2], "snapshot": snapshot}
+            for ts, board_id, track_id, c, conf, x1, y1, x2, y2, snapshot in rows
+        ]
+
+    def stats(self):
+        with self.lock:
+            boards = self.db.execute("SELECT COUNT(*) FROM inspections").fetchone()[0]
+            defects = self.db.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+        return {"boards": boards, "defects": defects, "recorded": self.recorded, "written": self.written,
+                "dropped": self.dropped, "pending": self.pending()}
+
+
+def _parse_time(text):
+    return datetime.strptime(text, "%Y-%m-%d %H:%M").timestamp() if text else None
+
+
+def populate_synthetic(store, rows, days=30, classes=4, seed=0):
+    """Fill the store with about `rows` random defects over the last `days`, two per board on average"""
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    boards = max(1, rows // 2)
+    ts = np.sort(rng.uniform(now - days * 86400, now, boards))
+    counts = rng.poisson(2, boards)
+    track_id = 0
+    for i, (t, n) in enumerate(zip(ts, counts)):
+        items = [{"track_id": track_id + k, "cls": int(rng.integers(1, classes + 1)), "conf": 0.5,
+                  "box": (10.0, 10.0, 40.0, 40.0)} for k in range(n)]
+        track_id += n
+        store.record("NG" if items else "OK", items, board_id=i, ts=float(t), block=True)
+    store.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the inspection results store")
+    parser.add_argument("command", choices=["shifts", "counts", "stats", "bench"])
+    parser.add_argument("--db", default=RESULTS_PATH)
+    parser.add_argument("--days", type=float, default=7, help="shifts: how far back to report")
+    parser.add_argument("--since", default=None, help="counts: window start 'YYYY-MM-DD HH:MM'")
+    parser.add_argument("--until", default=None, help="counts: window end 'YYYY-MM-DD HH:MM' (default now)")
+    parser.add_argument("--rows", type=int, default=1000000, help="bench: synthetic defects to insert")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    store = ResultsStore(args.db, batch_size=5000)
+    try:
+        if args.command == "bench":
+            start = time.perf_counter()
+            populate_synthetic(store, args.rows)
+            insert_s = time.perf_counter() - start
+            start = time.perf_counter()
+            report = store.shift_report(time.time() - 30 * 86400)
+            shifts_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            store.defect_counts(time.time() - 8 * 3600, time.time())
+            window_ms = (time.perf_counter() - start) * 1000
+            print(json.dumps({**store.stats(), "insert_rows_per_s": args.rows / insert_s,
+                              "shift_report_ms": shifts_ms, "shifts": len(report),
+                              "last_8h_counts_ms": window_ms}, indent=2))
+        elif args.command == "shifts":
+            for shift in store.shift_report(time.time() - args.days * 86400):
+                rate = f"{shift['yield']:.1%}" if shift["yield"] is not None else "n/a"
+                print(f"{shift['label']}  boards {shift['boards']:>6}  NG {shift['ng']:>5}  yield {rate}  {shift['defects']}")
+        elif args.command == "counts":
+            since = _parse_time(args.since) or time.time() - 8 * 3600
+            until = _parse_time(args.until) or time.time()
+            print(json.dumps(store.defect_counts(since, until), indent=2))
+        else:
+            print(json.dumps(store.stats(), indent=2))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+"""
+Pure-Python asyncio S7comm client (ISO-on-TCP, RFC 1006) for the S7-1200.
+
+Replaces HslCommunication's SiemensS7Net through pythonnet, which needed a
+.NET runtime, a hard-coded DLL folder and seconds of start-up. It covers what
+the GUI and the trigger loop use:
+
+    ReadBool("M10.0")  ReadInt16("DB1.2")  ReadFloat("DB1.4")  Write(address, bool | int | float)
+
+AsyncS7Client keeps one persistent connection and reconnects on the next call
+after it drops. Every request carries its own PDU reference, so up to the
+negotiated number of jobs (max AMQ) are in flight at once and responses are
+matched as they arrive. S7Client wraps it for blocking code: it runs the event
+loop on a private thread and returns HslCommunication-style results (.Content,
+.IsSuccess, .Message), so it drops into the code written against SiemensS7Net.
+
+Addresses: M10.0, MW10, MD10, I0.1, Q0.0, DB1.2, DB1.2.3, DB1.DBX2.3,
+DB1.DBW2, DB1.DBD4 and V100 (= DB1.100). Data is big-endian as in the PLC.
+
+Usage:
+    python s7_client.py read --ip 192.168.0.1 --address DB1.2 --type int16
+    python s7_client.py write --ip 192.168.0.1 --address M10.0 --type bool --value 1
+    python s7_client.py selftest                 # tests/test_s7_client.py against the in-process server stand-in
+    python s7_client.py bench --latency-ms 2     # sequential vs pipelined requests
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+
+ISO_TCP_PORT = 102
+AREAS = {"I": 0x81, "E": 0x81, "Q": 0x82, "A": 0x82, "M": 0x83, "DB": 0x84}
+# Transport sizes of request items and of data items
+TS_BIT = 0x01
+TS_BYTE = 0x02
+DATA_BIT = 0x03
+DATA_BYTE = 0x04
+DATA_REAL = 0x07
+DATA_OCTET = 0x09
+FUNC_SETUP = 0xF0
+FUNC_READ = 0x04
+FUNC_WRITE = 0x05
+ROSCTR_JOB = 0x01
+ROSCTR_ACK_DATA = 0x03
+COTP_CR = 0xE0
+COTP_CC = 0xD0
+COTP_DT = 0xF0
+RETURN_CODES = {
+    0x01: "hardware fault", 0x03: "access denied", 0x05: "address out of range",
+    0x06: "data type not supported", 0x07: "data type inconsistent", 0x0A: "object does not exist",
+}
+# Bytes a read or write PDU spends on headers, leaving the rest of the PDU for data
+READ_OVERHEAD = 18
+WRITE_OVERHEAD = 28
+
+logger = logging.getLogger(__name__)
+
+_ADDRESS_PATTERNS = [
+    re.compile(r"DB(?P<db>\d+)\.DB(?P<size>[XBWD])(?P<byte>\d+)(?:\.(?P<bit>[0-7]))?$"),
+    re.compile(r"DB(?P<db>\d+)\.(?P<byte>\d+)(?:\.(?P<bit>[0-7]))?$"),
+    re.compile(r"V(?P<byte>\d+)(?:\.(?P<bit>[0-7]))?$"),
+    re.compile(r"(?P<area>[IEQAM])(?P<size>[XBWD])?(?P<byte>\d+)(?:\.(?P<bit>[0-7]))?$"),
+]
+
+
+class S7Error(IOError):
+    """The PLC rejected a request"""
+
+
+class OperateResult:
+    """Same fields as an HslCommunication OperateResult"""
+
+    def __init__(self, content=None, ok=True, message=""):
+        self.Content = content
+        self.IsSuccess = ok
+        self.Message = message
+
+    def __repr__(self):
+        return f"OperateResult({self.Content!r}, ok={self.IsSuccess}, message={self.Message!r})"
+
+
+def parse_address(address):
+    """(area code, db number, byte offset, bit) of an address such as M10.0, DB1.2 or DB1.DBX2.3"""
+    text = str(address).strip().upper()
+    for pattern in _ADDRESS_PATTERNS:
+        m = pattern.match(text)
+        if m:
+            groups = m.groupdict()
+            if groups.get("area"):
+                area, db = AREAS[groups["area"]], 0
+            else:
+                area, db = AREAS["DB"], int(groups.get("db") or 1)  # V memory is DB1
+            return area, db, int(m.group("byte")), int(groups.get("bit") or 0)
+    raise ValueError(f"Unsupported S7 address {address!r}")
+
+
+def encode_value(value):
+    """(transport size, payload) for a write: bool -> bit, int -> 16-bit word, float -> REAL, sequences -> words"""
+    if isinstance(value, bool):
+        return DATA_BIT, bytes([value])
+    if isinstance(value, int):
+        if not -32768 <= value <= 65535:
+            raise ValueError(f"{value} does not fit in a 16-bit word")
+        return DATA_BYTE, struct.pack(">h" if value < 0 else ">H", value)
+    if isinstance(value, float):
+        return DATA_BYTE, struct.pack(">f", value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return DATA_BYTE, bytes(value)
+    if isinstance(value, (list, tuple)):
+        return DATA_BYTE, b"".join(encode_value(int(v))[1] for v in value)
+    # numpy integers and other int-like values
+    return encode_value(int(value))
+
+
+def item_spec(transport, count, area, db, byte, bit=0):
+    """Variable specification of one read/write item (S7ANY addressing)"""
+    return struct.pack(">BBBBHHB", 0x12, 0x0A, 0x10, transport, count, db, area) + (byte * 8 + bit).to_bytes(3, "big")
+
+
+def tpkt(payload):
+    return struct.pack(">BBH", 3, 0, len(payload) + 4) + payload
+
+
+def s7_pdu(rosctr, ref, params, data=b"", error=None):
+    """S7 PDU (behind a COTP data header); ack-data PDUs carry an error class and code"""
+    header = struct.pack(">BBHHHH", 0x32, rosctr, 0, ref, len(params), len(data))
+    if error is not None:
+        header += struct.pack(">BB", *error)
+    return tpkt(b"\x02\xf0\x80" + header + params + data)
+
+
+def parse_s7(payload):
+    """(rosctr, ref, (error class, code) or None, params, data) of an S7 PDU"""
+    proto, rosctr, _, ref, plen, dlen = struct.unpack_from(">BBHHHH", payload)
+    if proto != 0x32:
+        raise S7Error(f"Not an S7 PDU (protocol id {proto:#x})")
+    offset, error = 10, None
+    if rosctr in (0x02, ROSCTR_ACK_DATA):
+        error = tuple(payload[10:12])
+        offset = 12
+    params = payload[offset:offset + plen]
+    return rosctr, ref, error, params, payload[offset + plen:offset + plen + dlen]
+
+
+def data_items(data, count):
+    """[(return code, bytes)] of the data items in a read response"""
+    items, offset = [], 0
+    for _ in range(count):
+        code, transport, length = struct.unpack_from(">BBH", data, offset)
+        size = length if transport in (DATA_REAL, DATA_OCTET) else (length + 7) // 8
+        offset += 4
+        items.append((code, bytes(data[offset:offset + size])))
+        offset += size + (size % 2)  # items are padded to an even length
+    return items
+
+
+async def read_tpkt(reader):
+    """Payload of the next TPKT frame"""
+    header = await reader.readexactly(4)
+    version, _, length = struct.unpack(">BBH", header)
+    if version != 3 or length < 7:
+        raise S7Error(f"Bad TPKT header {header.hex()}")
+    return await reader.readexactly(length - 4)
+
+
+class AsyncS7Client:
+    """One persistent ISO-on-TCP connection with pipelined requests; connects lazily"""
+
+    def __init__(self, host, port=ISO_TCP_PORT, rack=0, slot=1, timeout=2.0, max_jobs=8, pdu_size=480):
+        self.host = host
+        self.port = port
+        self.rack = rack
+        self.slot = slot
+        self.timeout = timeout
+        self.requested_jobs = max_jobs
+        self.requested_pdu = pdu_size
+        self.max_jobs = 1               # negotiated: requests the PLC accepts in parallel
+        self.pdu_size = 240             # negotiated
+        self.requests = 0
+        self._reader = self._writer = None
+        self._reader_task = None
+        self._pending = {}              # PDU reference -> future of (params, data)
+        self._refs = itertools.cycle(range(1, 0x10000))
+        self._jobs = None
+        self._connect_lock = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return
+            await self._disconnect()
+            await asyncio.wait_for(self._open(), self.timeout)
+
+    async def _open(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            # COTP connection request: TPDU size 1024, local TSAP 0x0100, remote TSAP rack/slot
+            tsap = 0x0100 + self.rack * 0x20 + self.slot
+            cr = struct.pack(">BHHB", COTP_CR, 0, 1, 0) + bytes([0xC0, 1, 0x0A, 0xC1, 2, 1, 0, 0xC2, 2]) \
+                + struct.pack(">H", tsap)
+            self._writer.write(tpkt(bytes([len(cr)]) + cr))
+            reply = await read_tpkt(self._reader)
+            if len(reply) < 2 or reply[1] != COTP_CC:
+                raise S7Error(f"PLC {self.host} refused the ISO connection (TSAP {tsap:#06x})")
+            params = struct.pack(">BBHHH", FUNC_SETUP, 0, self.requested_jobs, self.requested_jobs, self.requested_pdu)
+            self._writer.write(s7_pdu(ROSCTR_JOB, 0, params))
+            rosctr, _, error, params, _ = parse_s7((await read_tpkt(self._reader))[3:])
+            if error and any(error):
+                raise S7Error(f"Setup communication rejected: error class {error[0]:#x} code {error[1]:#x}")
+            _, _, self.max_jobs, _, self.pdu_size = struct.unpack_from(">BBHHH", params)
+        except BaseException:
+            self._writer.close()
+            self._reader = self._writer = None
+            raise
+        self.max_jobs = max(1, self.max_jobs)
+        self._jobs = asyncio.Semaphore(self.max_jobs)
+        self._reader_task = asyncio.ensure_future(self._read_loop(self._reader))
+        logger.info(f"Connected to S7 PLC {self.host}:{self.port} (PDU {self.pdu_size} bytes, {self.max_jobs} parallel jobs)")
+
+    async def close(self):
+        task = self._reader_task
+        await self._disconnect()
+        if task is not None:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _disconnect(self, error=None):
+        writer, self._reader, self._writer = self._writer, None, None
+        if self._reader_task and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+        self._reader_task = None
+        if writer is not None:
+            writer.close()
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error or ConnectionError("S7 connection closed"))
+
+    async def _read_loop(self, reader):
+        try:
+            while True:
+                payload = await read_tpkt(reader)
+                if len(payload) < 3 or payload[1] != COTP_DT:
+                    continue
+                rosctr, ref, error, params, data = parse_s7(payload[3:])
+                future = self._pending.pop(ref, None)
+                if future is None or future.done():
+                    continue
+                if error and any(error):
+                    future.set_exception(S7Error(f"PLC error class {error[0]:#x} code {error[1]:#x}"))
+                else:
+                    future.set_result((params, data))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"S7 connection to {self.host} lost: {e}")
+            await self._disconnect(ConnectionError(f"S7 connection lost: {e}"))
+
+    async def request(self, params, data=b""):
+        """Send one job and wait for its ack data; (params, data) of the response"""
+        if not self.connected:
+            await self.connect()
+        async with self._jobs:
+            writer = self._writer
+            if writer is None:
+                raise ConnectionError("S7 connection closed")  # dropped while this job waited for a slot
+            ref = next(self._refs)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[ref] = future
+            self.requests += 1
+            writer.write(s7_pdu(ROSCTR_JOB, ref, params, data))
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self._pending.pop(ref, None)
+                # A lost response leaves the stream in an unknown state: start over on the next call
+                await self._disconnect(TimeoutError(f"No response from {self.host} within {self.timeout}s"))
+                raise TimeoutError(f"No response from {self.host} within {self.timeout}s") from None
+
+    async def read_bytes(self, address, size):
+        """size bytes starting at address; larger reads are split into pipelined PDUs"""
+        area, db, byte, _ = parse_address(address)
+        step = self.pdu_size - READ_OVERHEAD
+        chunks = await asyncio.gather(*(self._read(area, db, byte + i, TS_BYTE, min(step, size - i))
+                                        for i in range(0, size, step)))
+        return b"".join(chunks)
+
+    async def _read(self, area, db, byte, transport, count, bit=0):
+        params, data = await self.request(bytes([FUNC_READ, 1]) + item_spec(transport, count, area, db, byte, bit))
+        (code, value), = data_items(data, 1)
+        if code != 0xFF:
+            raise S7Error(f"Read of area {area:#x} DB{db} byte {byte} failed: {RETURN_CODES.get(code, hex(code))}")
+        return value
+
+    async def read_bool(self, address):
+        area, db, byte, bit = parse_address(address)
+        return bool((await self._read(area, db, byte, TS_BIT, 1, bit))[0] & 1)
+
+    async def read_int16(self, address):
+        return struct.unpack(">h", await self.read_bytes(address, 2))[0]
+
+    async def read_float(self, address):
+        return struct.unpack(">f", await self.read_bytes(address, 4))[0]
+
+    async def write(self, address, value):
+        area, db, byte, bit = parse_address(address)
+        transport, payload = encode_value(value)
+        if len(payload) > self.pdu_size - WRITE_OVERHEAD:
+            raise ValueError(f"{len(payload)} bytes do not fit in one {self.pdu_size}-byte PDU")
+        if transport == DATA_BIT:
+            spec, length = item_spec(TS_BIT, 1, area, db, byte, bit), 1
+        else:
+            spec, length = item_spec(TS_BYTE, len(payload), area, db, byte), len(payload) * 8
+        _, data = await self.request(bytes([FUNC_WRITE, 1]) + spec, struct.pack(">BBH", 0, transport, length) + payload)
+        if data[:1] != b"\xff":
+            code = data[0] if data else None
+            raise S7Error(f"Write to {address} failed: {RETURN_CODES.get(code, code)}")
+
+
+class S7Client:
+    """Blocking SiemensS7Net-style client: AsyncS7Client on a private event loop thread.
+
+    Calls are thread-safe; calls from several threads are pipelined on the one connection.
+    """
+
+    def __init__(self, host, port=ISO_TCP_PORT, rack=0, slot=1, timeout=2.0, max_jobs=8):
+        self.client = AsyncS7Client(host, port, rack, slot, timeout, max_jobs)
+        self.timeout = timeout
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._thread is None:
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self.loop.run_forever, name="s7-client", daemon=True)
+                self._thread.start()
+            return self.loop
+
+    def submit(self, coroutine):
+        """Run a coroutine of self.client on the client loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def call(self, method, *args):
+        """Call an AsyncS7Client method and wait for it (raises on failure)"""
+        # Leave room for one reconnect before the request itself times out
+        return self.submit(getattr(self.client, method)(*args)).result(self.timeout * 3)
+
+    def _result(self, method, *args):
+        try:
+            return OperateResult(self.call(method, *args))
+        except Exception as e:
+            return OperateResult(None, False, str(e) or type(e).__name__)
+
+    def ConnectServer(self):
+        return self._result("connect")
+
+    def ConnectClose(self):
+        result = self._result("close") if self._thread else OperateResult()
+        with self._lock:
+            if self._thread is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join(timeout=2)
+                self.loop.close()
+                self._thread = self.loop = None
+        return result
+
+    def ReadBool(self, address):
+        return self._result("read_bool", address)
+
+    def ReadInt16(self, address):
+        return self._result("read_int16", address)
+
+    def ReadFloat(self, address):
+        return self._result("read_float", address)
+
+    def Write(self, address, value):
+        return self._result("write", address, value)
+
+
+# ------------------ Self-test and benchmark ------------------
+def selftest(*pytest_args):
+    """Run tests/test_s7_client.py (every operation against the in-process server stand-in); pytest's exit code"""
+    import pytest
+
+    tests = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "test_s7_client.py")
+    return pytest.main(["-q", tests, *pytest_args])
+
+
+def benchmark(requests=500, latency_ms=2.0):
+    """Requests per second one at a time vs. pipelined, against the server stand-in with a fixed job latency"""
+    from s7_server import S7Server
+
+    server = S7Server(latency=latency_ms / 1000).start()
+    plc = S7Client("127.0.0.1", server.port)
+    try:
+        plc.ConnectServer()
+        start = time.perf_counter()
+        for i in range(requests):
+            plc.ReadInt16(f"DB1.{2 * (i % 100)}")
+        sequential = time.perf_counter() - start
+        start = time.perf_counter()
+        futures = [plc.submit(plc.client.read_int16(f"DB1.{2 * (i % 100)}")) for i in range(requests)]
+        for future in futures:
+            future.result()
+        pipelined = time.perf_counter() - start
+        return {"requests": requests, "latency_ms": latency_ms, "parallel_jobs": plc.client.max_jobs,
+                "sequential_per_s": round(requests / sequential), "pipelined_per_s": round(requests / pipelined)}
+    finally:
+        plc.ConnectClose()
+        server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="S7comm client for the S7-1200")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("read", "write"):
+        p = sub.add_parser(name)
+        p.add_argument("--ip", required=True)
+        p.add_argument("--port", type=int, default=ISO_TCP_PORT)
+        p.add_argument("--rack", type=int, default=0)
+        p.add_argument("--slot", type=int, default=1)
+        p.add_argument("--address", required=True)
+        p.add_argument("--type", choices=["bool", "int16", "float"], default="int16")
+        if name == "write":
+            p.add_argument("--value", required=True)
+    sub.add_parser("selftest", help="run tests/test_s7_client.py against the in-process server stand-in")
+    bench = sub.add_parser("bench", help="sequential vs pipelined requests against the server stand-in")
+    bench.add_argument("--requests", type=int, default=500)
+    bench.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "selftest":
+        raise SystemExit(selftest())
+    if args.command == "bench":
+        print(json.dumps(benchmark(args.requests, args.latency_ms), indent=2))
+        return
+    plc = S7Client(args.ip, args.port, args.rack, args.slot)
+    try:
+        if args.command == "read":
+            result = {"bool": plc.ReadBool, "int16": plc.ReadInt16, "float": plc.ReadFloat}[args.type](args.address)
+        else:
+            value = {"bool": lambda v: v.lower() in ("1", "true"), "int16": int, "float": float}[args.type](args.value)
+            result = plc.Write(args.address, value)
+    finally:
+        plc.ConnectClose()
+    print(result)
+    if not result.IsSuccess:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+In-process S7comm server stand-in for exercising s7_client without a PLC.
+
+S7Server speaks enough ISO-on-TCP to look like an S7-1200 to the client: the
+COTP connection handshake, setup communication, and single-item read/write
+jobs on the I, Q, M and DB areas, each a fixed-size bytearray (DBs are created
+on first use). Jobs on one connection are handled concurrently, with an
+optional fixed latency per job, so a pipelining client overlaps them as it
+would on a real PLC. The server runs its own event loop on a thread and binds
+to a free local port.
+
+Usage:
+    server = S7Server(latency=0.002).start()
+    plc = S7Client("127.0.0.1", server.port)
+    ...
+    server.stop()
+"""
+
+import asyncio
+import logging
+import struct
+import threading
+
+from s7_client import (
+    COTP_CC, COTP_CR, COTP_DT, DATA_BIT, DATA_BYTE, FUNC_READ, FUNC_SETUP, FUNC_WRITE, ROSCTR_ACK_DATA, TS_BIT,
+    parse_s7, read_tpkt, s7_pdu, tpkt,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class S7Server:
+    """Serve memory areas over S7comm on 127.0.0.1:<port> (port 0 picks a free one)"""
+
+    def __init__(self, host="127.0.0.1", port=0, size=4096, pdu_size=480, max_jobs=3, latency=0.0):
+        self.host = host
+        self.port = port
+        self.size = size                # bytes per area / DB
+        self.pdu_size = pdu_size
+        self.max_jobs = max_jobs        # parallel jobs offered at setup (an S7-1200 offers 3)
+        self.latency = latency          # seconds each job takes
+        self.areas = {}                 # (area code, db) -> bytearray
+        self.requests = 0
+        self.connections = 0
+        self.loop = None
+        self._server = None
+        self._writers = set()
+        self._thread = None
+
+    def area(self, code, db=0):
+        return self.areas.setdefault((code, db), bytearray(self.size))
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self._server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="s7-server", daemon=True)
+        self._thread.start()
+        ready.wait(5)
+        logger.info(f"S7 server stand-in listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.loop.close()
+        self._thread = None
+
+    def drop_connections(self):
+        """Close every client connection, as a PLC restart would; returns once they are closed"""
+        async def close_all():
+            for writer in list(self._writers):
+                writer.close()
+                await writer.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close_all(), self.loop).result(5)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        jobs = set()
+        try:
+            while True:
+                payload = await read_tpkt(reader)
+                if payload[1] == COTP_CR:
+                    cc = struct.pack(">BHHB", COTP_CC, 1, 0, 0) + bytes([0xC0, 1, 0x0A])
+                    writer.write(tpkt(bytes([len(cc)]) + cc))
+                elif payload[1] == COTP_DT:
+                    job = asyncio.ensure_future(self._job(payload[3:], writer))
+                    jobs.add(job)
+                    job.add_done_callback(jobs.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for job in jobs:
+                job.cancel()
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _job(self, pdu, writer):
+        _, ref, _, params, data = parse_s7(pdu)
+        function = params[0]
+        if function == FUNC_SETUP:
+            _, _, jobs, _, pdu_size = struct.unpack_from(">BBHHH", params)
+            reply = struct.pack(">BBHHH", FUNC_SETUP, 0, min(jobs, self.max_jobs), min(jobs, self.max_jobs),
+                                min(pdu_size, self.pdu_size))
+            writer.write(s7_pdu(ROSCTR_ACK_DATA, ref, reply, error=(0, 0)))
+            return
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        transport, count, db, area = struct.unpack_from(">BHHB", params, 5)
+        address = int.from_bytes(params[11:14], "big")
+        byte, bit = divmod(address, 8)
+        memory = self.area(area, db if area == 0x84 else 0)
+        size = 1 if transport == TS_BIT else count
+        if function not in (FUNC_READ, FUNC_WRITE):
+            writer.write(s7_pdu(ROSCTR_ACK_DATA, ref, params[:1], error=(0x81, 0x04)))  # function not supported
+        elif byte + size > len(memory):
+            code = bytes([0x05])
+            body = code + b"\x00\x00\x00" if function == FUNC_READ else code
+            writer.write(s7_pdu(ROSCTR_ACK_DATA, ref, bytes([function, 1]), body, error=(0, 0)))
+        elif function == FUNC_READ:
+            if transport == TS_BIT:
+                body = struct.pack(">BBHB", 0xFF, DATA_BIT, 1, (memory[byte] >> bit) & 1)
+            else:
+                body = struct.pack(">BBH", 0xFF, DATA_BYTE, count * 8) + bytes(memory[byte:byte + count])
+            writer.write(s7_pdu(ROSCTR_ACK_DATA, ref, bytes([FUNC_READ, 1]), body, error=(0, 0)))
+        else:
+            value = data[4:4 + size]
+            if transport == TS_BIT:
+                memory[byte] = (memory[byte] & ~(1 << bit) & 0xFF) | ((value[0] & 1) << bit)
+            else:
+                memory[byte:byte + count] = value
+            writer.write(s7_pdu(ROSCTR_ACK_DATA, ref, bytes([FUNC_WRITE, 1]), b"\xff", error=(0, 0)))
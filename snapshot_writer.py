@@ -0,0 +1,186 @@
+"""
+Background image writer for captures, crops and auto-crop tiles.
+
+cv2.imwrite on the GUI thread freezes the window while a folder is cropped.
+SnapshotWriter encodes JPEG/PNG on a small thread pool (cv2 releases the GIL
+while encoding) and writes each file atomically: the bytes go to a temporary
+file in the target directory, which is then renamed over the final name, so
+readers never see half-written images. The number of pending images is
+bounded; a non-blocking submit is rejected instead of waiting, so capture never
+blocks on a slow disk. Progress is reported per SnapshotBatch.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("jpg", "png")
+
+_name_lock = threading.Lock()
+_last_stamp = [None, 0]
+
+
+def timestamped_name(prefix, timestamp=None):
+    """prefix_YYYYmmdd_HHMMSS_microseconds, with _N appended if this process already issued that stamp"""
+    timestamp = time.time() if timestamp is None else timestamp
+    stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(timestamp)) + f"_{int(timestamp * 1e6) % 1000000:06d}"
+    with _name_lock:
+        if stamp == _last_stamp[0]:
+            _last_stamp[1] += 1
+            return f"{prefix}_{stamp}_{_last_stamp[1]}"
+        _last_stamp[:] = stamp, 0
+    return f"{prefix}_{stamp}"
+
+
+class SnapshotBatch:
+    """Progress of a group of writes (one capture, one crop run, ...)"""
+
+    def __init__(self, label="", on_progress=None, on_done=None):
+        self.label = label
+        self.on_progress = on_progress  # (batch) after every written or failed image, on a writer thread
+        self.on_done = on_done          # (batch) once close() was called and every image is finished
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.paths = []
+        self.closed = False
+        self.lock = threading.Lock()
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self.written + self.failed
+
+    def close(self):
+        """No more images will be added; on_done fires when the pending ones are written"""
+        with self.lock:
+            self.closed = True
+        self._check_done()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def _record(self, path, ok):
+        with self.lock:
+            if ok:
+                self.written += 1
+                self.paths.append(path)
+            else:
+                self.failed += 1
+        if self.on_progress:
+            self.on_progress(self)
+        self._check_done()
+
+    def _check_done(self):
+        with self.lock:
+            done = self.closed and self.finished >= self.submitted and not self._finished.is_set()
+            if done:
+                self._finished.set()
+        if done and self.on_done:
+            self.on_done(self)
+
+
+class SnapshotWriter:
+    """Thread-pool image encoder with atomic writes and a bounded backlog"""
+
+    def __init__(self, workers=2, max_pending=64, fmt="jpg", jpeg_quality=95, png_compression=3, fsync=False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown image format '{fmt}', expected one of {FORMATS}")
+        self.fmt = fmt
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot")
+        self._tmp_ids = itertools.count()
+        self.lock = threading.Lock()
+        self._pending = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.bytes_written = 0
+
+    def submit(self, path, image, batch=None, fmt=None, quality=None, block=False, copy=False):
+        """Queue image for writing to path (extension set from fmt). Returns the final path, or None if rejected.
+
+        block=False never waits: if max_pending images are already queued the image is dropped.
+        copy=True snapshots the pixels first (use it for shared camera buffers).
+        """
+        fmt = fmt or self.fmt
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown image format '{fmt}', expected one of {FORMATS}")
+        path = os.path.splitext(path)[0] + "." + fmt
+        if not self._slots.acquire(blocking=block):
+            with self.lock:
+                self.rejected += 1
+            if batch is not None:
+                with batch.lock:
+                    batch.rejected += 1
+            return None
+        if copy:
+            image = np.array(image)
+        if batch is not None:
+            with batch.lock:
+                batch.submitted += 1
+        with self.lock:
+            self._pending += 1
+        self._pool.submit(self._write, path, image, fmt, quality, batch)
+        return path
+
+    def pending(self):
+        """Images queued or being encoded"""
+        return self._pending
+
+    def close(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def _encode_params(self, fmt, quality):
+        if fmt == "jpg":
+            return [cv2.IMWRITE_JPEG_QUALITY, int(quality if quality is not None else self.jpeg_quality)]
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(quality if quality is not None else self.png_compression)]
+
+    def _write(self, path, image, fmt, quality, batch):
+        ok = False
+        tmp = None
+        try:
+            encoded_ok, data = cv2.imencode("." + fmt, image, self._encode_params(fmt, quality))
+            if not encoded_ok:
+                raise ValueError("encoder returned no data")
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Same directory as the target so the rename is atomic
+            tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}-{next(self._tmp_ids)}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, path)
+            tmp = None
+            ok = True
+        except Exception as e:
+            logger.warning(f"Writing {path} failed: {e}")
+        finally:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            with self.lock:
+                self._pending -= 1
+                if ok:
+                    self.written += 1
+                    self.bytes_written += data.size
+                else:
+                    self.failed += 1
+            self._slots.release()
+        if batch is not None:
+            batch._record(path, ok)
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+from auto_crop import AutoCropJob
+from dedup_index import DEFAULT_DISTANCE, DedupIndex
+
+
+class ListWriter:
+    """SnapshotWriter stand-in that keeps the submitted tiles"""
+
+    def __init__(self):
+        self.tiles = {}
+
+    def submit(self, path, image, block=False, copy=False):
+        self.tiles[path] = image.copy() if copy else image
+        return path
+
+
+def frame(seed):
+    rng = np.random.default_rng(seed)
+    return cv2.resize(rng.integers(0, 255, (16, 24, 3), dtype=np.uint8), (240, 160), interpolation=cv2.INTER_LINEAR)
+
+
+def job(output_dir="auto_cropped", **kwargs):
+    return AutoCropJob(None, 0, ListWriter(), output_dir, 80, 80, **kwargs)
+
+
+def test_default_distance_follows_dedup_index(tmp_path):
+    assert job().max_distance == DEFAULT_DISTANCE
+    dedup = DedupIndex(str(tmp_path / "dedup.sqlite"), max_distance=9)
+    assert job(dedup=dedup).max_distance == 9
+    assert job(dedup=dedup, max_distance=2).max_distance == 2
+    dedup.close()
+
+
+def test_repeated_frame_keeps_no_new_tiles():
+    crop = job()
+    crop._crop(frame(0))
+    assert crop.kept == 6 and len(crop.writer.tiles) == 6
+    crop._crop(frame(0))
+    assert crop.kept == 6 and crop.duplicates == 6
+    crop._crop(frame(1))
+    assert crop.kept == 12
+
+
+def test_dedup_index_skips_stored_tiles(tmp_path):
+    dedup = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    job(dedup=dedup)._crop(frame(0))
+    second = job("cropped", dedup=dedup)  # fresh per-position history, same index
+    second._crop(frame(0))
+    assert second.kept == 0 and second.duplicates == 6
+    dedup.close()
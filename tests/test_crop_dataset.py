@@ -0,0 +1,74 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from crop_dataset import MANIFEST_NAME, MIN_PARALLEL, CropJob
+
+
+def write_image(path, seed, size=(100, 150)):
+    rng = np.random.default_rng(seed)
+    cv2.imwrite(str(path), rng.integers(0, 255, (*size, 3), dtype=np.uint8))
+
+
+def tiles(folder):
+    return sorted(name for name in os.listdir(folder) if not name.startswith("."))
+
+
+def test_second_run_skips_unchanged_images(tmp_path):
+    data, out = tmp_path / "data", tmp_path / "cropped"
+    data.mkdir()
+    for i in range(3):
+        write_image(data / f"capture_{i}.png", i)
+    stats = CropJob(str(data), str(out), 64, 64, workers=1).run()
+    assert stats["processed"] == 3 and stats["tiles"] == 3 * 6  # 150x100 -> 3x2 tiles, edge tiles kept
+    first = tiles(out)
+    assert len(first) == 18
+    stats = CropJob(str(data), str(out), 64, 64, workers=1).run()
+    assert stats["processed"] == 0 and stats["skipped"] == 3
+    assert tiles(out) == first
+
+
+def test_changed_image_replaces_its_tiles(tmp_path):
+    data, out = tmp_path / "data", tmp_path / "cropped"
+    data.mkdir()
+    write_image(data / "a.png", 0)
+    write_image(data / "b.png", 1)
+    CropJob(str(data), str(out), 64, 64, workers=1).run()
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    old = set(manifest["a.png"]["outputs"])
+    write_image(data / "a.png", 2)
+    stats = CropJob(str(data), str(out), 64, 64, workers=1).run()
+    assert stats["processed"] == 1 and stats["removed"] == 6
+    assert not old & set(tiles(out))
+    assert len(tiles(out)) == 12
+
+
+def test_new_parameters_recut_everything(tmp_path):
+    data, out = tmp_path / "data", tmp_path / "cropped"
+    data.mkdir()
+    write_image(data / "a.png", 0)
+    CropJob(str(data), str(out), 64, 64, workers=1).run()
+    stats = CropJob(str(data), str(out), 50, 50, workers=1).run()
+    assert stats["processed"] == 1 and stats["tiles"] == 6
+
+
+def test_subfolders_are_not_cropped(tmp_path):
+    data, out = tmp_path / "data", tmp_path / "cropped"
+    (data / "snapshots").mkdir(parents=True)
+    write_image(data / "a.png", 0)
+    write_image(data / "snapshots" / "ng.png", 1)
+    stats = CropJob(str(data), str(out), 64, 64, workers=1).run()
+    assert stats["scanned"] == 1
+
+
+def test_parallel_run_matches_serial(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    for i in range(MIN_PARALLEL + 2):
+        write_image(data / f"capture_{i}.png", i)
+    serial = CropJob(str(data), str(tmp_path / "serial"), 64, 64, workers=1).run()
+    parallel = CropJob(str(data), str(tmp_path / "parallel"), 64, 64, workers=2).run()
+    assert serial["tiles"] == parallel["tiles"]
+    assert tiles(tmp_path / "serial") == tiles(tmp_path / "parallel")
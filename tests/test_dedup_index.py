@@ -0,0 +1,104 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import dedup_index
+from dedup_index import DedupIndex, HashIndex, dhash
+
+
+def random_hashes(count, seed=0):
+    return np.random.default_rng(seed).integers(0, 2 ** 64 - 1, count, dtype=np.uint64, endpoint=True)
+
+
+def near(h, bits, rng):
+    for bit in rng.choice(64, bits, replace=False):
+        h ^= 1 << int(bit)
+    return h
+
+
+def brute_force(hashes, alive, h, max_distance):
+    diff = np.asarray(hashes, dtype=np.uint64) ^ np.uint64(h)
+    distances = np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    keys = np.flatnonzero((distances <= max_distance) & np.asarray(alive))
+    return sorted((int(distances[key]), int(key)) for key in keys)
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 4, 7, 10])
+def test_query_matches_brute_force(max_distance):
+    rng = np.random.default_rng(1)
+    hashes = [int(h) for h in random_hashes(20000)]
+    # Clusters of near-duplicates so queries have hits
+    hashes += [near(hashes[i], int(rng.integers(0, 12)), rng) for i in range(0, 20000, 20)]
+    index = HashIndex()
+    index.add_many(list(range(len(hashes) - 500)), hashes[:-500])  # sorted tables
+    for key in range(len(hashes) - 500, len(hashes)):
+        index.add(key, hashes[key])  # unsorted tail
+    alive = [True] * len(hashes)
+    for key in rng.choice(len(hashes), 300, replace=False):
+        index.remove(int(key))
+        alive[key] = False
+    probes = [near(hashes[i], int(rng.integers(0, 10)), rng) for i in rng.integers(0, len(hashes), 150)]
+    probes += [int(h) for h in random_hashes(50, seed=2)]
+    for h in probes:
+        assert index.query(h, max_distance) == brute_force(hashes, alive, h, max_distance)
+
+
+def test_readded_key_replaces_its_hash():
+    index = HashIndex()
+    index.add("a", 0)
+    index.add("a", (1 << 64) - 1)
+    assert index.query(0, 4) == []
+    assert index.query((1 << 64) - 1, 0) == [(0, "a")]
+    assert len(index) == 1
+
+
+def test_popcount_fallback_matches(monkeypatch):
+    values = np.concatenate([random_hashes(1000), np.array([0, (1 << 64) - 1], dtype=np.uint64)])
+    expected = [bin(int(v)).count("1") for v in values]
+    assert dedup_index._popcount(values).tolist() == expected
+    monkeypatch.delattr(np, "bitwise_count", raising=False)
+    assert dedup_index._popcount(values).tolist() == expected
+    assert dedup_index._popcount(values.reshape(2, -1)).shape == (2, 501)
+
+
+def board(seed, noise=0):
+    rng = np.random.default_rng(seed)
+    image = cv2.resize(rng.integers(0, 255, (8, 8), dtype=np.uint8), (160, 120), interpolation=cv2.INTER_LINEAR)
+    if noise:
+        image = cv2.add(image, np.full_like(image, noise))
+    return image
+
+
+def test_check_and_add_and_reload(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    index = DedupIndex(path)
+    assert index.check_and_add("data/a.jpg", board(0)) is None
+    assert index.check_and_add("data/b.jpg", board(0, noise=3)) == os.path.normpath("data/a.jpg")
+    assert index.check_and_add("data/c.jpg", board(1)) is None
+    index.close()
+    index = DedupIndex(path)
+    assert index.find(dhash(board(1)))[0] == os.path.normpath("data/c.jpg")
+    index.close()
+
+
+def test_scan_and_prune_keep_oldest(tmp_path):
+    folder = tmp_path / "data"
+    (folder / "nested").mkdir(parents=True)
+    for i, (name, image) in enumerate([("a.jpg", board(0)), ("b.jpg", board(0, noise=3)), ("c.jpg", board(1))]):
+        cv2.imwrite(str(folder / name), image)
+        os.utime(folder / name, ns=(10 ** 18 + i, 10 ** 18 + i))
+    cv2.imwrite(str(folder / "nested" / "d.jpg"), board(0))
+    (folder / "b.txt").write_text("0 0.5 0.5 1 1\n")
+    index = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    assert index.scan([str(folder)])["hashed"] == 3
+    stats, duplicates = index.prune([str(folder)])
+    assert duplicates == [os.path.normpath(str(folder / "b.jpg"))]
+    assert sorted(os.listdir(folder)) == ["a.jpg", "c.jpg", "nested"]
+    # A shard tile registered as it was written survives a scan of its folder
+    shard_tile = os.path.join(str(tmp_path / "auto.shards"), "tile_0.jpg")
+    index.add(shard_tile, dhash(board(2)))
+    index.scan([str(tmp_path / "auto.shards"), str(folder)])
+    assert index.find(dhash(board(2)), 0)[0] == os.path.normpath(shard_tile)
+    index.close()
@@ -0,0 +1,66 @@
+import threading
+
+from frame_scheduler import FrameScheduler
+
+
+def test_pipelined_interval_is_slowest_stage():
+    scheduler = FrameScheduler(alpha=1.0)
+    scheduler.record("inference", 0.030)
+    scheduler.record("render", 0.005)
+    assert scheduler.interval() == 0.030
+
+
+def test_serial_interval_adds_stages():
+    scheduler = FrameScheduler(serial=True, alpha=1.0)
+    scheduler.record("decode", 0.010)
+    scheduler.record("render", 0.005)
+    assert abs(scheduler.interval() - 0.015) < 1e-9
+
+
+def test_target_fps_caps_interval():
+    scheduler = FrameScheduler(target_fps=10)
+    scheduler.record("render", 0.001)
+    assert scheduler.interval() == 0.1
+
+
+def test_admit_drops_early_frames():
+    scheduler = FrameScheduler(alpha=1.0)
+    scheduler.record("inference", 0.1)
+    # After an idle period one extra frame is let through, then the pace holds
+    assert scheduler.admit(now=10.0)
+    assert scheduler.admit(now=10.0)
+    assert not scheduler.admit(now=10.05)
+    assert scheduler.admit(now=10.1)
+    assert not scheduler.admit(now=10.15)
+    assert scheduler.dropped == 2
+
+
+def test_fps_over_window():
+    scheduler = FrameScheduler(window=2.0)
+    for i in range(11):
+        scheduler.frame_done(now=100.0 + i * 0.1)
+    assert abs(scheduler.fps() - 10.0) < 1e-6
+    assert scheduler.shown == 11
+
+
+def test_stats_while_stages_are_added():
+    scheduler = FrameScheduler()
+    stop = threading.Event()
+
+    def record():
+        i = 0
+        while not stop.is_set():
+            scheduler.record(f"stage{i % 500}", 0.001)
+            i += 1
+
+    thread = threading.Thread(target=record)
+    thread.start()
+    try:
+        for _ in range(2000):
+            scheduler.stats()
+            scheduler.summary()
+            scheduler.admit()
+    finally:
+        stop.set()
+        thread.join()
+    assert len(scheduler.latencies()) == 500
@@ -0,0 +1,39 @@
+import threading
+import time
+
+from pipeline import DropOldestQueue
+
+
+def test_put_drops_oldest_when_full():
+    queue = DropOldestQueue(maxsize=2)
+    assert not queue.put(1)
+    assert not queue.put(2)
+    assert queue.put(3)
+    assert queue.dropped == 1
+    assert [queue.get(0), queue.get(0)] == [2, 3]
+    assert queue.get(0.01) is None
+
+
+def test_get_waits_for_an_item():
+    queue = DropOldestQueue()
+    threading.Timer(0.05, queue.put, args=("frame",)).start()
+    assert queue.get(timeout=2) == "frame"
+
+
+def test_put_wait_blocks_until_room():
+    queue = DropOldestQueue(maxsize=1)
+    queue.put("a")
+    assert not queue.put_wait("b", timeout=0.02)
+    threading.Timer(0.05, queue.get).start()
+    start = time.perf_counter()
+    assert queue.put_wait("b", timeout=2)
+    assert time.perf_counter() - start >= 0.04
+    assert queue.dropped == 0 and queue.get(0) == "b"
+
+
+def test_clear_wakes_put_wait():
+    queue = DropOldestQueue(maxsize=1)
+    queue.put("a")
+    threading.Timer(0.05, queue.clear).start()
+    assert queue.put_wait("b", timeout=2)
+    assert len(queue) == 1
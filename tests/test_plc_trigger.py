@@ -0,0 +1,112 @@
+import threading
+import time
+
+import numpy as np
+
+from plc_trigger import VERDICT_CODES, EdgeDetector, TriggeredInspection
+from replay import StubPLC
+
+
+def test_first_reading_is_the_baseline():
+    detector = EdgeDetector(debounce=0.0)
+    assert detector.update(True, 0.0) is None
+    assert detector.update(True, 1.0) is None
+
+
+def test_rising_edge_after_debounce():
+    detector = EdgeDetector(debounce=0.02)
+    detector.update(False, 0.0)
+    assert detector.update(True, 1.0) is None
+    assert detector.update(True, 1.01) is None
+    assert detector.update(True, 1.03) == 1.0  # the time the edge was first seen
+    assert detector.update(True, 1.05) is None
+
+
+def test_glitch_shorter_than_debounce_is_ignored():
+    detector = EdgeDetector(debounce=0.02)
+    detector.update(False, 0.0)
+    detector.update(True, 1.0)
+    assert detector.update(False, 1.01) is None
+    assert detector.update(False, 1.05) is None
+    assert detector.state is False
+
+
+def test_falling_edge_is_not_reported():
+    detector = EdgeDetector(debounce=0.0)
+    detector.update(True, 0.0)
+    assert detector.update(False, 1.0) is None
+    assert detector.state is False
+
+
+def test_counter_reports_every_change():
+    detector = EdgeDetector(debounce=0.0, counter=True)
+    detector.update(7, 0.0)
+    assert detector.update(8, 1.0) == 1.0
+    assert detector.update(7, 2.0) == 2.0  # wrap-around or reset still counts
+
+
+class Camera:
+    """CameraManager stand-in: a thread delivers frames until closed"""
+
+    def __init__(self):
+        self.stop = threading.Event()
+
+    def subscribe(self, source, callback):
+        def run():
+            seq = 0
+            while not self.stop.wait(0.005):
+                seq += 1
+                callback(seq, np.zeros((4, 4, 3), dtype=np.uint8))
+
+        threading.Thread(target=run, daemon=True).start()
+        return self
+
+    def close(self):
+        self.stop.set()
+
+
+class Backend:
+    names = {0: "pcb", 1: "short"}
+
+    def __init__(self, detections=None, error=None):
+        self.detections = np.zeros((0, 6), dtype=np.float32) if detections is None else detections
+        self.error = error
+
+    def predict(self, images):
+        if self.error:
+            raise self.error
+        return [self.detections for _ in images]
+
+
+def run_triggers(backend, pulses=2):
+    plc = StubPLC()
+    inspection = TriggeredInspection(plc, backend, Camera(), trigger_address="M10.0", verdict_address="DB1.2",
+                                     poll_interval=0.002, debounce=0.004)
+    assert inspection.start()
+    try:
+        for _ in range(pulses):
+            time.sleep(0.03)
+            plc.memory["M10.0"] = True
+            time.sleep(0.03)
+            plc.memory["M10.0"] = False
+        deadline = time.monotonic() + 2
+        while len([w for w in plc.writes if w[0] == "DB1.2"]) < pulses and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        inspection.stop()
+    return inspection, [value for address, value in plc.writes if address == "DB1.2"]
+
+
+def test_verdict_written_per_trigger():
+    defect = np.array([[0, 0, 2, 2, 0.9, 1]], dtype=np.float32)
+    inspection, verdicts = run_triggers(Backend(defect))
+    assert verdicts == [VERDICT_CODES["NG"]] * 2
+    assert inspection.count == 2
+    inspection, verdicts = run_triggers(Backend())
+    assert verdicts == [VERDICT_CODES["OK"]] * 2
+
+
+def test_failed_inference_answers_ng_and_keeps_polling():
+    inspection, verdicts = run_triggers(Backend(error=RuntimeError("model crashed")), pulses=3)
+    assert verdicts == [VERDICT_CODES["NG"]] * 3
+    assert inspection.failed == 3 and inspection.trigger.edges == 3
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from backends import nms
+from result_cache import CANDIDATES_PER_CLASS, CachedBackend, ResultCache, cap_candidates, frame_digest, select
+
+
+def random_candidates(n, classes=3, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 600, (n, 2))
+    wh = rng.uniform(5, 80, (n, 2))
+    conf = rng.uniform(0.05, 1.0, (n, 1))
+    cls = rng.integers(0, classes, (n, 1))
+    return np.hstack([xy, xy + wh, conf, cls]).astype(np.float32)
+
+
+class CandidateBackend:
+    """Returns fixed pre-NMS candidates and counts model calls"""
+
+    names = {0: "a", 1: "b", 2: "c"}
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.calls = 0
+
+    def predict(self, images):
+        self.calls += len(images)
+        return [self.candidates.copy() for _ in images]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), model="m")
+    yield cache
+    cache.close()
+
+
+def test_cap_candidates_keeps_top_per_class():
+    candidates = random_candidates(3000)
+    capped = cap_candidates(candidates, per_class=100)
+    for cls in range(3):
+        mine = candidates[candidates[:, 5] == cls]
+        expected = np.sort(mine[:, 4])[::-1][:100]
+        assert np.array_equal(np.sort(capped[capped[:, 5] == cls][:, 4])[::-1], expected)
+    assert np.all(np.diff(capped[:, 4]) <= 0)
+
+
+def test_select_matches_full_nms():
+    candidates = random_candidates(4000)
+    for conf, iou, max_det in [(0.25, 0.45, 300), (0.5, 0.7, 50), (0.05, 0.3, 1000)]:
+        expected = nms(candidates[candidates[:, 4] >= conf], iou)[:max_det]
+        assert np.array_equal(select(candidates, conf, iou, max_det), expected)
+
+
+def test_cached_candidates_give_the_same_detections(cache):
+    candidates = random_candidates(500)
+    backend = CandidateBackend(candidates)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    first = CachedBackend(backend, cache, conf=0.25, iou=0.45).predict([frame])[0]
+    assert np.array_equal(first, select(candidates, 0.25, 0.45))
+    # Another conf/iou reads the same entry
+    second = CachedBackend(backend, cache, conf=0.6, iou=0.3).predict([frame])[0]
+    assert backend.calls == 1
+    assert np.array_equal(second, select(candidates, 0.6, 0.3))
+
+
+def test_stored_candidates_are_capped(cache):
+    backend = CandidateBackend(random_candidates(5 * CANDIDATES_PER_CLASS, classes=2))
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    CachedBackend(backend, cache, conf=0.25, iou=0.45).predict([frame])
+    stored = cache.get_many([frame_digest(frame)])[frame_digest(frame)]
+    assert len(stored) == 2 * CANDIDATES_PER_CLASS
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), model="m", max_bytes=2000)
+    dets = np.zeros((10, 6), dtype=np.float32)
+    for i in range(10):
+        cache.put_many([(f"frame{i}", dets)])
+    assert cache.total_bytes <= 2000
+    assert "frame9" in cache.get_many(["frame9"])
+    assert "frame0" not in cache.get_many(["frame0"])
+    cache.close()
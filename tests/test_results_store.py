@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+
+from results_store import ResultsStore, next_shift_start, shift_start
+
+SHIFTS = (6, 14, 22)
+
+
+def at(text):
+    return datetime.strptime(text, "%Y-%m-%d %H:%M").timestamp()
+
+
+@pytest.mark.parametrize("ts, start", [
+    ("2025-01-06 06:00", "2025-01-06 06:00"),
+    ("2025-01-06 13:59", "2025-01-06 06:00"),
+    ("2025-01-06 23:30", "2025-01-06 22:00"),
+    ("2025-01-07 05:59", "2025-01-06 22:00"),  # night shift crosses midnight
+])
+def test_shift_start(ts, start):
+    assert shift_start(at(ts), SHIFTS) == at(start)
+
+
+def test_next_shift_start_wraps_to_the_next_day():
+    assert next_shift_start(at("2025-01-06 14:00"), SHIFTS) == at("2025-01-06 22:00")
+    assert next_shift_start(at("2025-01-06 22:00"), SHIFTS) == at("2025-01-07 06:00")
+
+
+def defect(cls):
+    return {"track_id": 1, "cls": cls, "conf": 0.8, "box": [0, 0, 10, 10]}
+
+
+def fill(store):
+    store.set_names({1: "short", 2: "open"})
+    records = [
+        ("2025-01-06 07:00", "OK", []),
+        ("2025-01-06 08:00", "NG", [defect(1), defect(2)]),
+        ("2025-01-06 15:00", "NG", [defect(1)]),
+        ("2025-01-06 23:00", "OK", []),
+        ("2025-01-07 02:00", "NG", [defect(2)]),
+    ]
+    for ts, verdict, items in records:
+        assert store.record(verdict, items, ts=at(ts), block=True)
+    assert store.flush(5)
+
+
+def test_shift_rollups(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"), batch_size=2, shifts=SHIFTS)
+    fill(store)
+    report = store.shift_report()
+    assert [(r["shift"], r["boards"], r["ng"], r["defects"]) for r in report] == [
+        (at("2025-01-06 06:00"), 2, 1, {"short": 1, "open": 1}),
+        (at("2025-01-06 14:00"), 1, 1, {"short": 1}),
+        (at("2025-01-06 22:00"), 2, 1, {"open": 1}),
+    ]
+    assert report[0]["yield"] == 0.5
+    assert store.defect_counts(at("2025-01-06 06:00"), at("2025-01-06 16:00")) == {"short": 2, "open": 1}
+    assert store.defect_counts(at("2025-01-06 00:00"), at("2025-01-08 00:00"), cls=2) == {"open": 2}
+    store.close()
+
+
+def test_rollups_rebuilt_when_shifts_change(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    store = ResultsStore(path, shifts=SHIFTS)
+    fill(store)
+    store.close()
+    store = ResultsStore(path, shifts=(0, 12))
+    report = store.shift_report()
+    assert [(r["shift"], r["boards"], r["ng"]) for r in report] == [
+        (at("2025-01-06 00:00"), 2, 1),
+        (at("2025-01-06 12:00"), 2, 1),
+        (at("2025-01-07 00:00"), 1, 1),
+    ]
+    assert sum(sum(r["defects"].values()) for r in report) == 4
+    store.close()
+
+
+def test_records_survive_reopen(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    store = ResultsStore(path, shifts=SHIFTS)
+    fill(store)
+    store.close()
+    store = ResultsStore(path, shifts=SHIFTS)
+    assert store.record("OK", ts=at("2025-01-07 03:00"), block=True)
+    store.flush(5)
+    assert store.stats()["boards"] == 6
+    assert store.shift_report(at("2025-01-06 22:00"))[0]["boards"] == 3
+    store.close()
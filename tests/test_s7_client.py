@@ -0,0 +1,135 @@
+import time
+
+import pytest
+
+from s7_client import AREAS, TS_BYTE, S7Client, S7Error, item_spec, parse_address
+from s7_server import S7Server
+
+
+@pytest.fixture
+def server():
+    server = S7Server().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def plc(server):
+    plc = S7Client("127.0.0.1", server.port, timeout=1.0)
+    assert plc.ConnectServer().IsSuccess
+    yield plc
+    plc.ConnectClose()
+
+
+@pytest.mark.parametrize("address, expected", [
+    ("M10.3", (AREAS["M"], 0, 10, 3)),
+    ("MW20", (AREAS["M"], 0, 20, 0)),
+    ("I0.1", (AREAS["I"], 0, 0, 1)),
+    ("Q0.0", (AREAS["Q"], 0, 0, 0)),
+    ("DB1.2", (AREAS["DB"], 1, 2, 0)),
+    ("DB1.2.3", (AREAS["DB"], 1, 2, 3)),
+    ("DB1.DBX2.3", (AREAS["DB"], 1, 2, 3)),
+    ("db2.dbd8", (AREAS["DB"], 2, 8, 0)),
+    ("V100", (AREAS["DB"], 1, 100, 0)),
+])
+def test_parse_address(address, expected):
+    assert parse_address(address) == expected
+
+
+def test_int16_roundtrip(plc):
+    assert plc.Write("DB1.2", 1234).IsSuccess
+    assert plc.ReadInt16("DB1.2").Content == 1234
+    assert plc.Write("DB1.DBW4", -2).IsSuccess
+    assert plc.ReadInt16("DB1.4").Content == -2
+
+
+def test_unsigned_word_reads_back_signed(plc):
+    assert plc.Write("MW20", 65535).IsSuccess
+    assert plc.ReadInt16("MW20").Content == -1
+
+
+def test_float_roundtrip(plc):
+    assert plc.Write("DB2.8", 3.25).IsSuccess
+    assert plc.ReadFloat("DB2.DBD8").Content == 3.25
+
+
+def test_bit_write_touches_only_its_bit(plc, server):
+    assert plc.Write("M10.3", True).IsSuccess
+    assert plc.ReadBool("M10.3").Content is True
+    assert plc.ReadBool("M10.2").Content is False
+    assert server.area(AREAS["M"])[10] == 0b1000
+    assert plc.Write("DB1.DBX0.7", True).IsSuccess
+    assert plc.ReadBool("DB1.0.7").Content is True
+    assert plc.Write("DB1.DBX0.7", False).IsSuccess
+    assert plc.ReadBool("DB1.0.7").Content is False
+
+
+def test_word_list_write(plc):
+    assert plc.Write("DB3.0", [1, 2, 3]).IsSuccess
+    assert plc.call("read_bytes", "DB3.0", 6) == b"\0\1\0\2\0\3"
+
+
+def test_large_read_is_split_over_pdus(plc, server):
+    data = bytes(range(256)) * 8
+    server.area(AREAS["DB"], 4)[:len(data)] = data
+    before = server.requests
+    assert plc.call("read_bytes", "DB4.0", len(data)) == data
+    assert server.requests - before > 1
+
+
+def test_requests_are_pipelined():
+    server = S7Server(latency=0.05, max_jobs=3).start()
+    plc = S7Client("127.0.0.1", server.port)
+    try:
+        assert plc.ConnectServer().IsSuccess
+        server.area(AREAS["DB"], 1)[:20] = bytes(range(20))
+        start = time.perf_counter()
+        futures = [plc.submit(plc.client.read_int16(f"DB1.{2 * i}")) for i in range(9)]
+        values = [future.result(5) for future in futures]
+        elapsed = time.perf_counter() - start
+        assert values == [(2 * i) * 256 + 2 * i + 1 for i in range(9)]
+        assert plc.client.max_jobs == 3
+        assert elapsed < 9 * 0.05 * 0.75  # three jobs in flight, not one
+    finally:
+        plc.ConnectClose()
+        server.stop()
+
+
+def test_write_larger_than_pdu_fails(plc):
+    result = plc.Write("DB4.0", bytes(1000))
+    assert not result.IsSuccess and "PDU" in result.Message
+
+
+def test_out_of_range_read_and_write(plc, server):
+    result = plc.ReadInt16(f"DB1.{server.size}")
+    assert not result.IsSuccess and "out of range" in result.Message
+    result = plc.Write(f"DB1.{server.size}", 1)
+    assert not result.IsSuccess and "out of range" in result.Message
+
+
+def test_plc_error_class_is_raised(plc):
+    params = bytes([0x1A, 1]) + item_spec(TS_BYTE, 2, AREAS["DB"], 1, 0)  # not a read or write
+    with pytest.raises(S7Error, match="error class 0x81"):
+        plc.call("request", params)
+    assert plc.ReadInt16("DB1.0").IsSuccess  # the connection is still usable
+
+
+def test_bad_address_fails(plc):
+    result = plc.ReadInt16("X1")
+    assert not result.IsSuccess and "Unsupported" in result.Message
+
+
+def test_reconnects_after_drop(plc, server):
+    assert plc.Write("DB1.2", 1234).IsSuccess
+    server.drop_connections()
+    deadline = time.monotonic() + 2
+    while plc.client.connected and time.monotonic() < deadline:
+        time.sleep(0.01)  # the reader task notices the drop
+    assert not plc.client.connected
+    assert plc.ReadInt16("DB1.2").Content == 1234
+    assert server.connections == 2
+
+
+def test_item_spec_bit_address():
+    spec = item_spec(TS_BYTE, 2, AREAS["DB"], 7, 3, 5)
+    assert spec[:3] == b"\x12\x0a\x10" and int.from_bytes(spec[-3:], "big") == 3 * 8 + 5
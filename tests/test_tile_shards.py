@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+from tile_shards import INDEX_DTYPE, ShardReader, ShardWriter
+
+
+def tile(seed, shape=(32, 48, 3)):
+    return np.random.default_rng(seed).integers(0, 255, shape, dtype=np.uint8)
+
+
+def test_raw_tiles_roundtrip(tmp_path):
+    writer = ShardWriter(str(tmp_path / "t.shards"), codec="raw")
+    for i in range(5):
+        writer.add(f"tile_{i}.raw", tile(i))
+    writer.close()
+    reader = ShardReader(str(tmp_path / "t.shards"))
+    assert len(reader) == 5
+    assert np.array_equal(reader.get("tile_3.raw"), tile(3))
+    assert not reader[0].flags.writeable  # a view of the mapping
+    reader.close()
+
+
+def test_png_tiles_roundtrip(tmp_path):
+    writer = ShardWriter(str(tmp_path / "t.shards"), codec="png")
+    writer.add("gray.png", tile(0, (20, 20)))
+    writer.add("color.png", tile(1))
+    writer.close()
+    reader = ShardReader(str(tmp_path / "t.shards"))
+    assert np.array_equal(reader.get("gray.png")[:, :, 0], tile(0, (20, 20)))
+    assert np.array_equal(reader.get("color.png"), tile(1))
+    reader.close()
+
+
+def test_new_shard_when_full(tmp_path):
+    writer = ShardWriter(str(tmp_path / "t.shards"), codec="raw", shard_bytes=10000)
+    for i in range(4):
+        writer.add(f"tile_{i}.raw", tile(i))  # 4608 bytes each
+    writer.close()
+    assert sorted(os.listdir(tmp_path / "t.shards"))[-1] == "shard-00001.idx"
+    reader = ShardReader(str(tmp_path / "t.shards"))
+    assert [reader.name(i) for i in range(4)] == [f"tile_{i}.raw" for i in range(4)]
+    assert np.array_equal(reader[3], tile(3))
+    reader.close()
+
+
+def test_torn_record_is_cut_off_on_reopen(tmp_path):
+    directory = str(tmp_path / "t.shards")
+    writer = ShardWriter(directory, codec="raw")
+    writer.add("a.raw", tile(0))
+    writer.add("b.raw", tile(1))
+    writer.close()
+    # A crash mid-append: data without its index record, and half a record
+    with open(os.path.join(directory, "shard-00000.bin"), "ab") as f:
+        f.write(b"\xff" * 3000)
+    with open(os.path.join(directory, "shard-00000.idx"), "ab") as f:
+        f.write(b"\x01" * (INDEX_DTYPE.itemsize // 2))
+    writer = ShardWriter(directory, codec="raw")
+    writer.add("c.raw", tile(2))
+    writer.close()
+    reader = ShardReader(directory)
+    assert sorted(reader.names()) == ["a.raw", "b.raw", "c.raw"]
+    for name, seed in (("a.raw", 0), ("b.raw", 1), ("c.raw", 2)):
+        assert np.array_equal(reader.get(name), tile(seed))
+    reader.close()
+
+
+def test_reader_refresh_sees_appended_tiles(tmp_path):
+    writer = ShardWriter(str(tmp_path / "t.shards"), codec="raw")
+    writer.add("a.raw", tile(0))
+    writer.flush()
+    reader = ShardReader(str(tmp_path / "t.shards"))
+    assert len(reader) == 1
+    writer.add("b.raw", tile(1))
+    writer.flush()
+    assert reader.refresh() == 2
+    assert np.array_equal(reader.get("b.raw"), tile(1))
+    reader.close()
+    writer.close()
+
+
+def test_long_names_are_rejected(tmp_path):
+    writer = ShardWriter(str(tmp_path / "t.shards"))
+    with pytest.raises(ValueError):
+        writer.add("x" * 60 + ".jpg", tile(0))
+    assert writer.submit("auto_cropped/" + "x" * 60 + ".jpg", tile(0)) is None
+    assert writer.failed == 1
+    writer.close()
@@ -0,0 +1,60 @@
+import numpy as np
+
+from tracker import BoardInspector, Tracker
+
+NAMES = {0: "pcb", 1: "short", 2: "open"}
+
+
+def board_pass(inspector, defects, frames=10, empty=40):
+    """Feed a board (with defects as (conf, cls) pairs) through the view, then empty frames"""
+    verdicts = []
+    inspector.on_verdict = verdicts.append
+    for i in range(frames):
+        dets = [[100 + i * 5, 100, 400 + i * 5, 300, 0.9, 0]]
+        dets += [[200 + i * 5, 150, 220 + i * 5, 170, conf, cls] for conf, cls in defects]
+        inspector.step(np.array(dets, dtype=np.float32))
+    for _ in range(empty):
+        inspector.step(np.zeros((0, 6), dtype=np.float32))
+    return verdicts
+
+
+def test_clean_board_is_ok():
+    verdicts = board_pass(BoardInspector(NAMES), [])
+    assert [v["verdict"] for v in verdicts] == ["OK"]
+
+
+def test_high_confidence_defect_is_ng():
+    verdicts = board_pass(BoardInspector(NAMES), [(0.8, 1)])
+    assert [v["verdict"] for v in verdicts] == ["NG"]
+    assert verdicts[0]["defects"] == {"short": 1}
+
+
+def test_low_confidence_defect_is_ng():
+    # Below the tracker's high_thres but above the model conf: must still start a track
+    verdicts = board_pass(BoardInspector(NAMES), [(0.35, 1)])
+    assert [v["verdict"] for v in verdicts] == ["NG"]
+    assert verdicts[0]["defects"] == {"short": 1}
+
+
+def test_new_track_thres_filters_track_starts():
+    inspector = BoardInspector(NAMES, tracker=Tracker(new_track_thres=0.5))
+    verdicts = board_pass(inspector, [(0.35, 1)])
+    assert [v["verdict"] for v in verdicts] == ["OK"]
+
+
+def test_low_detection_extends_existing_track():
+    tracker = Tracker()
+    tracker.step(np.array([[10, 10, 50, 50, 0.9, 1]], dtype=np.float32))
+    tracks, _ = tracker.step(np.array([[12, 10, 52, 50, 0.2, 1]], dtype=np.float32))
+    assert len(tracker.tracks) == 1
+    assert tracks[0, 6] == 1 and tracker.tracks[0].hits == 2
+
+
+def test_no_board_class_counts_one_pass():
+    inspector = BoardInspector({0: "short"})
+    verdicts = []
+    inspector.on_verdict = verdicts.append
+    for i in range(5):
+        inspector.step(np.array([[10 + i, 10, 30 + i, 30, 0.3, 0]], dtype=np.float32))
+    inspector.flush()
+    assert [v["verdict"] for v in verdicts] == ["NG"]
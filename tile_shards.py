@@ -0,0 +1,350 @@
+"""
+Packed tile shards: many crops in a few append-only files instead of one JPEG each.
+
+Thousands of small files are slow on network-mounted and synced dataset
+folders, and a data loader has to open every one of them. A shard directory
+holds shard-NNNNN.bin data files and a matching .idx file per shard. Tiles
+are appended to the current .bin (64-byte aligned), and each one gets a
+fixed-size index record (offset, length, shape, codec, name). A new shard is
+started once shard_bytes is reached.
+
+Tiles are stored encoded (codec "jpg"/"png", small) or as raw uint8 pixels
+(codec "raw", larger but no decoding). ShardReader memory-maps the shards. A raw
+tile comes back as a read-only numpy view of the mapping (zero-copy). An
+encoded tile is decoded straight from a memoryview of the mapping. Readers
+are safe to use while a writer appends; refresh() picks up new tiles.
+ShardReader has __len__ and __getitem__, so it can be used directly as a
+training Dataset.
+
+Usage:
+    python tile_shards.py info --shards cropped.shards
+    python tile_shards.py export --shards cropped.shards --out cropped_files/
+    python tile_shards.py bench --count 2000 --size 320x320
+"""
+
+import argparse
+import glob
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+CODECS = {"raw": 0, "jpg": 1, "png": 2}
+CODEC_NAMES = {v: k for k, v in CODECS.items()}
+ALIGN = 64
+DEFAULT_SHARD_BYTES = 256 * 1024 * 1024
+# One 64-byte record per tile
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"), ("length", "<u4"), ("height", "<u2"), ("width", "<u2"),
+    ("channels", "u1"), ("codec", "u1"), ("name", "S46"),
+])
+
+logger = logging.getLogger(__name__)
+
+
+def _shard_paths(directory, number):
+    base = os.path.join(directory, f"shard-{number:05d}")
+    return base + ".bin", base + ".idx"
+
+
+def encode_tile(image, codec="jpg", quality=95):
+    """(payload bytes, shape) of one tile in the given codec"""
+    image = np.ascontiguousarray(image)
+    if image.ndim == 2:
+        image = image[:, :, None]
+    if codec == "raw":
+        return image.tobytes(), image.shape
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if codec == "jpg" else [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    ok, encoded = cv2.imencode("." + codec, image, params)
+    if not ok:
+        raise ValueError(f"Encoding a {image.shape} tile as {codec} failed")
+    return encoded.tobytes(), image.shape
+
+
+class ShardWriter:
+    """Append tiles to size-capped shard files; thread-safe
+
+    submit() has the same signature as SnapshotWriter.submit, so either can
+    receive crops. Encoding happens in the calling thread.
+    """
+
+    def __init__(self, directory, codec="jpg", quality=95, shard_bytes=DEFAULT_SHARD_BYTES, fsync=False):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}', expected one of {sorted(CODECS)}")
+        self.directory = directory
+        self.codec = codec
+        self.quality = quality
+        self.shard_bytes = shard_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.bytes_written = 0
+        os.makedirs(directory, exist_ok=True)
+        existing = sorted(glob.glob(os.path.join(directory, "shard-*.bin")))
+        # Continue the last shard; a crash can leave data without an index record, which is cut off here
+        self.number = int(os.path.basename(existing[-1])[6:11]) if existing else 0
+        self._open(self.number)
+
+    def _open(self, number):
+        bin_path, idx_path = _shard_paths(self.directory, number)
+        valid = 0
+        if os.path.exists(idx_path):
+            index_size = os.path.getsize(idx_path) // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize
+            with open(idx_path, "r+b") as f:
+                f.truncate(index_size)  # drop a torn last record
+            if index_size:
+                last = np.fromfile(idx_path, dtype=INDEX_DTYPE, count=index_size // INDEX_DTYPE.itemsize)[-1]
+                valid = int(last["offset"]) + int(last["length"])
+                valid += -valid % ALIGN
+        self._bin = open(bin_path, "ab")
+        self._bin.truncate(valid)
+        self._idx = open(idx_path, "ab")
+        self._offset = valid
+
+    def _roll(self):
+        self._flush_files()
+        self._bin.close()
+        self._idx.close()
+        self.number += 1
+        self._open(self.number)
+
+    def add(self, name, image=None, payload=None, shape=None, codec=None):
+        """Append one tile (an image, or an already encoded payload with its shape); returns (shard, offset)"""
+        codec = codec or self.codec
+        if payload is None:
+            payload, shape = encode_tile(image, codec, self.quality)
+        name_bytes = os.path.basename(name).encode()
+        if len(name_bytes) > INDEX_DTYPE["name"].itemsize:
+            raise ValueError(f"Tile name '{name}' is longer than {INDEX_DTYPE['name'].itemsize} bytes")
+        height, width, channels = (tuple(shape) + (1,))[:3]
+        with self.lock:
+            if self._offset and self._offset + len(payload) > self.shard_bytes:
+                self._roll()
+            record = np.zeros(1, dtype=INDEX_DTYPE)
+            record[0] = (self._offset, len(payload), height, width, channels, CODECS[codec], name_bytes)
+            padding = -(self._offset + len(payload)) % ALIGN
+            # Data first: an index record never points past the data
+            self._bin.write(payload)
+            self._bin.write(b"\0" * padding)
+            self._bin.flush()
+            self._idx.write(record.tobytes())
+            location = (self.number, self._offset)
+            self._offset += len(payload) + padding
+            self.written += 1
+            self.bytes_written += len(payload)
+        return location
+
+    def submit(self, path, image, batch=None, fmt=None, quality=None, block=True, copy=False):
+        """SnapshotWriter-compatible: store image under the file name of path.
+        Returns <shard directory>/<name>, or None if it failed."""
+        name = os.path.splitext(os.path.basename(path))[0] + "." + (self.codec if self.codec != "raw" else "raw")
+        if batch is not None:
+            with batch.lock:
+                batch.submitted += 1
+        ok = True
+        try:
+            self.add(name, image)
+        except Exception as e:
+            ok = False
+            with self.lock:
+                self.failed += 1
+            logger.warning(f"Adding {name} to {self.directory} failed: {e}")
+        location = os.path.join(self.directory, name)
+        if batch is not None:
+            batch._record(location, ok)
+        return location if ok else None
+
+    def pending(self):
+        return 0
+
+    def _flush_files(self):
+        self._bin.flush()
+        self._idx.flush()
+        if self.fsync:
+            os.fsync(self._bin.fileno())
+            os.fsync(self._idx.fileno())
+
+    def flush(self):
+        with self.lock:
+            self._flush_files()
+
+    def close(self, wait=True):
+        with self.lock:
+            if self._bin.closed:
+                return
+            self._flush_files()
+            self._bin.close()
+            self._idx.close()
+
+
+class ShardReader:
+    """Random access to the tiles of a shard directory through memory maps"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._maps = {}     # shard number -> (mmap, size)
+        self._names = None
+        self.refresh()
+
+    def refresh(self):
+        """Re-read the indexes (after a writer appended)"""
+        parts, shards = [], []
+        for idx_path in sorted(glob.glob(os.path.join(self.directory, "shard-*.idx"))):
+            number = int(os.path.basename(idx_path)[6:11])
+            count = os.path.getsize(idx_path) // INDEX_DTYPE.itemsize
+            if count:
+                parts.append(np.fromfile(idx_path, dtype=INDEX_DTYPE, count=count))
+                shards.append(np.full(count, number, dtype=np.int32))
+        self.index = np.concatenate(parts) if parts else np.zeros(0, dtype=INDEX_DTYPE)
+        self.shard = np.concatenate(shards) if shards else np.zeros(0, dtype=np.int32)
+        self._names = None
+        return len(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _map(self, number, end):
+        entry = self._maps.get(number)
+        if entry is None or entry[1] < end:
+            # The shard grew; views of the old map keep it alive until they are released
+            with open(_shard_paths(self.directory, number)[0], "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                entry = self._maps[number] = (mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ), size)
+        return entry[0]
+
+    def raw(self, i):
+        """Zero-copy memoryview of the stored payload of tile i"""
+        record = self.index[i]
+        offset, length = int(record["offset"]), int(record["length"])
+        mm = self._map(int(self.shard[i]), offset + length)
+        return memoryview(mm)[offset:offset + length]
+
+    def __getitem__(self, i):
+        """Tile i as an HxWxC uint8 array: a read-only view of the map for raw tiles, decoded otherwise"""
+        record = self.index[i]
+        payload = self.raw(i)
+        shape = (int(record["height"]), int(record["width"]), int(record["channels"]))
+        if record["codec"] == CODECS["raw"]:
+            return np.frombuffer(payload, dtype=np.uint8).reshape(shape)
+        image = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        return image if image.ndim == 3 else image[:, :, None]
+
+    def name(self, i):
+        return self.index[i]["name"].decode()
+
+    def names(self):
+        """{tile name: index}; the newest tile wins for repeated names"""
+        if self._names is None:
+            self._names = {name.decode(): i for i, name in enumerate(self.index["name"])}
+        return self._names
+
+    def get(self, name):
+        return self[self.names()[name]]
+
+    def __contains__(self, name):
+        return name in self.names()
+
+    def close(self):
+        for mm, _ in self._maps.values():
+            try:
+                mm.close()
+            except BufferError:
+                pass  # a caller still holds a view; the map goes away with it
+        self._maps = {}
+
+
+def export(shards_dir, out_dir):
+    """Write every tile of a shard directory back out as a loose file"""
+    reader = ShardReader(shards_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    for i in range(len(reader)):
+        name = reader.name(i)
+        if reader.index[i]["codec"] == CODECS["raw"]:
+            cv2.imwrite(os.path.join(out_dir, os.path.splitext(name)[0] + ".png"), reader[i])
+        else:
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(reader.raw(i))
+    reader.close()
+    return len(reader)
+
+
+def benchmark(count=2000, size=(320, 320), directory=None, quality=95):
+    """Write and random-read `count` tiles as loose JPEGs, JPEG shards and raw shards"""
+    rng = np.random.default_rng(0)
+    w, h = size
+    base = cv2.GaussianBlur((rng.random((h * 2, w * 2, 3)) * 255).astype(np.uint8), (9, 9), 0)
+    tiles = [np.roll(base, (i * 7, i * 13), (0, 1))[:h, :w].copy() for i in range(64)]
+    order = rng.permutation(count)
+    root = directory or tempfile.mkdtemp(prefix="tile_bench_")
+    out = np.empty((h, w, 3), dtype=np.uint8)  # a loader batch slot the tiles are copied into
+    report = {"count": count, "size": f"{w}x{h}", "dir": root}
+    try:
+        loose = os.path.join(root, "loose")
+        os.makedirs(loose)
+        start = time.perf_counter()
+        for i in range(count):
+            cv2.imwrite(os.path.join(loose, f"tile_{i}.jpg"), tiles[i % 64], [cv2.IMWRITE_JPEG_QUALITY, quality])
+        write_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in order:
+            out[...] = cv2.imread(os.path.join(loose, f"tile_{i}.jpg"))
+        read_s = time.perf_counter() - start
+        report["loose_jpg"] = {"write_tiles_per_s": count / write_s, "read_tiles_per_s": count / read_s,
+                               "files": count}
+
+        for codec in ("jpg", "raw"):
+            path = os.path.join(root, f"shards_{codec}")
+            start = time.perf_counter()
+            writer = ShardWriter(path, codec, quality)
+            for i in range(count):
+                writer.add(f"tile_{i}.{codec}", tiles[i % 64])
+            writer.close()
+            write_s = time.perf_counter() - start
+            start = time.perf_counter()
+            reader = ShardReader(path)
+            for i in order:
+                out[...] = reader[i]
+            read_s = time.perf_counter() - start
+            reader.close()
+            report[f"shard_{codec}"] = {"write_tiles_per_s": count / write_s, "read_tiles_per_s": count / read_s,
+                                        "files": len(os.listdir(path)), "mb": writer.bytes_written / 2 ** 20}
+    finally:
+        if directory is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, export or benchmark packed tile shards")
+    parser.add_argument("command", choices=["info", "export", "bench"])
+    parser.add_argument("--shards", default="cropped.shards")
+    parser.add_argument("--out", default=None, help="export: folder for the loose files")
+    parser.add_argument("--count", type=int, default=2000, help="bench: tiles to write and read")
+    parser.add_argument("--size", default="320x320", help="bench: tile size WxH")
+    parser.add_argument("--dir", default=None, help="bench: run in this folder (e.g. a network share) and keep it")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "bench":
+        size = tuple(int(v) for v in args.size.lower().split("x"))
+        print(json.dumps(benchmark(args.count, size, args.dir), indent=2))
+    elif args.command == "export":
+        print(f"Exported {export(args.shards, args.out or args.shards + '_files')} tiles")
+    else:
+        reader = ShardReader(args.shards)
+        codecs = {CODEC_NAMES[c]: int(n) for c, n in zip(*np.unique(reader.index["codec"], return_counts=True))}
+        print(json.dumps({"tiles": len(reader), "shards": len(np.unique(reader.shard)), "codecs": codecs,
+                          "bytes": int(reader.index["length"].sum())}, indent=2))
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Tiled (slice-and-merge) inference for high-resolution PCB frames.
+
+A frame is sliced into overlapping tiles, all tiles are sent to the backend
+in one batched forward pass, boxes are shifted back to frame coordinates and
+duplicates along tile seams are merged with NMS or weighted boxes fusion.
+
+TiledPredictor has the same names/predict interface as the backends in
+backends.py, so it can be dropped into the GUI pipeline or the headless engine.
+
+Usage:
+    python tiling.py --source data/ --tile 640 --overlap 0.2 --merge wbf
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from backends import BACKENDS, box_iou, load_backend, nms
+
+logger = logging.getLogger(__name__)
+
+
+def tile_grid(h, w, tile_w, tile_h, overlap=0.2):
+    """Return (x1, y1, x2, y2) tiles covering the frame; the last row/column is snapped to the edge"""
+    def starts(length, tile):
+        if length <= tile:
+            return [0]
+        stride = max(1, int(tile * (1 - overlap)))
+        positions = list(range(0, length - tile, stride))
+        positions.append(length - tile)
+        return positions
+
+    return [
+        (x, y, min(x + tile_w, w), min(y + tile_h, h))
+        for y in starts(h, tile_h)
+        for x in starts(w, tile_w)
+    ]
+
+
+def weighted_boxes_fusion(detections, iou_thres=0.55):
+    """Fuse overlapping same-class boxes into confidence-weighted averages"""
+    if len(detections) == 0:
+        return detections
+    fused = []
+    for cls in np.unique(detections[:, 5]):
+        dets = detections[detections[:, 5] == cls]
+        dets = dets[dets[:, 4].argsort()[::-1]]
+        clusters = []   # list of member index lists
+        boxes = []      # current fused box per cluster
+        for i, det in enumerate(dets):
+            if boxes:
+                ious = box_iou(det[:4], np.array(boxes))
+                best = ious.argmax()
+                if ious[best] > iou_thres:
+                    clusters[best].append(i)
+                    members = dets[clusters[best]]
+                    weights = members[:, 4:5]
+                    boxes[best] = (members[:, :4] * weights).sum(0) / weights.sum()
+                    continue
+            clusters.append([i])
+            boxes.append(det[:4].copy())
+        for members, box in zip(clusters, boxes):
+            fused.append([*box, dets[members, 4].mean(), cls])
+    return np.array(fused, dtype=np.float32)
+
+
+MERGERS = {"nms": nms, "wbf": weighted_boxes_fusion}
+
+
+class TiledPredictor:
+    """Slice frames into overlapping tiles, infer all tiles in one batch and merge the boxes"""
+
+    def __init__(self, backend, tile_size=640, overlap=0.2, merge="nms", iou=0.5, full_frame=False):
+        if merge not in MERGERS:
+            raise ValueError(f"Unknown merge method '{merge}', expected one of {sorted(MERGERS)}")
+        self.backend = backend
+        self.names = backend.names
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.merge = merge
+        self.iou = iou
+        self.full_frame = full_frame  # also run the downscaled full frame to keep large objects whole
+
+    def predict(self, images):
+        tiles, owners = [], []
+        for index, img in enumerate(images):
+            h, w = img.shape[:2]
+            for x1, y1, x2, y2 in tile_grid(h, w, self.tile_size, self.tile_size, self.overlap):
+                tiles.append(img[y1:y2, x1:x2])
+                owners.append((index, x1, y1))
+            if self.full_frame:
+                tiles.append(img)
+                owners.append((index, 0, 0))
+
+        per_image = [[] for _ in images]
+        for (index, x, y), dets in zip(owners, self.backend.predict(tiles)):
+            if len(dets):
+                dets = dets.copy()
+                dets[:, [0, 2]] += x
+                dets[:, [1, 3]] += y
+                per_image[index].append(dets)
+
+        merge = MERGERS[self.merge]
+        return [
+            merge(np.concatenate(parts), self.iou) if parts else np.zeros((0, 6), dtype=np.float32)
+            for parts in per_image
+        ]
+
+
+def benchmark(backend, images, tile_size, overlap, merge, repeat=3):
+    """Frames per second and detection counts for single-pass vs tiled inference"""
+    tiled = TiledPredictor(backend, tile_size, overlap, merge)
+    report = {}
+    for label, predictor in (("single", backend), ("tiled", tiled)):
+        predictor.predict(images[:1])  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            detections = predictor.predict(images)
+        elapsed = time.perf_counter() - start
+        report[label] = {
+            "fps": repeat * len(images) / elapsed,
+            "ms_per_frame": elapsed * 1000 / (repeat * len(images)),
+            "detections": int(sum(len(d) for d in detections)),
+        }
+    h, w = images[0].shape[:2]
+    report["tiles_per_frame"] = len(tile_grid(h, w, tile_size, tile_size, overlap))
+    return report
+
+
+def main(argv=None):
+    from inference_engine import iter_frames
+
+    parser = argparse.ArgumentParser(description="Benchmark tiled vs single-pass inference")
+    parser.add_argument("--source", required=True, help="video file, image directory or camera index")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="torch")
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--tile", type=int, default=640)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--merge", choices=sorted(MERGERS), default="nms")
+    parser.add_argument("--frames", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    backend = load_backend(args.backend, args.weights, imgsz=args.tile)
+    images = [frame for _, _, _, frame in iter_frames(args.source, args.frames)]
+    report = benchmark(backend, images, args.tile, args.overlap, args.merge, args.repeat)
+    print(f"{'mode':<8} {'FPS':>8} {'ms/frame':>10} {'detections':>11}")
+    for mode in ("single", "tiled"):
+        r = report[mode]
+        print(f"{mode:<8} {r['fps']:>8.2f} {r['ms_per_frame']:>10.1f} {r['detections']:>11}")
+    print(f"tiles per frame: {report['tiles_per_frame']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Lightweight ByteTrack-style multi-object tracker and per-board verdicts.
+
+Tracker gives every board/defect a stable ID using a constant-velocity Kalman
+filter and two-stage IoU association (high-confidence detections first, then
+low-confidence ones for the tracks still unmatched). Any detection left
+unmatched starts a new track, so a defect the model only ever reports below
+high_thres is still tracked. Between inference frames,
+step(None) only propagates the boxes, which lets the detector run every N frames.
+
+BoardInspector groups defect tracks under the board they sit on and emits one
+consolidated verdict when a board leaves the view.
+"""
+
+import itertools
+import logging
+
+import numpy as np
+
+from backends import box_iou
+
+logger = logging.getLogger(__name__)
+
+BOARD_CLASS_NAMES = ("pcb", "board")
+
+
+def _xyxy_to_cxcywh(box):
+    x1, y1, x2, y2 = box
+    return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+
+
+def _grow(boxes, fraction):
+    wh = (boxes[:, 2:4] - boxes[:, 0:2]) * fraction
+    return np.hstack([boxes[:, 0:2] - wh, boxes[:, 2:4] + wh])
+
+
+class KalmanBoxFilter:
+    """Constant-velocity Kalman filter over (cx, cy, w, h)"""
+
+    _F = np.eye(8) + np.eye(8, k=4)
+    _H = np.eye(4, 8)
+
+    def __init__(self, box):
+        self.x = np.zeros(8)
+        self.x[:4] = _xyxy_to_cxcywh(box)
+        h = max(self.x[3], 1.0)
+        self.P = np.diag(np.square([h / 10, h / 10, h / 10, h / 10, h / 16, h / 16, h / 16, h / 16]))
+
+    def predict(self):
+        h = max(self.x[3], 1.0)
+        q = np.square([h / 20, h / 20, h / 20, h / 20, h / 160, h / 160, h / 160, h / 160])
+        self.x = self._F @ self.x
+        self.P = self._F @ self.P @ self._F.T + np.diag(q)
+
+    def update(self, box):
+        h = max(self.x[3], 1.0)
+        R = np.diag(np.square([h / 20] * 4))
+        y = _xyxy_to_cxcywh(box) - self._H @ self.x
+        S = self._H @ self.P @ self._H.T + R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self._H) @ self.P
+
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+
+class Track:
+    def __init__(self, track_id, det, frame_index):
+        self.id = track_id
+        self.kf = KalmanBoxFilter(det[:4])
+        self.conf = float(det[4])
+        self.class_scores = {int(det[5]): float(det[4])}
+        self.hits = 1
+        self.misses = 0
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+
+    @property
+    def cls(self):
+        # Class voted by accumulated confidence, so one flickering frame does not relabel a track
+        return max(self.class_scores, key=self.class_scores.get)
+
+    def update(self, det, frame_index):
+        self.kf.update(det[:4])
+        self.conf = float(det[4])
+        cls = int(det[5])
+        self.class_scores[cls] = self.class_scores.get(cls, 0.0) + float(det[4])
+        self.hits += 1
+        self.misses = 0
+        self.last_frame = frame_index
+
+
+class Tracker:
+    """Two-stage IoU association with Kalman propagation"""
+
+    def __init__(self, high_thres=0.5, low_thres=0.1, match_iou=0.3, buffer=0.3, max_age=30, min_hits=1,
+                 new_track_thres=None):
+        self.high_thres = high_thres
+        self.low_thres = low_thres
+        # Unmatched detections at or above this start a track; None means every detection passed in,
+        # which has already cleared the model's own conf threshold
+        self.new_track_thres = new_track_thres
+        self.match_iou = match_iou
+        self.buffer = buffer          # boxes are grown by this fraction per side before IoU (C-BIoU)
+        self.max_age = max_age        # inference steps a track survives without a match
+        self.min_hits = min_hits
+        self.tracks = []
+        self.frame_index = 0
+        self._ids = itertools.count(1)
+
+    def step(self, detections=None):
+        """Advance one frame. detections=None means no inference ran on this frame.
+
+        Returns (tracks, finished): an (N, 7) array of x1, y1, x2, y2, conf, cls, id
+        for confirmed tracks, and the list of Track objects that were dropped.
+        """
+        self.frame_index += 1
+        for track in self.tracks:
+            track.kf.predict()
+
+        finished = []
+        if detections is not None:
+            high = detections[detections[:, 4] >= self.high_thres]
+            low = detections[(detections[:, 4] >= self.low_thres) & (detections[:, 4] < self.high_thres)]
+
+            unmatched_tracks, unmatched_high = self._associate(list(range(len(self.tracks))), high)
+            unmatched_tracks, unmatched_low = self._associate(unmatched_tracks, low)
+
+            for i in unmatched_tracks:
+                self.tracks[i].misses += 1
+            new = np.concatenate([high[unmatched_high], low[unmatched_low]])
+            if self.new_track_thres is not None:
+                new = new[new[:, 4] >= self.new_track_thres]
+            for det in new:
+                self.tracks.append(Track(next(self._ids), det, self.frame_index))
+
+            finished = [t for t in self.tracks if t.misses > self.max_age]
+            self.tracks = [t for t in self.tracks if t.misses <= self.max_age]
+
+        return self.output(), finished
+
+    def output(self):
+        rows = [
+            [*t.kf.box(), t.conf, t.cls, t.id]
+            for t in self.tracks if t.hits >= self.min_hits and t.misses == 0
+        ]
+        return np.array(rows, dtype=np.float32).reshape(-1, 7)
+
+    def flush(self):
+        """End all tracks (e.g. when detection stops)"""
+        finished, self.tracks = self.tracks, []
+        return finished
+
+    def _associate(self, track_indices, detections):
+        """Greedy same-class IoU matching; returns (unmatched track indices, unmatched detection mask)"""
+        unmatched_dets = np.ones(len(detections), dtype=bool)
+        if not track_indices or len(detections) == 0:
+            return track_indices, unmatched_dets
+
+        # Buffered boxes keep small, fast defects matched before the filter has learned their velocity
+        boxes = _grow(np.array([self.tracks[i].kf.box() for i in track_indices]), self.buffer)
+        classes = np.array([self.tracks[i].cls for i in track_indices])
+        iou = np.stack([box_iou(det, boxes) for det in _grow(detections[:, :4], self.buffer)])  # (dets, tracks)
+        iou[detections[:, 5:6].astype(int) != classes[None, :]] = 0.0
+
+        matched_tracks = set()
+        for flat in np.argsort(iou, axis=None)[::-1]:
+            d, t = np.unravel_index(flat, iou.shape)
+            if iou[d, t] < self.match_iou:
+                break
+            if not unmatched_dets[d] or t in matched_tracks:
+                continue
+            self.tracks[track_indices[t]].update(detections[d], self.frame_index)
+            unmatched_dets[d] = False
+            matched_tracks.add(t)
+
+        remaining = [idx for t, idx in enumerate(track_indices) if t not in matched_tracks]
+        return remaining, unmatched_dets
+
+
+class BoardInspector:
+    """Track boards and defects and emit one verdict per board ID
+
+    If the model has no board class, every pass of objects through the view
+    (from the first track appearing until all tracks are gone) counts as one board.
+    """
+
+    def __init__(self, names, tracker=None, board_classes=BOARD_CLASS_NAMES, on_verdict=None):
+        self.names = names
+        self.tracker = tracker or Tracker()
+        self.board_cls = {cls for cls, name in names.items() if name.lower() in board_classes}
+        self.on_verdict = on_verdict
+        self.boards = {}           # board track id -> set of defect track ids
+        self.defect_info = {}      # defect track id -> (class id, conf, box) when last seen
+        self._pass = None          # fallback: current pass id when there is no board class
+        self._pass_first = 0
+        self._pass_ids = itertools.count(1)
+        self.verdicts = 0
+
+    def step(self, detections=None):
+        tracks, finished = self.tracker.step(detections)
+        self._assign_defects()
+        for track in finished:
+            if track.cls in self.board_cls and track.id in self.boards:
+                self._emit(track.id, track.first_frame, track.last_frame)
+        if not self.board_cls and self._pass is not None and not self.tracker.tracks:
+            self._emit(self._pass, self._pass_first, self.tracker.frame_index)
+            self._pass = None
+        return tracks
+
+    def flush(self):
+        for track in self.tracker.flush():
+            if track.cls in self.board_cls and track.id in self.boards:
+                self._emit(track.id, track.first_frame, track.last_frame)
+        if self._pass is not None:
+            self._emit(self._pass, self._pass_first, self.tracker.frame_index)
+            self._pass = None
+
+    def _assign_defects(self):
+        active = [t for t in self.tracker.tracks if t.misses == 0]
+        if self.board_cls:
+            boards = [t for t in active if t.cls in self.board_cls]
+            for board in boards:
+                self.boards.setdefault(board.id, set())
+            for defect in active:
+                if defect.cls in self.board_cls:
+                    continue
+                cx, cy = defect.kf.x[:2]
+                for board in boards:
+                    x1, y1, x2, y2 = board.kf.box()
+                    if x1 <= cx <= x2 and y1 <= cy <= y2:
+                        self.boards[board.id].add(defect.id)
+                        self.defect_info[defect.id] = (defect.cls, defect.conf, defect.kf.box())
+                        break
+        elif active:
+            if self._pass is None:
+                self._pass = next(self._pass_ids)
+                self._pass_first = self.tracker.frame_index
+                self.boards[self._pass] = set()
+            for defect in active:
+                self.boards[self._pass].add(defect.id)
+                self.defect_info[defect.id] = (defect.cls, defect.conf, defect.kf.box())
+
+    def _emit(self, board_id, first_frame, last_frame):
+        defects = {}
+        items = []
+        for defect_id in sorted(self.boards.pop(board_id, set())):
+            cls, conf, box = self.defect_info.pop(defect_id, (-1, 0.0, np.zeros(4)))
+            name = self.names.get(cls, "unknown")
+            defects[name] = defects.get(name, 0) + 1
+            items.append({"track_id": defect_id, "cls": int(cls), "conf": float(conf),
+                          "box": [round(float(v), 1) for v in box]})
+        verdict = {
+            "board_id": board_id,
+            "first_frame": first_frame,
+            "last_frame": last_frame,
+            "defects": defects,
+            "items": items,
+            "verdict": "NG" if defects else "OK",
+        }
+        self.verdicts += 1
+        logger.info(f"Board {board_id}: {verdict['verdict']} {defects}")
+        if self.on_verdict:
+            self.on_verdict(verdict)
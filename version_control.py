@@ -1,26 +1,26 @@
 import sys
 import os
-from pathlib import Path
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, \
     QFormLayout, QLineEdit, QPushButton, QLabel, QMessageBox, QTabWidget
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QPixmap, QImage, QFont
 import cv2
+import numpy as np
 from ultralytics import YOLO
 import logging
+from model_loader import ModelLoader
+from s7_client import ISO_TCP_PORT, S7Client
 
-# pythonnet
-from pythonnet import load
-load()
-import clr
-dll_path = Path(r"D:\Work\Course\C#\ALL PLC\Project")
-sys.path.append(str(dll_path))
-clr.AddReference("HslCommunication")
-from HslCommunication.Profinet.Siemens import SiemensS7Net, SiemensPLCS
-from System import Array, UInt16, Boolean
+# YOLO model, loaded and warmed up in the background once the window exists
+IMGSZ = 640
 
-# Load YOLO model
-model = YOLO("weights/best.pt")
+
+def load_model():
+    return YOLO("weights/best.pt")
+
+
+def warmup_model(model):
+    model(np.zeros((IMGSZ, IMGSZ, 3), dtype=np.uint8), imgsz=IMGSZ, verbose=False)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -136,11 +136,20 @@ class PLCWindow(QMainWindow):
         # PLC
         self.plc = None
 
+        # ---- Model ----
+        self.model_loader = ModelLoader(load_model, warmup=warmup_model, name="YOLO model").start()
+
     # ------------------ PLC Functions ------------------
     def connect_plc(self):
         try:
             ip = self.txt_ip.text().strip()
-            self.plc = SiemensS7Net(SiemensPLCS.S1200, ip)
+            port = int(self.txt_port.text().strip() or ISO_TCP_PORT)
+            if self.plc is not None:
+                self.plc.ConnectClose()
+            self.plc = S7Client(ip, port)
+            result = self.plc.ConnectServer()
+            if not result.IsSuccess:
+                raise ConnectionError(f"Cannot connect to {ip}:{port}: {result.Message}")
             self.btn_connect.setStyleSheet("background-color: lightgreen; color: black;")
             QMessageBox.information(self, "PLC", f"Connected to {ip}")
         except Exception as e:
@@ -150,8 +159,7 @@ class PLCWindow(QMainWindow):
         address = self.txt_Add_Wint.text().strip()
         value = self.txt_Value_Wint.text().strip()
         vl1 = self.str_to_uint16(value)
-        vl2 = Array[UInt16]([vl1])
-        self.plc.Write(str(address), vl2)
+        self.plc.Write(str(address), vl1)
 
     def Read_Int(self):
         address = self.txt_Add_Rint.text().strip()
@@ -159,11 +167,14 @@ class PLCWindow(QMainWindow):
         self.txt_Value_Rint.setText(str(value))
 
     @staticmethod
-    def str_to_uint16(input_str: str) -> UInt16:
+    def str_to_uint16(input_str: str) -> int:
         try:
-            return UInt16.Parse(input_str)
-        except Exception as e:
+            value = int(input_str.strip())
+        except ValueError as e:
             raise ValueError(f"Cannot convert '{input_str}' to UInt16: {e}")
+        if not 0 <= value <= 0xFFFF:
+            raise ValueError(f"Cannot convert '{input_str}' to UInt16: out of range")
+        return value
 
     # ------------------ YOLO Functions ------------------
     def save_plc_configuration(self):
@@ -189,7 +200,14 @@ class PLCWindow(QMainWindow):
         if self.cap:
             ret, frame = self.cap.read()
             if ret:
-                results = model(frame, verbose=False)
+                model = self.model_loader.get(timeout=0)
+                if model is None:
+                    # Still loading: show the raw feed until the model is ready
+                    rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    h, w, ch = rgb_image.shape
+                    self.video_label.setPixmap(QPixmap.fromImage(QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888)))
+                    return
+                results = model(frame, imgsz=IMGSZ, verbose=False)
                 annotated_frame = results[0].plot()
                 rgb_image = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
                 h, w, ch = rgb_image.shape
@@ -213,6 +231,8 @@ class PLCWindow(QMainWindow):
         if self.cap:
             self.cap.release()
         self.timer.stop()
+        if self.plc is not None:
+            self.plc.ConnectClose()
         super().closeEvent(event)
 
 